@@ -0,0 +1,277 @@
+import asyncio
+import json
+import math
+import re
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from config import load_config
+
+# Контроль нагрузки перед обработкой запроса (ASGI middleware):
+#   1. token bucket на клиента: каждый класс запроса стоит своё число токенов, 429 при нехватке;
+#   2. лимит одновременных запросов на класс и общий лимит воркера;
+#   3. очередь по приоритету: освободившееся место получает первый ожидающий запрос
+#      самого приоритетного класса, у которого есть свободный лимит;
+#   4. сброс нагрузки: если запрос ждёт в очереди дольше бюджета (или голова очереди
+#      его класса уже ждёт дольше), сразу 503 с Retry-After - время ответа не растёт
+#      неограниченно при перегрузке.
+# /health, /ready, /stats и документация проходят без ограничений
+admission_config = load_config().admission
+
+# Классы запросов в порядке приоритета очереди: имя -> стоимость в токенах клиента
+CLASSES = {
+    'data': 1,
+    'render': 2,
+    # Пакет отрисовывает до восьми графиков (graph/charts.CHARTS)
+    'bundle': 16,
+    'slow': 10,
+}
+PRIORITY = tuple(CLASSES)
+
+# (метод или None, шаблон пути, класс); первый совпавший, иначе 'render'
+ROUTES = (
+    (None, re.compile(r'^/(health|ready|stats|docs|redoc|openapi\.json)?$'), None),
+    (None, re.compile(r'^/api/metrics/emotional/'), 'data'),
+    (None, re.compile(r'^/api/metrics/bundle/'), 'bundle'),
+    (None, re.compile(r'^/api/expedition/[^/]+/emotional/'), 'data'),
+    ('GET', re.compile(r'^/api/expedition/[^/]+/archive$'), 'data'),
+    ('POST', re.compile(r'^/api/expedition/[^/]+/archive$'), 'slow'),
+    (None, re.compile(r'^/api/reports/'), 'data'),
+    (None, re.compile(r'^/api/admin/'), 'data'),
+    (None, re.compile(r'^/api/giga/'), 'slow'),
+)
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    for route_method, pattern, name in ROUTES:
+        if (route_method is None or route_method == method) and pattern.match(path):
+            return name
+    return 'render'
+
+
+class Shed(Exception):
+    def __init__(self, status: int, detail: str, retry_after: float):
+        self.status = status
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """
+    Token bucket на клиента: client_rate токенов в секунду, не больше client_burst
+    """
+    MAX_CLIENTS = 10_000
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def take(self, client: str, cost: float) -> float:
+        """
+        0, если токены списаны, иначе секунды до их появления
+        """
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+        if tokens < cost:
+            self._buckets[client] = (tokens, now)
+            return (cost - tokens) / self.rate
+
+        self._buckets[client] = (tokens - cost, now)
+        if len(self._buckets) > self.MAX_CLIENTS:
+            self._prune(now)
+        return 0.0
+
+    def _prune(self, now: float) -> None:
+        # Полный бак равносилен отсутствию записи
+        full = self.burst / self.rate
+        self._buckets = {
+            client: (tokens, updated) for client, (tokens, updated) in self._buckets.items()
+            if now - updated < full
+        }
+
+
+class Gate:
+    """
+    Лимиты одновременных запросов по классам с очередью по приоритету
+    """
+
+    def __init__(self, limits: Dict[str, int], max_active: int, budget: float):
+        self.limits = limits
+        self.max_active = max_active
+        self.budget = budget
+        self.active: Counter = Counter()
+        self.queues: Dict[str, Deque[Tuple[float, asyncio.Future]]] = {name: deque() for name in limits}
+        self.stats: Dict[str, Counter] = {name: Counter() for name in limits}
+
+    def _has_room(self, name: str) -> bool:
+        return self.active[name] < self.limits[name] and sum(self.active.values()) < self.max_active
+
+    def _queue_delay(self, name: str) -> float:
+        queue = self.queues[name]
+        return time.monotonic() - queue[0][0] if queue else 0.0
+
+    async def acquire(self, name: str) -> None:
+        stats = self.stats[name]
+        if not self.queues[name] and self._has_room(name) and not self._waiting_before(name):
+            self.active[name] += 1
+            stats['admitted'] += 1
+            return
+
+        # Голова очереди класса уже ждёт дольше бюджета - новый запрос тоже не успеет
+        if self._queue_delay(name) > self.budget:
+            stats['shed'] += 1
+            raise Shed(503, "Сервис перегружен", self.budget)
+
+        entry = (time.monotonic(), asyncio.get_running_loop().create_future())
+        future = entry[1]
+        self.queues[name].append(entry)
+        try:
+            await asyncio.wait((future,), timeout=self.budget)
+        except asyncio.CancelledError:
+            # Клиент ушёл: возвращаем уже выданное место или уходим из очереди
+            if future.done():
+                self.release(name)
+            else:
+                future.cancel()
+                self.queues[name].remove(entry)
+            raise
+
+        if not future.done():
+            future.cancel()
+            self.queues[name].remove(entry)
+            stats['shed'] += 1
+            raise Shed(503, "Сервис перегружен", self.budget)
+
+        stats['admitted'] += 1
+        stats['queued'] += 1
+
+    def _waiting_before(self, name: str) -> bool:
+        # Более приоритетные классы с очередью получают освободившееся место первыми
+        for other in PRIORITY:
+            if other == name:
+                return False
+            if self.queues[other] and self.active[other] < self.limits[other]:
+                return True
+        return False
+
+    def release(self, name: str) -> None:
+        self.active[name] -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        for name in PRIORITY:
+            queue = self.queues[name]
+            while queue and self._has_room(name):
+                _, future = queue.popleft()
+                if future.done():
+                    continue
+                self.active[name] += 1
+                future.set_result(None)
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {
+                'limit': self.limits[name],
+                'active': self.active[name],
+                'waiting': len(self.queues[name]),
+                **{counter: self.stats[name][counter] for counter in ('admitted', 'queued', 'shed')},
+            }
+            for name in self.limits
+        }
+
+
+_buckets = TokenBuckets(admission_config.client_rate, admission_config.client_burst)
+_gate = Gate(
+    {
+        'data': admission_config.data_limit,
+        'render': admission_config.render_limit,
+        'bundle': admission_config.bundle_limit,
+        'slow': admission_config.slow_limit,
+    },
+    admission_config.max_active,
+    admission_config.queue_budget_ms / 1000
+)
+_rate_limited: Counter = Counter()
+
+
+def _client(scope) -> str:
+    # За обратным прокси клиента определяет заголовок ADMISSION_CLIENT_HEADER (X-Forwarded-For).
+    # Левые адреса списка присылает сам клиент, поэтому берётся адрес, дописанный
+    # ADMISSION_CLIENT_HOPS-м прокси справа (1 - ближайшим к сервису)
+    header = admission_config.client_header.lower().encode()
+    if header:
+        addresses = [
+            address.strip()
+            for key, value in scope.get('headers', ()) if key == header
+            for address in value.decode('latin-1').split(',')
+        ]
+        hops = admission_config.client_hops
+        if 0 < hops <= len(addresses) and addresses[-hops]:
+            return addresses[-hops]
+    client = scope.get('client')
+    return client[0] if client else ''
+
+
+async def _reject(send, error: Shed) -> None:
+    body = json.dumps({'detail': error.detail}).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': error.status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'retry-after', str(max(1, math.ceil(error.retry_after))).encode()),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware; подключается последним через app.add_middleware, чтобы отказ
+    происходил до остальной обработки запроса
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not admission_config.enabled:
+            return await self.app(scope, receive, send)
+
+        name = classify(scope['method'], scope['path'])
+        if name is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            retry_after = _buckets.take(_client(scope), CLASSES[name])
+            if retry_after:
+                _rate_limited[name] += 1
+                raise Shed(429, "Слишком много запросов", retry_after)
+            await _gate.acquire(name)
+        except Shed as e:
+            return await _reject(send, e)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _gate.release(name)
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    Счётчики воркера по классам: admitted - пропущено, queued - из них ждали в очереди,
+    shed - отклонено по бюджету очереди (503), rate_limited - по лимиту клиента (429)
+    """
+    return {
+        'enabled': admission_config.enabled,
+        'active': sum(_gate.active.values()),
+        'classes': {
+            name: {**stats, 'rate_limited': _rate_limited[name]}
+            for name, stats in _gate.snapshot().items()
+        },
+    }
@@ -0,0 +1,164 @@
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+# Замер масштабирования пропускной способности по числу воркеров uvicorn:
+#   python benchmark.py --workers 1,2,4,8 --path /api/metrics/heart-rate/IND-000002/1
+# Для каждого значения сервис запускается заново (WEB_CONCURRENCY=N, общий кэш
+# отключён, если не указан --cache), прогревается и нагружается --concurrency
+# клиентами с keep-alive в течение --duration секунд.
+# С --url замеряется уже запущенный сервис без перезапуска
+
+
+def _request(host: str, port: int, paths: List[str], deadline: float,
+             latencies: List[float], errors: List[int], lock: threading.Lock) -> None:
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    i = 0
+    local, failed = [], 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 429 or response.status >= 500:
+                failed += 1
+            else:
+                local.append(time.perf_counter() - start)
+        except (OSError, http.client.HTTPException):
+            failed += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=60)
+    conn.close()
+    with lock:
+        latencies.extend(local)
+        errors.append(failed)
+
+
+def _load(url: str, paths: List[str], concurrency: int, duration: float) -> Dict[str, float]:
+    parts = urlsplit(url)
+    latencies: List[float] = []
+    errors: List[int] = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(_request, parts.hostname, parts.port or 80, paths,
+                            deadline, latencies, errors, lock)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0.0
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(0.5),
+        'p95': percentile(0.95),
+    }
+
+
+def _wait_ready(url: str, timeout: float) -> None:
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=2)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Сервис не ответил на /health за {timeout} с")
+
+
+def _start_server(workers: int, port: int, use_cache: bool) -> subprocess.Popen:
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers))
+    # Вся нагрузка идёт с одного адреса - лимит клиента замер не ограничивает
+    env.setdefault('CLIENT_RATE', '1000000')
+    env.setdefault('CLIENT_BURST', '1000000')
+    if not use_cache:
+        env['CACHE_TTL'] = '0'
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning'],
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+def _stop_server(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _print_row(workers: Optional[int], result: Dict[str, float], base: Optional[tuple]) -> None:
+    # Ускорение и эффективность - относительно первой строки (обычно 1 воркер)
+    if base is None or not base[1]:
+        speedup, efficiency = 1.0, 1.0
+    else:
+        speedup = result['rps'] / base[1]
+        efficiency = speedup * base[0] / workers
+    print(f"{workers or '-':>7} {result['rps']:>9.1f} {result['p50']:>9.1f} {result['p95']:>9.1f} "
+          f"{result['errors']:>7} {speedup:>8.2f} {efficiency:>10.0%}", flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Масштабирование пропускной способности по числу воркеров")
+    parser.add_argument('--workers', default=f'1,{os.cpu_count() or 1}',
+                        help="число воркеров через запятую (по умолчанию 1 и число ядер)")
+    parser.add_argument('--path', action='append',
+                        help="путь запроса; можно повторять, пути чередуются")
+    parser.add_argument('--concurrency', type=int, default=32, help="одновременных клиентов")
+    parser.add_argument('--duration', type=float, default=20, help="длительность замера, с")
+    parser.add_argument('--warmup', type=float, default=3, help="прогрев перед замером, с")
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--cache', action='store_true', help="не отключать общий кэш")
+    parser.add_argument('--url', help="замерить уже запущенный сервис")
+    args = parser.parse_args()
+
+    paths = args.path or ['/api/metrics/heart-rate/IND-000002/1']
+
+    print(f"{'workers':>7} {'req/s':>9} {'p50, мс':>9} {'p95, мс':>9} {'errors':>7} {'speedup':>8} {'efficiency':>10}")
+
+    if args.url:
+        _wait_ready(args.url, 10)
+        _load(args.url, paths, args.concurrency, args.warmup)
+        _print_row(None, _load(args.url, paths, args.concurrency, args.duration), None)
+        return
+
+    base = None
+    for workers in (int(n) for n in args.workers.split(',')):
+        url = f'http://127.0.0.1:{args.port}'
+        process = _start_server(workers, args.port, args.cache)
+        try:
+            _wait_ready(url, 120)
+            _load(url, paths, args.concurrency, args.warmup)
+            result = _load(url, paths, args.concurrency, args.duration)
+        finally:
+            _stop_server(process)
+
+        base = base or (workers, result['rps'])
+        _print_row(workers, result, base)
+
+
+if __name__ == '__main__':
+    main()
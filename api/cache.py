@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from config import load_config
+
+# Кэш готовых ответов (PNG графиков, советы GigaChat), общий для всех воркеров uvicorn.
+# Записи - файлы <cache_dir>/<namespace>/<ключ[:2]>/<ключ>, запись атомарная
+# (временный файл + os.replace), поэтому воркеры читают и пишут без блокировок.
+# Срок жизни записи - CACHE_TTL секунд по времени изменения файла; CACHE_TTL=0 отключает кэш.
+# Записи не инвалидируются при записи метрик, поэтому срок по умолчанию короткий:
+# графики идущей экспедиции отстают не больше чем на CACHE_TTL
+cache_config = load_config().cache
+
+
+def cache_key(*parts) -> str:
+    """
+    Ключ из параметров запроса (MetricFilter - frozen dataclass, его repr стабилен)
+    """
+    raw = json.dumps(parts, default=repr, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _path(namespace: str, key: str) -> str:
+    return os.path.join(cache_config.cache_dir, namespace, key[:2], key)
+
+
+def get(namespace: str, key: str) -> Optional[bytes]:
+    path = _path(namespace, key)
+    try:
+        if time.time() - os.path.getmtime(path) > cache_config.ttl:
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def put(namespace: str, key: str, value: bytes) -> None:
+    path = _path(namespace, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(value)
+    os.replace(tmp, path)
+
+
+async def cached(namespace: str, key: str, producer: Callable[[], Awaitable[bytes]]) -> bytes:
+    """
+    Значение из кэша или результат producer(), который затем сохраняется.
+    Исключения producer (например, 404) не кэшируются
+    """
+    if cache_config.ttl <= 0:
+        return await producer()
+
+    value = await asyncio.to_thread(get, namespace, key)
+    if value is None:
+        value = await producer()
+        await asyncio.to_thread(put, namespace, key, value)
+    return value
+
+
+def prune() -> int:
+    """
+    Удаление просроченных записей, затем самых старых - пока кэш больше CACHE_MAX_MB.
+    Безопасно при одновременном вызове из нескольких воркеров
+    """
+    if not os.path.exists(cache_config.cache_dir):
+        return 0
+
+    now = time.time()
+    entries = []
+    removed = 0
+    for root, _, files in os.walk(cache_config.cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            # Временные файлы старше TTL остались от упавшего воркера
+            if now - stat.st_mtime > cache_config.ttl:
+                removed += _remove(path)
+            elif not name.endswith('.tmp'):
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    limit = cache_config.max_mb * 1024 * 1024
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        removed += _remove(path)
+        total -= size
+
+    return removed
+
+
+def _remove(path: str) -> int:
+    try:
+        os.remove(path)
+        return 1
+    except FileNotFoundError:
+        return 0
+
+
+async def run_pruner(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(prune)
+        except Exception as e:
+            print("Ошибка очистки кэша:", e)
@@ -1,3 +1,4 @@
+import os
 from dataclasses import dataclass
 from environs import Env
 
@@ -10,10 +11,83 @@ class DatabaseConfig:
     db_name: str
 
 
+@dataclass
+class ReportsConfig:
+    reports_dir: str
+    workers: int
+    advice_concurrency: int
+
+
+@dataclass
+class QualityConfig:
+    mode: str
+    motion_window_ms: int
+    motion_baseline_ms: int
+    motion_z_max: float
+    eeg_quality_min: float
+    eeg_artifacts_max: float
+    skin_contact_min: float
+    downweight: float
+    cache_ttl: int
+    cache_size: int
+
+
+@dataclass
+class CacheConfig:
+    cache_dir: str
+    ttl: int
+    max_mb: int
+
+
+@dataclass
+class AdmissionConfig:
+    enabled: bool
+    max_active: int
+    data_limit: int
+    render_limit: int
+    bundle_limit: int
+    slow_limit: int
+    queue_budget_ms: int
+    client_rate: float
+    client_burst: float
+    client_header: str
+    client_hops: int
+
+
+@dataclass
+class ProfilingConfig:
+    enabled: bool
+    slow_ms: int
+    interval_ms: int
+    profile_dir: str
+    keep: int
+    max_queries: int
+    max_captures: int
+
+
+@dataclass
+class StoreConfig:
+    enabled: bool
+    max_mb: int
+    max_age: int
+
+
 @dataclass
 class Config:
     db: DatabaseConfig
     auth_key: str
+    web_workers: int
+    render_workers: int
+    reports: ReportsConfig
+    archive_dir: str
+    quality: QualityConfig
+    cache: CacheConfig
+    startup_profile: bool
+    warmup_attempts: int
+    admission: AdmissionConfig
+    profiling: ProfilingConfig
+    admin_token: str
+    store: StoreConfig
 
 
 
@@ -29,7 +103,80 @@ def load_config(path: str = None) -> Config:
         db_name=env("POSTGRES_DB")
     )
 
+    reports_conf = ReportsConfig(
+        reports_dir=env("REPORTS_DIR", "data/reports"),
+        workers=env.int("REPORT_WORKERS", 1),
+        advice_concurrency=env.int("ADVICE_CONCURRENCY", 2)
+    )
+
+    quality_conf = QualityConfig(
+        mode=env("QUALITY_MODE", "drop"),
+        motion_window_ms=env.int("MOTION_WINDOW_MS", 5000),
+        motion_baseline_ms=env.int("MOTION_BASELINE_MS", 3600000),
+        motion_z_max=env.float("MOTION_Z_MAX", 3.5),
+        eeg_quality_min=env.float("EEG_QUALITY_MIN", 50),
+        eeg_artifacts_max=env.float("EEG_ARTIFACTS_MAX", 50),
+        skin_contact_min=env.float("SKIN_CONTACT_MIN", 50),
+        downweight=env.float("QUALITY_DOWNWEIGHT", 0.25),
+        cache_ttl=env.int("QUALITY_CACHE_TTL", 300),
+        cache_size=env.int("QUALITY_CACHE_SIZE", 100000)
+    )
+
+    cache_conf = CacheConfig(
+        cache_dir=env("CACHE_DIR", "data/cache"),
+        ttl=env.int("CACHE_TTL", 30),
+        max_mb=env.int("CACHE_MAX_MB", 256)
+    )
+
+    profiling_conf = ProfilingConfig(
+        enabled=env.bool("PROFILING", False),
+        slow_ms=env.int("PROFILE_SLOW_MS", 1000),
+        interval_ms=env.int("PROFILE_INTERVAL_MS", 5),
+        profile_dir=env("PROFILE_DIR", "data/profiles"),
+        keep=env.int("PROFILE_KEEP", 100),
+        max_queries=env.int("PROFILE_MAX_QUERIES", 10),
+        max_captures=env.int("PROFILE_MAX_CAPTURES", 6)
+    )
+
+    store_conf = StoreConfig(
+        enabled=env.bool("STORE_ENABLED", True),
+        max_mb=env.int("STORE_MAX_MB", 256),
+        max_age=env.int("STORE_MAX_AGE", 300)
+    )
+
+    # Процессы отрисовки делятся между воркерами uvicorn, чтобы их общее число
+    # не превышало число ядер
+    web_workers = max(1, env.int("WEB_CONCURRENCY", 1))
+    render_workers = env.int("RENDER_WORKERS", max(1, (os.cpu_count() or 1) // web_workers))
+
+    # Лимиты на воркер; отрисовке по умолчанию - по две задачи на процесс отрисовки
+    admission_conf = AdmissionConfig(
+        enabled=env.bool("ADMISSION_ENABLED", True),
+        max_active=env.int("ADMISSION_MAX_ACTIVE", 64),
+        data_limit=env.int("ADMISSION_LIMIT_DATA", 32),
+        render_limit=env.int("ADMISSION_LIMIT_RENDER", render_workers * 2),
+        bundle_limit=env.int("ADMISSION_LIMIT_BUNDLE", render_workers),
+        slow_limit=env.int("ADMISSION_LIMIT_SLOW", 4),
+        queue_budget_ms=env.int("ADMISSION_QUEUE_BUDGET_MS", 1000),
+        client_rate=env.float("CLIENT_RATE", 20),
+        client_burst=env.float("CLIENT_BURST", 60),
+        client_header=env("ADMISSION_CLIENT_HEADER", ""),
+        client_hops=env.int("ADMISSION_CLIENT_HOPS", 1)
+    )
+
     return Config(
         db=db_conf,
-        auth_key=env("AUTHORIZATION_KEY")
-    )
\ No newline at end of file
+        auth_key=env("AUTHORIZATION_KEY"),
+        web_workers=web_workers,
+        render_workers=render_workers,
+        reports=reports_conf,
+        archive_dir=env("ARCHIVE_DIR", "data/archive"),
+        quality=quality_conf,
+        cache=cache_conf,
+        startup_profile=env.bool("STARTUP_PROFILE", False),
+        warmup_attempts=env.int("WARMUP_ATTEMPTS", 5),
+        admission=admission_conf,
+        profiling=profiling_conf,
+        admin_token=env("ADMIN_TOKEN", ""),
+        store=store_conf
+    )
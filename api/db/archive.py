@@ -0,0 +1,336 @@
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+from sqlalchemy import func, select, text
+
+from config import load_config
+from .database import Base, init_models, sync_engine
+from . import quality
+from .filters import MetricFilter
+from .partitions import drop_expedition_partitions, partitioned_tables
+
+# Холодное хранилище завершённых экспедиций.
+# Строки таблиц метрик выгружаются в сжатый Parquet с hive-разбиением:
+#   <archive_dir>/<table>/expedition_id=<id>/individual_number=<номер>/part-0.parquet
+# и описываются манифестом <archive_dir>/_expeditions/<id>.json.
+# Пока манифест существует, data_extraction читает экспедицию из Parquet.
+# pyarrow (вместе с ним загружается pandas) импортируется при первом обращении
+# к Parquet, а не при старте сервиса
+archive_dir = load_config().archive_dir
+
+ARCHIVE_TABLES = (
+    'cardio_metrics',
+    'eeg_artifacts_metrics',
+    'eeg_proceed_metrics',
+    'eeg_raw_metrics',
+    'emotional_metrics',
+    'mems_metrics',
+    'nfb_metrics',
+    'physiological_metrics',
+    'productivity_metrics',
+)
+
+CHUNK_ROWS = 50_000
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _manifest_path(expedition_id: int) -> str:
+    return os.path.join(archive_dir, '_expeditions', f'{expedition_id}.json')
+
+
+def get_manifest(expedition_id: int) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_manifest_path(expedition_id), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def is_archived(expedition_id: Optional[int]) -> bool:
+    return bool(expedition_id) and os.path.exists(_manifest_path(expedition_id))
+
+
+def _partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    return ds.partitioning(
+        pa.schema([('expedition_id', pa.int64()), ('individual_number', pa.string())]),
+        flavor='hive'
+    )
+
+
+def _arrow_type(column):
+    import pyarrow as pa
+
+    python_type = column.type.python_type
+    if python_type is int:
+        return pa.int64()
+    if python_type is float:
+        return pa.float64()
+    return pa.string()
+
+
+def _export_table(conn, table_name: str, expedition_id: int, target: str) -> int:
+    """
+    Потоковая выгрузка строк экспедиции: по файлу Parquet на участника
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = Base.metadata.tables[table_name]
+    columns = [c for c in table.columns if c.name not in ('id', 'expedition_id')]
+    data_columns = [c for c in columns if c.name != 'individual_number']
+    schema = pa.schema([(c.name, _arrow_type(c)) for c in data_columns])
+
+    query = select(*columns).where(
+        table.c.expedition_id == expedition_id
+    ).order_by(table.c.individual_number, table.c.timestamp)
+
+    result = conn.execution_options(stream_results=True, yield_per=CHUNK_ROWS).execute(query)
+
+    written = 0
+    writer = None
+    current = None
+    try:
+        for chunk in result.partitions():
+            # Внутри пачки строки одного участника идут подряд
+            start = 0
+            while start < len(chunk):
+                individual_number = chunk[start].individual_number
+                end = start
+                while end < len(chunk) and chunk[end].individual_number == individual_number:
+                    end += 1
+
+                if individual_number != current:
+                    if writer is not None:
+                        writer.close()
+                    directory = os.path.join(
+                        target,
+                        f'expedition_id={expedition_id}',
+                        f'individual_number={quote(individual_number, safe="")}'
+                    )
+                    os.makedirs(directory, exist_ok=True)
+                    writer = pq.ParquetWriter(
+                        os.path.join(directory, 'part-0.parquet'), schema, compression='zstd'
+                    )
+                    current = individual_number
+
+                rows = chunk[start:end]
+                writer.write_table(pa.table(
+                    {c.name: [getattr(r, c.name) for r in rows] for c in data_columns},
+                    schema=schema
+                ))
+                written += end - start
+                start = end
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return written
+
+
+def _save_manifest(manifest: Dict[str, Any]) -> None:
+    path = _manifest_path(manifest['expedition_id'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(f'{path}.tmp', path)
+
+
+def _cancel_delete(expedition_id: int, message: str) -> None:
+    # Экспедиция снимается с архива, чтобы чтение шло из PostgreSQL
+    os.remove(_manifest_path(expedition_id))
+    raise ArchiveError(f"{message}; архивирование отменено")
+
+
+def _delete_archived_rows(expedition_id: int, tables: Dict[str, int]) -> None:
+    # Удаляем только если с момента выгрузки не появилось новых строк. Таблицы заблокированы
+    # от записи до конца транзакции: строка, вставленная между подсчётом и удалением,
+    # иначе была бы удалена, не попав в архив
+    with sync_engine.begin() as conn:
+        for table_name in tables:
+            conn.execute(text(f'LOCK TABLE {table_name} IN SHARE ROW EXCLUSIVE MODE'))
+        for table_name, written in tables.items():
+            table = Base.metadata.tables[table_name]
+            count = conn.execute(
+                select(func.count()).select_from(table).where(table.c.expedition_id == expedition_id)
+            ).scalar()
+            if count != written:
+                _cancel_delete(expedition_id, f"{table_name}: выгружено {written} строк, в базе {count}")
+        # У секционированных таблиц секция экспедиции отсоединяется и удаляется целиком
+        partitioned = partitioned_tables(conn)
+        for table_name, written in tables.items():
+            dropped = table_name in partitioned and drop_expedition_partitions(conn, table_name, expedition_id)
+            table = Base.metadata.tables[table_name]
+            deleted = conn.execute(table.delete().where(table.c.expedition_id == expedition_id)).rowcount
+            # Исключение откатывает транзакцию: ни одна таблица не удаляется частично
+            if not dropped and deleted != written:
+                _cancel_delete(expedition_id, f"{table_name}: выгружено {written} строк, удаляется {deleted}")
+
+
+def archive_expedition(expedition_id: int, delete: bool = False) -> Dict[str, Any]:
+    """
+    Выгрузка завершённой экспедиции в Parquet и (опционально) удаление строк из PostgreSQL
+    """
+    if is_archived(expedition_id):
+        raise ArchiveError(f"Экспедиция {expedition_id} уже в архиве")
+
+    expeditions = Base.metadata.tables['expeditions']
+    with sync_engine.connect() as conn:
+        end_date = conn.execute(
+            select(expeditions.c.end_date).where(expeditions.c.id == expedition_id)
+        ).scalar()
+    if end_date is None:
+        raise ArchiveError(f"Экспедиция {expedition_id} не найдена")
+    if end_date >= date.today():
+        raise ArchiveError(f"Экспедиция {expedition_id} ещё не завершена")
+
+    staging = os.path.join(archive_dir, '.staging', str(expedition_id))
+    shutil.rmtree(staging, ignore_errors=True)
+
+    tables = {}
+    with sync_engine.connect() as conn:
+        for table_name in ARCHIVE_TABLES:
+            tables[table_name] = _export_table(
+                conn, table_name, expedition_id, os.path.join(staging, table_name)
+            )
+
+    for table_name in ARCHIVE_TABLES:
+        source = os.path.join(staging, table_name, f'expedition_id={expedition_id}')
+        if os.path.exists(source):
+            destination = os.path.join(archive_dir, table_name, f'expedition_id={expedition_id}')
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.rmtree(destination, ignore_errors=True)
+            os.replace(source, destination)
+    shutil.rmtree(staging, ignore_errors=True)
+
+    manifest = {
+        'expedition_id': expedition_id,
+        'tables': tables,
+        'deleted': False,
+        'archived_at': time.time(),
+    }
+    _save_manifest(manifest)
+
+    if delete:
+        _delete_archived_rows(expedition_id, tables)
+        manifest['deleted'] = True
+        _save_manifest(manifest)
+
+    return manifest
+
+
+def _read_archived_table(
+        table_name: str,
+        values: List[str],
+        individual_number: Optional[str],
+        expedition_id: int,
+        filters: MetricFilter
+):
+    """
+    Таблица Arrow из архива в том же виде, что и выборка из PostgreSQL: отбор колонок
+    и фильтры передаются в Parquet, файлы отображаются в память
+    """
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    directory = os.path.join(archive_dir, table_name)
+    if not os.path.exists(directory):
+        return None
+
+    keys = ['session', 'expedition_id']
+    if individual_number is None:
+        keys.insert(0, 'individual_number')
+
+    condition = ds.field('expedition_id') == expedition_id
+    if individual_number is not None:
+        condition &= ds.field('individual_number') == individual_number
+    if filters.from_ts is not None:
+        condition &= ds.field('timestamp') >= filters.from_ts
+    if filters.to_ts is not None:
+        condition &= ds.field('timestamp') <= filters.to_ts
+    if filters.sessions:
+        condition &= ds.field('session').isin(list(filters.sessions))
+    flags = quality.arrow_condition(table_name, filters)
+    if flags is not None:
+        condition &= flags
+
+    table = pq.read_table(
+        directory,
+        columns=[*keys, 'timestamp', *values],
+        filters=condition,
+        partitioning=_partitioning(),
+        memory_map=True
+    )
+
+    if filters.resolution:
+        # Для целых чисел divide - целочисленное деление
+        bucket = pc.multiply(pc.divide(table['timestamp'], filters.resolution), filters.resolution)
+        table = table.set_column(table.schema.get_field_index('timestamp'), 'timestamp', bucket)
+        table = table.group_by([*keys, 'timestamp']).aggregate(
+            [(name, 'mean') for name in values]
+        )
+        table = table.rename_columns(
+            [name.removesuffix('_mean') for name in table.column_names]
+        ).sort_by([('timestamp', 'ascending'), ('session', 'ascending')])
+
+    return table.sort_by('timestamp').select([*keys[:-1], 'timestamp', *values, 'expedition_id'])
+
+
+def read_archived(
+        table_name: str,
+        values: List[str],
+        individual_number: Optional[str],
+        expedition_id: int,
+        filters: MetricFilter
+) -> List[Dict[str, Any]]:
+    table = _read_archived_table(table_name, values, individual_number, expedition_id, filters)
+    return table.to_pylist() if table is not None else []
+
+
+def read_archived_columns(
+        table_name: str,
+        values: List[str],
+        individual_number: Optional[str],
+        expedition_id: int,
+        filters: MetricFilter
+) -> Dict[str, list]:
+    table = _read_archived_table(table_name, values, individual_number, expedition_id, filters)
+    if table is None:
+        keys = ['session', 'timestamp', *values, 'expedition_id']
+        return {name: [] for name in (keys if individual_number else ['individual_number', *keys])}
+    return table.to_pydict()
+
+
+def read_archived_windows(
+        check: str,
+        individual_number: Optional[str],
+        expedition_id: int,
+        filters: MetricFilter
+) -> Dict[str, list]:
+    """
+    Агрегаты окон проверки из архива в том же виде, что и checks._window_select
+    """
+    table_name, columns = quality.CONTEXT_TABLES[check]
+    table = _read_archived_table(table_name, columns, individual_number, expedition_id, filters)
+    keys = ['individual_number'] if individual_number is None else []
+    if table is None:
+        return {name: [] for name in [*keys, 'window', *(quality.MOTION_STATS if check == 'motion' else ())]}
+    return quality.arrow_window_stats(check, table, keys).to_pydict()
+
+
+if __name__ == '__main__':
+    # python -m db.archive <expedition_id> [--delete]
+    init_models()
+    print(archive_expedition(int(sys.argv[1]), delete='--delete' in sys.argv[2:]))
@@ -0,0 +1,215 @@
+import asyncio
+import functools
+import math
+import os
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_, select
+
+import profiling
+from . import quality
+from .archive import is_archived, read_archived_windows
+from .database import Base, async_session_maker
+from .filters import MetricFilter
+from .quality import quality_config
+
+# Непройденные окна проверок движения и ЭЭГ с кэшем воркера:
+# (проверка, участник, экспедиция, начало периода MOTION_BASELINE_MS) -> начала окон.
+# Оценка окна зависит только от окон своего периода (db/samples.py), поэтому период
+# считается один раз и нужен всем таблицам, запросам и пакетам графиков участника.
+# Нужные периоды берутся из сэмплов запрошенной таблицы метрик, а не из from/to:
+# запрос без границ не агрегирует всю историю mems_metrics, если метрик там нет.
+# Недостающие периоды участника агрегирует один запрос от первого до последнего
+# (индекс individual_number, expedition_id, timestamp), одновременные запросы тех же
+# периодов ждут его результата. Текущие периоды пересчитываются через QUALITY_CACHE_TTL
+# секунд; период, закрытый к моменту расчёта дольше этого срока, хранится до вытеснения
+# (в кэше не больше QUALITY_CACHE_SIZE периодов).
+# NumPy импортируется при первой проверке, чтобы не загружаться при старте сервиса
+
+Key = Tuple[str, str, Optional[int], int]
+
+# Ключ -> (срок годности по time.monotonic(), начала непройденных окон)
+_cache: 'OrderedDict[Key, Tuple[float, Any]]' = OrderedDict()
+_pending: Dict[Key, asyncio.Task] = {}
+_stats: Counter = Counter()
+
+
+def period_start(timestamp):
+    return timestamp - timestamp % quality_config.motion_baseline_ms
+
+
+def periods(participants: Iterable[str], timestamps: Iterable[int]) -> Dict[str, List[int]]:
+    """
+    Периоды базовой линии, в которые попали сэмплы: участник -> начала периодов
+    """
+    result: Dict[str, set] = {}
+    for individual_number, timestamp in zip(participants, timestamps):
+        result.setdefault(individual_number, set()).add(period_start(int(timestamp)))
+    return {individual_number: sorted(starts) for individual_number, starts in result.items()}
+
+
+def _window_select(check: str, expedition_id: Optional[int], ranges: Dict[str, Tuple[int, int]]):
+    """
+    Агрегаты mems_metrics / eeg_artifacts_metrics по окнам проверки в интервалах участников
+    [from, to), одна строка на окно: для движения - все окна, для ЭЭГ - только непройденные
+    """
+    table = Base.metadata.tables[quality.CONTEXT_TABLES[check][0]]
+    keys = [table.c.individual_number, quality.window_bucket(table.c.timestamp)]
+
+    if check == 'motion':
+        query = select(keys[0], keys[1].label('window'), *quality.sql_window_stats(table))
+    else:
+        query = select(keys[0], keys[1].label('window')).having(quality.sql_eeg_failed(table))
+
+    query = query.where(or_(*(
+        and_(table.c.individual_number == individual_number,
+             table.c.timestamp >= lo, table.c.timestamp < hi)
+        for individual_number, (lo, hi) in ranges.items()
+    )))
+    if expedition_id:
+        query = query.where(table.c.expedition_id == expedition_id)
+    return query.group_by(*keys).order_by(*keys)
+
+
+def _archived_windows(check: str, expedition_id: int, ranges: Dict[str, Tuple[int, int]]) -> Dict[str, list]:
+    result: Dict[str, list] = {}
+    for individual_number, (lo, hi) in ranges.items():
+        windows = read_archived_windows(
+            check, individual_number, expedition_id, MetricFilter(from_ts=lo, to_ts=hi - 1, quality='off')
+        )
+        windows['individual_number'] = [individual_number] * len(windows['window'])
+        for name, column in windows.items():
+            result.setdefault(name, []).extend(column)
+    return result
+
+
+def _split(check: str, expedition_id: Optional[int], ranges: Dict[str, Tuple[int, int]], columns) -> Dict[Key, Any]:
+    import numpy as np
+    from .samples import failed_windows
+
+    failed = failed_windows([check], [columns], True)[0]
+    period = quality_config.motion_baseline_ms
+    result = {}
+    for individual_number, (lo, hi) in ranges.items():
+        # Начала непройденных окон отсортированы (np.unique)
+        starts = failed.get(individual_number, np.empty(0, dtype=np.int64))
+        bounds = np.searchsorted(starts, np.arange(lo, hi + 1, period))
+        for start, a, b in zip(range(lo, hi, period), bounds[:-1], bounds[1:]):
+            result[(check, individual_number, expedition_id, start)] = starts[a:b]
+    return result
+
+
+async def _compute(check: str, expedition_id: Optional[int], missing: Dict[str, List[int]]) -> Dict[Key, Any]:
+    period = quality_config.motion_baseline_ms
+    ranges = {individual_number: (min(starts), max(starts) + period) for individual_number, starts in missing.items()}
+
+    if is_archived(expedition_id):
+        columns = await asyncio.to_thread(_archived_windows, check, expedition_id, ranges)
+    else:
+        query = _window_select(check, expedition_id, ranges)
+        profiling.record_query(query)
+        async with async_session_maker() as session:
+            result = await session.execute(query)
+            names = list(result.keys())
+            rows = result.all()
+        columns = dict(zip(names, zip(*rows) if rows else [()] * len(names)))
+
+    computed = await asyncio.to_thread(_split, check, expedition_id, ranges, columns)
+    _stats['computed'] += len(computed)
+
+    # Закрытый дольше QUALITY_CACHE_TTL период уже не изменится
+    now, settled = time.monotonic(), time.time() * 1000 - quality_config.cache_ttl * 1000
+    for key, starts in computed.items():
+        expires = math.inf if key[3] + period <= settled else now + quality_config.cache_ttl
+        _cache[key] = (expires, starts)
+        _cache.move_to_end(key)
+    while len(_cache) > quality_config.cache_size:
+        _cache.popitem(last=False)
+        _stats['evictions'] += 1
+    return computed
+
+
+def _done(keys: List[Key], task: asyncio.Task) -> None:
+    for key in keys:
+        if _pending.get(key) is task:
+            del _pending[key]
+    if not task.cancelled():
+        task.exception()
+
+
+async def _check(
+        check: str,
+        expedition_id: Optional[int],
+        needed: Dict[str, Sequence[int]],
+        by_participant: bool
+) -> Dict[Optional[str], Any]:
+    import numpy as np
+
+    now = time.monotonic()
+    found: Dict[str, list] = {}
+    tasks: Dict[Key, asyncio.Task] = {}
+    missing: Dict[str, List[int]] = {}
+    for individual_number, starts in needed.items():
+        for start in starts:
+            key = (check, individual_number, expedition_id, start)
+            cached = _cache.get(key)
+            if cached is not None and cached[0] >= now:
+                _cache.move_to_end(key)
+                found.setdefault(individual_number, []).append(cached[1])
+                _stats['hits'] += 1
+            elif key in _pending:
+                tasks[key] = _pending[key]
+                _stats['waits'] += 1
+            else:
+                missing.setdefault(individual_number, []).append(start)
+                _stats['misses'] += 1
+
+    if missing:
+        # Отдельная задача: отмена запроса не отменяет расчёт для остальных ожидающих
+        task = asyncio.ensure_future(_compute(check, expedition_id, missing))
+        keys = [(check, individual_number, expedition_id, start)
+                for individual_number, starts in missing.items() for start in starts]
+        for key in keys:
+            _pending[key] = tasks[key] = task
+        task.add_done_callback(functools.partial(_done, keys))
+
+    results = {task: await asyncio.shield(task) for task in set(tasks.values())}
+    for key, task in tasks.items():
+        found.setdefault(key[1], []).append(results[task][key])
+
+    windows = {}
+    for individual_number, parts in found.items():
+        starts = np.concatenate(parts)
+        if len(starts):
+            windows[individual_number if by_participant else None] = starts
+    return windows
+
+
+async def failed_windows(
+        checks: Sequence[str],
+        expedition_id: Optional[int],
+        needed: Dict[str, Sequence[int]],
+        by_participant: bool
+) -> List[Dict[Optional[str], Any]]:
+    """
+    Начала непройденных окон каждой проверки (см. db/samples.py) в периодах needed
+    (участник -> начала периодов, см. periods); без by_participant - ключ None
+    """
+    return list(await asyncio.gather(
+        *(_check(check, expedition_id, needed, by_participant) for check in checks)
+    ))
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    Кэш периодов воркера: hits - найдено в кэше, waits - дождались расчёта другого запроса,
+    misses - посчитано заново по запросу, computed - посчитано всего (с периодами между ними)
+    """
+    return {
+        'pid': os.getpid(),
+        'periods': len(_cache),
+        'max_periods': quality_config.cache_size,
+        **{name: _stats[name] for name in ('hits', 'waits', 'misses', 'computed', 'evictions')},
+    }
@@ -1,147 +1,348 @@
-from sqlalchemy import select, and_
-from typing import List, Dict, Any, Optional
+import asyncio
+from sqlalchemy import Float, select, and_, case, func
+from typing import List, Dict, Any, Optional, Sequence
+import profiling
+from singleflight import coalesce
+from . import checks, quality, store
+from .archive import is_archived, read_archived, read_archived_columns
 from .database import Base, async_session_maker
+from .filters import MetricFilter
 
+# Таблицы метрик и выбираемые из них колонки (кроме session, timestamp, expedition_id)
+METRIC_TABLES = {
+    'nfb_metrics': ('alpha', 'beta', 'theta', 'delta', 'smr'),
+    'physiological_metrics': ('relax', 'fatigue', 'concentration', 'stress', 'involvement'),
+    'cardio_metrics': ('heart_rate', 'stress_index', 'kaplan_index'),
+    'productivity_metrics': ('gravity', 'productivity', 'fatigue', 'concentration', 'relaxation'),
+    'emotional_metrics': ('attention', 'relaxation', 'cognitive_load', 'cognitive_control', 'self_control'),
+}
 
-async def get_nlp_metrics(
-        individual_number: str,
-        expedition_id: Optional[int] = None
+
+def _apply_filter(query, table, filters: MetricFilter):
+    if filters.from_ts is not None:
+        query = query.where(table.c.timestamp >= filters.from_ts)
+    if filters.to_ts is not None:
+        query = query.where(table.c.timestamp <= filters.to_ts)
+    if filters.sessions:
+        query = query.where(table.c.session.in_(filters.sessions))
+    return query
+
+
+def _select(
+        table_name: str,
+        values: List[str],
+        individual_number: Optional[str],
+        expedition_id: Optional[int],
+        filters: MetricFilter,
+        failed: Sequence[Dict] = ()
+):
+    """
+    Выборка метрик; failed - непройденные окна проверок (db/samples.py): в режиме drop
+    их сэмплы исключаются, в режиме weight усреднение по интервалам - взвешенное
+    """
+    table = Base.metadata.tables[table_name]
+    columns = [table.c[name] for name in values]
+    prefix = [table.c.individual_number] if individual_number is None else []
+    weight = quality.sql_weight(table, failed) if quality.weighted(table_name, filters) else None
+
+    if filters.resolution and weight is not None:
+        # Вес считается один раз на сэмпл, затем взвешенное среднее по интервалам
+        rows = _select(
+            table_name, values, individual_number, expedition_id, quality.raw_filter(filters), failed
+        ).order_by(None).subquery()
+        bucket = rows.c.timestamp - rows.c.timestamp % filters.resolution
+        keys = [rows.c.individual_number] if individual_number is None else []
+        return select(
+            *keys,
+            rows.c.session,
+            bucket.label('timestamp'),
+            *(
+                (func.sum(rows.c[name] * rows.c.weight, type_=Float)
+                 / func.nullif(func.sum(case((rows.c[name].is_not(None), rows.c.weight))), 0, type_=Float))
+                .label(name)
+                for name in values
+            ),
+            rows.c.expedition_id,
+            func.sum(rows.c.weight).label('weight')
+        ).group_by(
+            *keys, rows.c.session, bucket, rows.c.expedition_id
+        ).order_by(bucket, rows.c.session)
+
+    if filters.resolution:
+        # Целочисленный интервал: timestamp хранится в миллисекундах (BIGINT)
+        bucket = table.c.timestamp - table.c.timestamp % filters.resolution
+        query = select(
+            *prefix,
+            table.c.session,
+            bucket.label('timestamp'),
+            *(func.avg(column).label(column.name) for column in columns),
+            table.c.expedition_id
+        ).group_by(
+            *prefix, table.c.session, bucket, table.c.expedition_id
+        ).order_by(bucket, table.c.session)
+    else:
+        query = select(
+            *prefix, table.c.session, table.c.timestamp, *columns, table.c.expedition_id,
+            *([weight.label('weight')] if weight is not None else [])
+        ).order_by(table.c.timestamp)
+
+    if individual_number is not None:
+        query = query.where(table.c.individual_number == individual_number)
+
+    if expedition_id:
+        query = query.where(table.c.expedition_id == expedition_id)
+
+    query = _apply_filter(query, table, filters)
+
+    flags = quality.sql_condition(table, filters)
+    if flags is not None:
+        query = query.where(flags)
+
+    if quality.get_mode(filters) == 'drop':
+        windows = quality.sql_window_condition(table, failed)
+        if windows is not None:
+            query = query.where(windows)
+
+    return query
+
+
+def _transpose(result) -> Dict[str, Sequence]:
+    names = list(result.keys())
+    rows = result.all()
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    return dict(zip(names, columns))
+
+
+def _periods_select(
+        table_name: str,
+        individual_number: Optional[str],
+        expedition_id: Optional[int],
+        filters: MetricFilter
+):
+    """
+    Периоды базовой линии, в которых есть сэмплы выборки (для проверок окон, db/checks.py)
+    """
+    table = Base.metadata.tables[table_name]
+    query = select(table.c.individual_number, checks.period_start(table.c.timestamp).label('period')).distinct()
+
+    if individual_number is not None:
+        query = query.where(table.c.individual_number == individual_number)
+
+    if expedition_id:
+        query = query.where(table.c.expedition_id == expedition_id)
+
+    return _apply_filter(query, table, filters)
+
+
+async def _query(
+        table_name: str,
+        values: List[str],
+        individual_number: Optional[str],
+        expedition_id: Optional[int],
+        filters: MetricFilter,
+        window_checks: Sequence[str] = ()
 ) -> List[Dict[str, Any]]:
+    weighted = quality.weighted(table_name, filters)
+    by_participant = individual_number is None
 
-    async with async_session_maker() as session:
-        NfbMetrics = Base.classes.nfb_metrics
+    if is_archived(expedition_id):
+        if not weighted and not window_checks:
+            return await asyncio.to_thread(
+                read_archived, table_name, values, individual_number, expedition_id, filters
+            )
+        # Parquet не знает непройденных окон: исходные сэмплы отбраковываются в pandas
+        from . import samples
 
-        query = select(NfbMetrics).where(
-            NfbMetrics.individual_number == individual_number
+        rows = await asyncio.to_thread(
+            read_archived, table_name, values + quality.sample_columns(table_name, filters),
+            individual_number, expedition_id, quality.raw_filter(filters)
         )
+        needed = checks.periods(
+            [row.get('individual_number', individual_number) for row in rows], [row['timestamp'] for row in rows]
+        )
+        failed = await checks.failed_windows(window_checks, expedition_id, needed, by_participant)
+        return await asyncio.to_thread(
+            samples.apply, table_name, rows, values, failed, filters, by_participant
+        )
+    if not weighted and store.enabled(table_name, individual_number, expedition_id):
+        rows = await store.read_rows(table_name, values, individual_number, expedition_id, filters, window_checks)
+        if rows is not None:
+            return rows
 
-        if expedition_id:
-            query = query.where(NfbMetrics.expedition_id == expedition_id)
-
-        query = query.order_by(NfbMetrics.timestamp)
+    failed = ()
+    if window_checks:
+        async with async_session_maker() as session:
+            query = _periods_select(table_name, individual_number, expedition_id, filters)
+            profiling.record_query(query)
+            needed = checks.periods(*_transpose(await session.execute(query)).values())
+        failed = await checks.failed_windows(window_checks, expedition_id, needed, by_participant)
 
+    async with async_session_maker() as session:
+        query = _select(table_name, values, individual_number, expedition_id, filters, failed)
+        profiling.record_query(query)
         result = await session.execute(query)
-        rows = result.scalars().all()
-
-        return [
-            {
-                'session': r.session,
-                'timestamp': r.timestamp,
-                'alpha': r.alpha,
-                'beta': r.beta,
-                'theta': r.theta,
-                'delta': r.delta,
-                'smr': r.smr,
-                'expedition_id': r.expedition_id
-            }
-            for r in rows
-        ]
 
+        return [dict(r) for r in result.mappings()]
 
-async def get_physiological_metrics(
-        individual_number: str,
-        expedition_id: Optional[int] = None
-) -> List[Dict[str, Any]]:
+
+async def _query_columns(
+        table_name: str,
+        values: List[str],
+        individual_number: Optional[str],
+        expedition_id: Optional[int],
+        filters: MetricFilter
+) -> Dict[str, Sequence]:
     """
-    Получение физиологических метрик (fatigue, relax, concentration, stress)
+    Та же выборка по колонкам: кортежи строк транспонируются без словаря на строку
     """
+    if is_archived(expedition_id):
+        return await asyncio.to_thread(
+            read_archived_columns, table_name, values, individual_number, expedition_id, filters
+        )
+    if store.enabled(table_name, individual_number, expedition_id):
+        columns = await store.read_columns(table_name, values, individual_number, expedition_id, filters)
+        if columns is not None:
+            return columns
+
     async with async_session_maker() as session:
-        PhysiologicalMetrics = Base.classes.physiological_metrics
+        query = _select(table_name, values, individual_number, expedition_id, filters)
+        profiling.record_query(query)
+        return _transpose(await session.execute(query))
 
-        query = select(PhysiologicalMetrics).where(
-            PhysiologicalMetrics.individual_number == individual_number
-        )
 
-        if expedition_id:
-            query = query.where(PhysiologicalMetrics.expedition_id == expedition_id)
+async def _fetch(
+        table_name: str,
+        individual_number: Optional[str] = None,
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
+) -> List[Dict[str, Any]]:
+    """
+    Выборка строк таблицы метрик, отсортированных по timestamp.
+    Без individual_number возвращаются строки всех участников с колонкой individual_number.
+    С filters.resolution строки усредняются по интервалам: timestamp - начало интервала.
+    Сэмплы с артефактами отбрасываются или получают вес (см. db/quality.py, db/samples.py).
+    Экспедиции, перенесённые в архив, читаются из Parquet, метрики участника
+    в экспедиции - из хранилища в памяти (db/store.py)
+    """
+    filters = filters or MetricFilter()
+    values = list(METRIC_TABLES[table_name])
+
+    # Непройденные окна движения и ЭЭГ берутся из кэша периодов (db/checks.py);
+    # отбраковка и усреднение по интервалам - в одном запросе к метрикам
+    return await _query(
+        table_name, values, individual_number, expedition_id, filters, quality.window_checks(table_name, filters)
+    )
 
-        query = query.order_by(PhysiologicalMetrics.timestamp)
 
-        result = await session.execute(query)
-        rows = result.scalars().all()
-
-        return [
-            {
-                'session': r.session,
-                'timestamp': r.timestamp,
-                'relax': r.relax,
-                'fatigue': r.fatigue,
-                'concentration': r.concentration,
-                'stress': r.stress,
-                'involvement': r.involvement,
-                'expedition_id': r.expedition_id
-            }
-            for r in rows
-        ]
+@coalesce('get_nlp_metrics')
+async def get_nlp_metrics(
+        individual_number: str,
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
+) -> List[Dict[str, Any]]:
 
+    return await _fetch('nfb_metrics', individual_number, expedition_id, filters)
 
+
+@coalesce('get_physiological_metrics')
+async def get_physiological_metrics(
+        individual_number: str,
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
+) -> List[Dict[str, Any]]:
+    """
+    Получение физиологических метрик (fatigue, relax, concentration, stress)
+    """
+    return await _fetch('physiological_metrics', individual_number, expedition_id, filters)
+
+
+@coalesce('get_cardio_metrics')
 async def get_cardio_metrics(
         individual_number: str,
-        expedition_id: Optional[int] = None
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
 ) -> List[Dict[str, Any]]:
     """
     Получение кардио метрик (heart_rate, stress_index)
     """
-    async with async_session_maker() as session:
-        CardioMetrics = Base.classes.cardio_metrics
+    return await _fetch('cardio_metrics', individual_number, expedition_id, filters)
 
-        query = select(CardioMetrics).where(
-            CardioMetrics.individual_number == individual_number
-        )
 
-        if expedition_id:
-            query = query.where(CardioMetrics.expedition_id == expedition_id)
+@coalesce('get_productivity_metrics')
+async def get_productivity_metrics(
+        individual_number: str,
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
+) -> List[Dict[str, Any]]:
+    """
+    Получение метрик продуктивности (gravity, productivity, fatigue, concentration, relaxation)
+    """
+    return await _fetch('productivity_metrics', individual_number, expedition_id, filters)
 
-        query = query.order_by(CardioMetrics.timestamp)
 
-        result = await session.execute(query)
-        rows = result.scalars().all()
+@coalesce('get_emotional_metrics')
+async def get_emotional_metrics(
+        individual_number: str,
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
+) -> Dict[str, Sequence]:
+    """
+    Эмоциональные метрики (attention, relaxation, cognitive_load, cognitive_control,
+    self_control) по колонкам: {'session': (...), 'timestamp': (...), 'attention': (...), ...}
+    """
+    return await _query_columns(
+        'emotional_metrics', list(METRIC_TABLES['emotional_metrics']),
+        individual_number, expedition_id, filters or MetricFilter()
+    )
 
-        return [
-            {
-                'session': r.session,
-                'timestamp': r.timestamp,
-                'heart_rate': r.heart_rate,
-                'stress_index': r.stress_index,
-                'kaplan_index': r.kaplan_index,
-                'expedition_id': r.expedition_id
-            }
-            for r in rows
-        ]
 
+@coalesce('get_expedition_emotional_metrics')
+async def get_expedition_emotional_metrics(
+        expedition_id: int,
+        filters: Optional[MetricFilter] = None
+) -> Dict[str, Sequence]:
+    """
+    Эмоциональные метрики всех участников экспедиции по колонкам, с колонкой individual_number
+    """
+    return await _query_columns(
+        'emotional_metrics', list(METRIC_TABLES['emotional_metrics']),
+        None, expedition_id, filters or MetricFilter()
+    )
 
-async def get_productivity_metrics(
-        individual_number: str,
-        expedition_id: Optional[int] = None
-) -> List[Dict[str, Any]]:
+
+@coalesce('get_expedition_participants')
+async def get_expedition_participants(expedition_id: int) -> List[str]:
     """
-    Получение метрик продуктивности (gravity, productivity, fatigue, concentration, relaxation)
+    Индивидуальные номера участников экспедиции
     """
     async with async_session_maker() as session:
-        ProductivityMetrics = Base.classes.productivity_metrics
+        users = Base.metadata.tables['users']
+        participants = Base.metadata.tables['participants']
 
-        query = select(ProductivityMetrics).where(
-            ProductivityMetrics.individual_number == individual_number
-        )
+        query = select(users.c.individual_number).select_from(
+            participants.join(users, participants.c.user_id == users.c.id)
+        ).where(
+            and_(participants.c.expedition_id == expedition_id,
+                 users.c.individual_number.is_not(None))
+        ).order_by(users.c.individual_number)
+
+        profiling.record_query(query)
+        result = await session.execute(query)
 
-        if expedition_id:
-            query = query.where(ProductivityMetrics.expedition_id == expedition_id)
+        return list(result.scalars())
 
-        query = query.order_by(ProductivityMetrics.timestamp)
 
-        result = await session.execute(query)
-        rows = result.scalars().all()
-
-        return [
-            {
-                'session': r.session,
-                'timestamp': r.timestamp,
-                'gravity': r.gravity,
-                'productivity': r.productivity,
-                'fatigue': r.fatigue,
-                'concentration': r.concentration,
-                'relaxation': r.relaxation,
-                'expedition_id': r.expedition_id
-            }
-            for r in rows
-        ]
+@coalesce('get_expedition_metrics')
+async def get_expedition_metrics(
+        table_name: str,
+        expedition_id: int,
+        filters: Optional[MetricFilter] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Метрики всех участников экспедиции одним запросом, сгруппированные по individual_number
+    """
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for row in await _fetch(table_name, None, expedition_id, filters):
+        grouped.setdefault(row.pop('individual_number'), []).append(row)
+
+    return grouped
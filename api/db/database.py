@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.automap import automap_base
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine, AsyncSession
 
@@ -8,11 +8,14 @@ from config import load_config
 config = load_config()
 DATABASE_URL = f"postgresql+asyncpg://{config.db.db_user}:{config.db.db_pass}@{config.db.db_host}:{config.db.db_port}/{config.db.db_name}"
 SYNC_URL = DATABASE_URL.replace("asyncpg", "psycopg2")
+# Движки не открывают соединений до первого запроса, а схема отражается в init_models
+# при старте каждого процесса: импорт модуля не обращается к базе и безопасен до fork
 sync_engine = create_engine(SYNC_URL, echo=False)
 Base = automap_base()
-Base.prepare(sync_engine, reflect=True)
 
 def init_models():
+    if Base.metadata.tables:
+        return
     try:
         Base.prepare(sync_engine, reflect=True)
         print("Модели отражены успешно. Доступные таблицы:", list(Base.classes.keys()))
@@ -26,6 +29,13 @@ def init_models():
 async_engine = create_async_engine(DATABASE_URL, echo=True)
 async_session_maker = async_sessionmaker(async_engine, class_=AsyncSession)
 
+async def ping():
+    """
+    Открывает первое соединение пула воркера до приёма запросов
+    """
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
 async def get_async_session():
     async with async_session_maker() as session:
         yield session
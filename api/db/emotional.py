@@ -0,0 +1,39 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from .data_extraction import METRIC_TABLES, get_emotional_metrics, get_expedition_emotional_metrics
+from .filters import MetricFilter
+
+# Сводки эмоциональных метрик по сеансам и суткам для участника и экспедиции.
+# Данные читаются по колонкам, сводка считается в NumPy (db/rollups.py) в потоке
+EMOTIONAL_VALUES = list(METRIC_TABLES['emotional_metrics'])
+
+
+async def get_emotional_rollup(
+        individual_number: str,
+        expedition_id: Optional[int] = None,
+        by: str = 'session',
+        filters: Optional[MetricFilter] = None
+) -> List[Dict[str, Any]]:
+    """
+    Сводка участника: по сеансам (by='session') или суткам (by='day');
+    для каждой метрики count, mean, std, min, max
+    """
+    from . import rollups
+
+    columns = await get_emotional_metrics(individual_number, expedition_id, filters)
+    return await asyncio.to_thread(rollups.rollup, columns, EMOTIONAL_VALUES, by)
+
+
+async def get_expedition_emotional_rollup(
+        expedition_id: int,
+        by: str = 'session',
+        filters: Optional[MetricFilter] = None
+) -> Dict[str, Any]:
+    """
+    Сводка экспедиции: по каждому участнику и по экспедиции в целом
+    """
+    from . import rollups
+
+    columns = await get_expedition_emotional_metrics(expedition_id, filters)
+    return await asyncio.to_thread(rollups.expedition_rollup, columns, EMOTIONAL_VALUES, by)
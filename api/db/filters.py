@@ -0,0 +1,38 @@
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+QUALITY_MODES = ('off', 'drop', 'weight')
+
+_UNITS_MS = {'ms': 1, 's': 1000, 'm': 60_000, 'h': 3_600_000, 'd': 86_400_000}
+
+
+@dataclass(frozen=True)
+class MetricFilter:
+    """
+    Окно выборки: границы timestamp (мс, включительно), сеансы, шаг агрегации (мс)
+    и режим отбраковки артефактов (off, drop, weight; None - из конфигурации)
+    """
+    from_ts: Optional[int] = None
+    to_ts: Optional[int] = None
+    sessions: Optional[Tuple[int, ...]] = None
+    resolution: Optional[int] = None
+    quality: Optional[str] = None
+
+
+def parse_resolution(value: str) -> int:
+    """
+    Шаг агрегации вида 30s, 15m, 1h, 1d (или число миллисекунд) в миллисекундах
+    """
+    match = re.fullmatch(r'(\d+)(ms|s|m|h|d)?', value.strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Некорректный шаг агрегации: {value}")
+    return int(match.group(1)) * _UNITS_MS[match.group(2) or 'ms']
+
+
+def to_millis(value: datetime) -> int:
+    # Время без часового пояса считаем UTC, как и timestamp в таблицах метрик
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
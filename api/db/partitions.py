@@ -0,0 +1,272 @@
+import argparse
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from .database import sync_engine
+
+# Обслуживание секций высокочастотных таблиц (init-db/partitioned/01-schema.sql):
+#   <таблица>_e<id>             - секция экспедиции, LIST (expedition_id)
+#   <таблица>_e<id>_d<ГГГГММДД> - суточная секция, RANGE (timestamp)
+#   <таблица>_e<id>_default     - строки экспедиции вне суточных секций
+# Имена собираются только из констант и целых чисел
+PARTITIONED_TABLES = ('eeg_raw_metrics', 'eeg_proceed_metrics', 'mems_metrics')
+
+DAY_MS = 86_400_000
+
+# Ключ pg_advisory_lock для create_active_partitions
+PARTITIONS_LOCK = 7_340_001
+
+
+def _day_ms(day: date) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _expedition_partition(table: str, expedition_id: int) -> str:
+    return f'{table}_e{int(expedition_id)}'
+
+
+def _day_partition(table: str, expedition_id: int, day: date) -> str:
+    return f'{_expedition_partition(table, expedition_id)}_d{day:%Y%m%d}'
+
+
+def partitioned_tables(conn) -> List[str]:
+    """
+    Таблицы из PARTITIONED_TABLES, которые в этой базе действительно секционированы
+    """
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid"
+    )).scalars()
+    existing = set(rows)
+    return [table for table in PARTITIONED_TABLES if table in existing]
+
+
+def list_partitions(conn, parent: str) -> Dict[str, str]:
+    """
+    Присоединённые секции таблицы: имя -> граница (FOR VALUES ...)
+    """
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :parent"
+    ), {'parent': parent})
+    return dict(rows.all())
+
+
+def _table_exists(conn, name: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': name}).scalar()
+
+
+def _columns(conn, table: str) -> List[str]:
+    return list(conn.execute(text(
+        "SELECT attname FROM pg_attribute WHERE attrelid = CAST(:name AS regclass) "
+        "AND attnum > 0 AND NOT attisdropped ORDER BY attnum"
+    ), {'name': table}).scalars())
+
+
+def _attach_with_rows(conn, parent: str, name: str, bound: str, default: str, condition: str,
+                      subpartitions=()) -> None:
+    """
+    Создание секции, в которую переносятся уже попавшие в DEFAULT строки:
+    таблица создаётся отдельно, заполняется и только потом присоединяется
+    """
+    partition_by = ' PARTITION BY RANGE (timestamp)' if subpartitions else ''
+    conn.execute(text(f'CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS){partition_by}'))
+    for statement in subpartitions:
+        conn.execute(text(statement))
+
+    if _table_exists(conn, default):
+        # Колонки по имени: SELECT * зависит от физического порядка колонок,
+        # который у таблиц с удалёнными или добавленными колонками расходится
+        columns = ', '.join(f'"{column}"' for column in _columns(conn, parent))
+        conn.execute(text(f'INSERT INTO {name} ({columns}) SELECT {columns} FROM {default} WHERE {condition}'))
+        conn.execute(text(f'DELETE FROM {default} WHERE {condition}'))
+
+    conn.execute(text(f'ALTER TABLE {parent} ATTACH PARTITION {name} {bound}'))
+
+
+def create_partitions(expedition_id: int, start: date, end: date) -> List[str]:
+    """
+    Заранее создаёт секцию экспедиции и суточные секции на [start, end] во всех
+    секционированных таблицах; уже существующие секции пропускаются
+    """
+    expedition_id = int(expedition_id)
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    created = []
+
+    with sync_engine.begin() as conn:
+        for table in partitioned_tables(conn):
+            parent = _expedition_partition(table, expedition_id)
+            parent_default = f'{parent}_default'
+
+            if not _table_exists(conn, parent):
+                subpartitions = [
+                    f'CREATE TABLE {parent_default} PARTITION OF {parent} DEFAULT'
+                ] + [
+                    f'CREATE TABLE {_day_partition(table, expedition_id, day)} PARTITION OF {parent} '
+                    f'FOR VALUES FROM ({_day_ms(day)}) TO ({_day_ms(day) + DAY_MS})'
+                    for day in days
+                ]
+                _attach_with_rows(
+                    conn, table, parent, f'FOR VALUES IN ({expedition_id})',
+                    f'{table}_default', f'expedition_id = {expedition_id}', subpartitions
+                )
+                created.append(parent)
+                created.extend(_day_partition(table, expedition_id, day) for day in days)
+                continue
+
+            for day in days:
+                name = _day_partition(table, expedition_id, day)
+                if _table_exists(conn, name):
+                    continue
+                lower, upper = _day_ms(day), _day_ms(day) + DAY_MS
+                _attach_with_rows(
+                    conn, parent, name, f'FOR VALUES FROM ({lower}) TO ({upper})',
+                    parent_default, f'timestamp >= {lower} AND timestamp < {upper}'
+                )
+                created.append(name)
+
+    return created
+
+
+def create_expedition_partitions(expedition_id: int) -> List[str]:
+    """
+    Секции на весь срок экспедиции по датам из таблицы expeditions
+    """
+    with sync_engine.connect() as conn:
+        row = conn.execute(text(
+            "SELECT start_date, end_date FROM expeditions WHERE id = :id"
+        ), {'id': int(expedition_id)}).first()
+    if row is None:
+        raise ValueError(f"Экспедиция {expedition_id} не найдена")
+
+    return create_partitions(expedition_id, row.start_date, row.end_date)
+
+
+def create_active_partitions() -> List[str]:
+    """
+    Секции для текущих и будущих экспедиций; вызывается при старте каждого воркера.
+    Воркеры прогреваются одновременно, поэтому секции создаёт тот, кто первым взял
+    PARTITIONS_LOCK, остальные ждут его и находят секции уже созданными
+    """
+    with sync_engine.connect() as conn:
+        if not partitioned_tables(conn):
+            return []
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {'key': PARTITIONS_LOCK})
+        try:
+            ids = conn.execute(text(
+                "SELECT id FROM expeditions WHERE end_date >= CURRENT_DATE ORDER BY id"
+            )).scalars().all()
+            # Блокировка сессионная и переживает фиксацию; транзакция чтения не держится
+            # открытой, пока другие соединения создают секции
+            conn.commit()
+
+            created = []
+            for expedition_id in ids:
+                created.extend(create_expedition_partitions(expedition_id))
+            return created
+        finally:
+            # После ошибки в этом соединении транзакция прервана - сначала откат
+            conn.rollback()
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': PARTITIONS_LOCK})
+            conn.commit()
+
+
+def detach_partitions(expedition_id: int, before: Optional[date] = None) -> List[str]:
+    """
+    Отсоединение секций: без before - секции экспедиции целиком,
+    с before - суточных секций, закончившихся не позже этой даты.
+    Отсоединённые таблицы остаются в базе до drop_detached
+    """
+    expedition_id = int(expedition_id)
+    detached = []
+
+    with sync_engine.begin() as conn:
+        for table in partitioned_tables(conn):
+            parent = _expedition_partition(table, expedition_id)
+            if before is None:
+                if parent in list_partitions(conn, table):
+                    conn.execute(text(f'ALTER TABLE {table} DETACH PARTITION {parent}'))
+                    detached.append(parent)
+                continue
+
+            prefix = f'{parent}_d'
+            for name in sorted(list_partitions(conn, parent)):
+                if not name.startswith(prefix):
+                    continue
+                day = datetime.strptime(name[len(prefix):], '%Y%m%d').date()
+                if day + timedelta(days=1) <= before:
+                    conn.execute(text(f'ALTER TABLE {parent} DETACH PARTITION {name}'))
+                    detached.append(name)
+
+    return detached
+
+
+def drop_detached(expedition_id: int) -> List[str]:
+    """
+    Удаление ранее отсоединённых секций экспедиции
+    """
+    expedition_id = int(expedition_id)
+    dropped = []
+
+    with sync_engine.begin() as conn:
+        for table in PARTITIONED_TABLES:
+            parent = _expedition_partition(table, expedition_id)
+            names = conn.execute(text(
+                "SELECT c.relname FROM pg_class c "
+                "WHERE c.relkind IN ('r', 'p') AND NOT c.relispartition "
+                "AND (c.relname = :parent OR c.relname LIKE :pattern)"
+            ), {'parent': parent, 'pattern': f'{parent}\\_%'}).scalars().all()
+            for name in names:
+                conn.execute(text(f'DROP TABLE {name}'))
+                dropped.append(name)
+
+    return dropped
+
+
+def drop_expedition_partitions(conn, table: str, expedition_id: int) -> bool:
+    """
+    Удаление данных экспедиции через DETACH + DROP вместо DELETE.
+    Возвращает False, если у экспедиции нет своей секции
+    """
+    parent = _expedition_partition(table, expedition_id)
+    if parent not in list_partitions(conn, table):
+        return False
+    conn.execute(text(f'ALTER TABLE {table} DETACH PARTITION {parent}'))
+    conn.execute(text(f'DROP TABLE {parent}'))
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Управление секциями таблиц метрик")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    create = commands.add_parser('create', help="создать секции на срок экспедиции")
+    create.add_argument('expedition_id', type=int)
+    commands.add_parser('create-active', help="создать секции для текущих экспедиций")
+    detach = commands.add_parser('detach', help="отсоединить секции экспедиции")
+    detach.add_argument('expedition_id', type=int)
+    detach.add_argument('--before', type=date.fromisoformat,
+                        help="только суточные секции до даты (ГГГГ-ММ-ДД)")
+    drop = commands.add_parser('drop', help="удалить отсоединённые секции экспедиции")
+    drop.add_argument('expedition_id', type=int)
+
+    args = parser.parse_args()
+    if args.command == 'create':
+        result = create_expedition_partitions(args.expedition_id)
+    elif args.command == 'create-active':
+        result = create_active_partitions()
+    elif args.command == 'detach':
+        result = detach_partitions(args.expedition_id, args.before)
+    else:
+        result = drop_detached(args.expedition_id)
+
+    for name in result:
+        print(name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import ARRAY, BigInteger, Float, and_, any_, bindparam, case, func, literal_column, not_, or_
+
+from config import load_config
+from .filters import MetricFilter
+
+# Отбраковка сэмплов с артефактами перед агрегацией.
+# Два уровня проверок:
+#   1. флаги в самой строке (cardio_metrics, physiological_metrics) - в режиме drop
+#      передаются прямо в WHERE / фильтр Parquet;
+#   2. окна MOTION_WINDOW_MS с движением (mems_metrics) или плохим ЭЭГ
+#      (eeg_artifacts_metrics): агрегаты по окну считает SQL (GROUP BY начала окна),
+#      базовую линию движения - NumPy по окнам периода MOTION_BASELINE_MS (db/samples.py),
+#      результат кэшируется по периодам (db/checks.py);
+#      сэмплы из непройденных окон отбрасываются или получают вес в том же запросе,
+#      что усредняет их по интервалам.
+# Режимы: off - без проверок, drop - отбросить плохие сэмплы,
+# weight - оставить с весом downweight ** <число непройденных проверок>
+quality_config = load_config().quality
+
+# Флаги в строке: колонка -> правило ('zero' - ненулевое значение означает артефакт,
+# 'min' - значение ниже порога означает плохой контакт)
+FLAG_RULES = {
+    'cardio_metrics': (('has_artifacts', 'zero'), ('motion_artifacts', 'zero'), ('skin_contact', 'min')),
+    'physiological_metrics': (('nfb_artifacts', 'zero'), ('cardio_artifacts', 'zero')),
+}
+
+# Таблицы, сэмплы которых сверяются с движением и качеством ЭЭГ
+SAMPLE_CHECKS = {
+    'nfb_metrics': ('motion', 'eeg'),
+    'physiological_metrics': ('motion',),
+    'cardio_metrics': ('motion',),
+}
+
+MOTION_COLUMNS = ['accelerometer_x', 'accelerometer_y', 'accelerometer_z',
+                  'gyroscope_x', 'gyroscope_y', 'gyroscope_z']
+EEG_COLUMNS = ['artifacts_channel_1', 'artifacts_channel_2',
+               'quality_channel_1', 'quality_channel_2']
+
+# Агрегаты окна mems_metrics
+MOTION_STATS = ('acc', 'acc_range', 'gyro', 'gyro_range')
+
+CONTEXT_TABLES = {
+    'motion': ('mems_metrics', MOTION_COLUMNS),
+    'eeg': ('eeg_artifacts_metrics', EEG_COLUMNS),
+}
+
+
+def get_mode(filters: MetricFilter) -> str:
+    return filters.quality or quality_config.mode
+
+
+def threshold(rule: str) -> float:
+    return quality_config.skin_contact_min if rule == 'min' else 0
+
+
+def sql_condition(table, filters: MetricFilter):
+    """
+    Условие WHERE для флагов строки в режиме drop (NULL считается чистым сэмплом)
+    """
+    rules = FLAG_RULES.get(table.name)
+    if not rules or get_mode(filters) != 'drop':
+        return None
+
+    clauses = []
+    for column, rule in rules:
+        c = table.c[column]
+        clauses.append(or_(c.is_(None), c >= threshold(rule) if rule == 'min' else c == 0))
+    return and_(*clauses)
+
+
+def arrow_condition(table_name: str, filters: MetricFilter):
+    """
+    То же условие для чтения из Parquet (pyarrow.dataset.Expression или None)
+    """
+    import pyarrow.dataset as ds
+
+    rules = FLAG_RULES.get(table_name)
+    if not rules or get_mode(filters) != 'drop':
+        return None
+
+    condition = None
+    for column, rule in rules:
+        field = ds.field(column)
+        clause = field.is_null() | (field >= threshold(rule) if rule == 'min' else field == 0)
+        condition = clause if condition is None else condition & clause
+    return condition
+
+
+def numpy_condition(table_name: str, columns: Dict[str, Any], filters: MetricFilter):
+    """
+    То же условие для колонок в памяти (db/store.py): булева маска или None
+    """
+    import numpy as np
+
+    rules = FLAG_RULES.get(table_name)
+    if not rules or get_mode(filters) != 'drop':
+        return None
+
+    condition = None
+    for column, rule in rules:
+        values = columns[column]
+        with np.errstate(invalid='ignore'):
+            clause = np.isnan(values) | (values >= threshold(rule) if rule == 'min' else values == 0)
+        condition = clause if condition is None else condition & clause
+    return condition
+
+
+def flag_columns(table_name: str) -> List[str]:
+    return [column for column, _ in FLAG_RULES.get(table_name, ())]
+
+
+def window_checks(table_name: str, filters: MetricFilter) -> Tuple[str, ...]:
+    """
+    Проверки окон движения и ЭЭГ для сэмплов таблицы
+    """
+    if get_mode(filters) == 'off':
+        return ()
+    return SAMPLE_CHECKS.get(table_name, ())
+
+
+def weighted(table_name: str, filters: MetricFilter) -> bool:
+    """
+    Ответ с весами сэмплов: режим weight для таблицы с проверками
+    """
+    return get_mode(filters) == 'weight' and (table_name in SAMPLE_CHECKS or table_name in FLAG_RULES)
+
+
+def sample_columns(table_name: str, filters: MetricFilter) -> List[str]:
+    # В режиме weight флаги строки оцениваются вместе с окнами, поэтому нужны их значения
+    if get_mode(filters) != 'weight':
+        return []
+    return flag_columns(table_name)
+
+
+def window_bucket(timestamp):
+    return timestamp - timestamp % quality_config.motion_window_ms
+
+
+def raw_filter(filters: MetricFilter) -> MetricFilter:
+    return replace(filters, resolution=None)
+
+
+def _magnitude(columns: Sequence) -> Any:
+    x, y, z = columns
+    return func.sqrt(x * x + y * y + z * z)
+
+
+def sql_window_stats(table) -> List[Any]:
+    """
+    Агрегаты окна mems_metrics: среднее и размах модулей ускорения и угловой скорости
+    """
+    stats = []
+    for name, axes in (('acc', MOTION_COLUMNS[:3]), ('gyro', MOTION_COLUMNS[3:])):
+        magnitude = _magnitude([table.c[axis] for axis in axes])
+        stats.append(func.avg(magnitude).label(name))
+        stats.append((func.max(magnitude) - func.min(magnitude)).label(f'{name}_range'))
+    return stats
+
+
+def sql_eeg_failed(table):
+    """
+    HAVING для окон eeg_artifacts_metrics с низким качеством или большой долей артефактов
+    """
+    return or_(
+        *(func.min(table.c[name]) < quality_config.eeg_quality_min for name in EEG_COLUMNS[2:]),
+        *(func.max(table.c[name]) > quality_config.eeg_artifacts_max for name in EEG_COLUMNS[:2])
+    )
+
+
+def arrow_window_stats(check: str, table, keys: List[str]):
+    """
+    Те же агрегаты окон для таблицы Arrow из архива (колонки keys, timestamp и колонки проверки)
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    window = quality_config.motion_window_ms
+    # Для целых чисел divide - целочисленное деление
+    columns = {name: table[name] for name in keys}
+    columns['window'] = pc.multiply(pc.divide(table['timestamp'], window), window)
+    keys = [*keys, 'window']
+
+    if check == 'motion':
+        for name, axes in (('acc', MOTION_COLUMNS[:3]), ('gyro', MOTION_COLUMNS[3:])):
+            x, y, z = (pc.multiply(table[axis], table[axis]) for axis in axes)
+            columns[name] = pc.sqrt(pc.add(pc.add(x, y), z))
+        grouped = pa.table(columns).group_by(keys).aggregate(
+            [(name, aggregation) for name in ('acc', 'gyro') for aggregation in ('mean', 'min_max')]
+        )
+        stats = {}
+        for name in ('acc', 'gyro'):
+            extremes = grouped[f'{name}_min_max']
+            stats[name] = grouped[f'{name}_mean']
+            stats[f'{name}_range'] = pc.subtract(pc.struct_field(extremes, 'max'), pc.struct_field(extremes, 'min'))
+        return pa.table({**{name: grouped[name] for name in keys}, **stats}).sort_by([(name, 'ascending') for name in keys])
+
+    for name in EEG_COLUMNS:
+        columns[name] = table[name]
+    grouped = pa.table(columns).group_by(keys).aggregate(
+        [(name, 'min') for name in EEG_COLUMNS[2:]] + [(name, 'max') for name in EEG_COLUMNS[:2]]
+    )
+    failed = None
+    for name in EEG_COLUMNS:
+        clause = (pc.less(grouped[f'{name}_min'], quality_config.eeg_quality_min) if name in EEG_COLUMNS[2:]
+                  else pc.greater(grouped[f'{name}_max'], quality_config.eeg_artifacts_max))
+        clause = pc.fill_null(clause, False)
+        failed = clause if failed is None else pc.or_(failed, clause)
+    return grouped.filter(failed).select(keys).sort_by([(name, 'ascending') for name in keys])
+
+
+def _in_windows(bucket, starts: Sequence[int]):
+    # Начала окон - один параметр-массив: текст запроса не зависит от их числа
+    return bucket == any_(bindparam(None, [int(start) for start in starts], type_=ARRAY(BigInteger)))
+
+
+def _sql_failed_window(table, windows: Dict[Optional[str], Sequence[int]]):
+    bucket = window_bucket(table.c.timestamp)
+    clauses = []
+    for individual_number, starts in windows.items():
+        if not len(starts):
+            continue
+        clause = _in_windows(bucket, starts)
+        if individual_number is not None:
+            clause = and_(table.c.individual_number == individual_number, clause)
+        clauses.append(clause)
+    return or_(*clauses) if clauses else None
+
+
+def sql_window_condition(table, failed: Sequence[Dict[Optional[str], Sequence[int]]]):
+    """
+    Условие WHERE для режима drop: сэмпл не попал ни в одно непройденное окно
+    """
+    clauses = [clause for clause in (_sql_failed_window(table, windows) for windows in failed) if clause is not None]
+    return not_(or_(*clauses)) if clauses else None
+
+
+def sql_weight(table, failed: Sequence[Dict[Optional[str], Sequence[int]]]):
+    """
+    Вес сэмпла для режима weight: downweight ** <число непройденных проверок>
+    """
+    clauses = []
+    for column, rule in FLAG_RULES.get(table.name, ()):
+        c = table.c[column]
+        clauses.append(c < threshold(rule) if rule == 'min' else and_(c.is_not(None), c != 0))
+    clauses.extend(clause for clause in (_sql_failed_window(table, windows) for windows in failed) if clause is not None)
+
+    if not clauses:
+        return literal_column('1.0', Float)
+    failures = sum((case((clause, 1), else_=0) for clause in clauses[1:]), case((clauses[0], 1), else_=0))
+    return func.power(quality_config.downweight, failures, type_=Float)
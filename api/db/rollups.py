@@ -0,0 +1,135 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Векторные сводки по колонкам выборки (см. data_extraction._query_columns):
+# группировка сортировкой и reduceat, без DataFrame и словаря на строку.
+# Импортируется при первой сводке, чтобы NumPy не загружался при старте сервиса
+DAY_MS = 86_400_000
+
+ROLLUPS = ('session', 'day')
+
+STATS = ('mean', 'std', 'min', 'max')
+
+
+def _float(values: Sequence) -> np.ndarray:
+    # None (NULL) становится NaN
+    return np.asarray(values, dtype=float)
+
+
+def group_stats(
+        keys: List[np.ndarray],
+        columns: Dict[str, np.ndarray]
+) -> Tuple[List[np.ndarray], np.ndarray, Dict[str, Dict[str, np.ndarray]]]:
+    """
+    Группировка по целочисленным ключам: (ключи групп, число строк, статистики колонок).
+    NaN не учитываются; count - число непустых значений колонки в группе,
+    std - выборочное (n - 1), для одного значения - None
+    """
+    order = np.lexsort(keys[::-1])
+    sorted_keys = [key[order] for key in keys]
+
+    change = np.zeros(len(order), dtype=bool)
+    change[:1] = True
+    for key in sorted_keys:
+        change[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(change)
+    sizes = np.diff(np.r_[starts, len(order)])
+    group = np.repeat(np.arange(len(starts)), sizes)
+
+    stats = {}
+    for name, values in columns.items():
+        x = values[order]
+        valid = ~np.isnan(x)
+        count = np.add.reduceat(valid.astype(np.int64), starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.add.reduceat(np.where(valid, x, 0.0), starts) / count
+            # Второй проход по отклонениям от среднего группы - устойчивее, чем E[x²] - E[x]²
+            deviation = np.where(valid, x - mean[group], 0.0)
+            std = np.sqrt(np.add.reduceat(deviation * deviation, starts) / (count - 1))
+            # Без значений 0 / -1 дало бы -0.0 вместо NaN
+            std[count < 2] = np.nan
+            stats[name] = {
+                'count': count,
+                'mean': mean,
+                'std': std,
+                'min': np.fmin.reduceat(x, starts),
+                'max': np.fmax.reduceat(x, starts),
+            }
+
+    return [key[starts] for key in sorted_keys], sizes, stats
+
+
+def _value(x) -> Optional[float]:
+    return None if not np.isfinite(x) else float(x)
+
+
+def _metric(stats: Dict[str, np.ndarray], i: int) -> Dict[str, Any]:
+    return {'count': int(stats['count'][i]), **{s: _value(stats[s][i]) for s in STATS}}
+
+
+def _period(columns: Dict[str, Sequence], by: str) -> Tuple[np.ndarray, List[Any]]:
+    """
+    Код периода для каждой строки и подпись периода для каждого кода
+    """
+    if by == 'session':
+        # Строки без сеанса (NULL) собираются в отдельную группу в конце
+        sessions, codes = np.unique(_float(columns['session']), return_inverse=True)
+        return codes, [None if np.isnan(session) else int(session) for session in sessions]
+
+    timestamps = np.asarray(columns['timestamp'], dtype=np.int64)
+    days, codes = np.unique(timestamps - timestamps % DAY_MS, return_inverse=True)
+    return codes, [
+        datetime.fromtimestamp(day / 1000, tz=timezone.utc).date().isoformat() for day in days
+    ]
+
+
+def rollup(columns: Dict[str, Sequence], values: List[str], by: str) -> List[Dict[str, Any]]:
+    """
+    Сводка одного участника по сеансам (by='session') или суткам UTC (by='day')
+    """
+    if not len(columns['timestamp']):
+        return []
+
+    codes, labels = _period(columns, by)
+    keys, sizes, stats = group_stats([codes], {name: _float(columns[name]) for name in values})
+
+    return [
+        {by: labels[code], 'samples': int(sizes[i]), **{name: _metric(stats[name], i) for name in values}}
+        for i, code in enumerate(keys[0])
+    ]
+
+
+def expedition_rollup(columns: Dict[str, Sequence], values: List[str], by: str) -> Dict[str, Any]:
+    """
+    Сводка экспедиции: по участникам и по периоду в целом. Для экспедиции каждый
+    участник входит своим средним (mean - среднее средних, std - разброс между участниками),
+    чтобы участники с частой записью не перевешивали остальных
+    """
+    if not len(columns['timestamp']):
+        return {'participants': {}, 'expedition': []}
+
+    participants, participant_codes = np.unique(
+        np.asarray(columns['individual_number'], dtype=str), return_inverse=True
+    )
+    codes, labels = _period(columns, by)
+    (participant_keys, period_keys), sizes, stats = group_stats(
+        [participant_codes, codes], {name: _float(columns[name]) for name in values}
+    )
+
+    by_participant: Dict[str, List[Dict[str, Any]]] = {}
+    for i, (participant, code) in enumerate(zip(participant_keys, period_keys)):
+        by_participant.setdefault(str(participants[participant]), []).append(
+            {by: labels[code], 'samples': int(sizes[i]), **{name: _metric(stats[name], i) for name in values}}
+        )
+
+    keys, counts, between = group_stats(
+        [period_keys], {name: stats[name]['mean'] for name in values}
+    )
+    expedition = [
+        {by: labels[code], 'participants': int(counts[i]), **{name: _metric(between[name], i) for name in values}}
+        for i, code in enumerate(keys[0])
+    ]
+
+    return {'participants': by_participant, 'expedition': expedition}
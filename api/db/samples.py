@@ -0,0 +1,174 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .quality import FLAG_RULES, MOTION_STATS, get_mode, quality_config, threshold
+from .filters import MetricFilter
+
+# Непройденные окна проверок по агрегатам окон из SQL (правила и пороги - db/quality.py).
+# Энергия движения окна - наибольший робастный z-score среднего и размаха модулей ускорения
+# и угловой скорости относительно окон того же участника за период MOTION_BASELINE_MS:
+# период выровнен по календарю, поэтому оценка окна не зависит от запрошенного интервала.
+# Модуль импортируется при первой проверке, чтобы NumPy не загружался при старте сервиса
+
+# Окна одной проверки: участник (None - запрос по одному участнику) -> начала окон
+Windows = Dict[Optional[str], np.ndarray]
+
+
+def _robust_z(values: np.ndarray) -> np.ndarray:
+    median = np.nanmedian(values)
+    scale = 1.4826 * np.nanmedian(np.abs(values - median))
+    if not scale > 0:
+        scale = np.nanstd(values) or 1.0
+    return (values - median) / scale
+
+
+def _participants(columns: Dict[str, Sequence], n: int, by_participant: bool) -> np.ndarray:
+    if not by_participant:
+        return np.full(n, None, dtype=object)
+    return np.asarray(columns['individual_number'], dtype=object)
+
+
+def _group(participants: np.ndarray, starts: np.ndarray) -> Windows:
+    return {
+        individual_number: np.unique(starts[participants == individual_number])
+        for individual_number in dict.fromkeys(participants.tolist())
+    }
+
+
+def _motion_windows(columns: Dict[str, Sequence], by_participant: bool) -> Windows:
+    starts = np.asarray(columns['window'], dtype=np.int64)
+    if not len(starts):
+        return {}
+    participants = _participants(columns, len(starts), by_participant)
+    stats = {name: np.asarray(columns[name], dtype=float) for name in MOTION_STATS}
+
+    energy = np.full(len(starts), -np.inf)
+    periods = starts - starts % quality_config.motion_baseline_ms
+    baselines: Dict[tuple, List[int]] = {}
+    for i, key in enumerate(zip(participants.tolist(), periods.tolist())):
+        baselines.setdefault(key, []).append(i)
+    with np.errstate(invalid='ignore'):
+        for positions in baselines.values():
+            positions = np.asarray(positions)
+            for name, values in stats.items():
+                z = _robust_z(values[positions])
+                # Размах - только вверх: окно спокойнее обычного не считается движением
+                energy[positions] = np.fmax(energy[positions], z if name.endswith('_range') else np.abs(z))
+
+    failed = energy > quality_config.motion_z_max
+    return _group(participants[failed], starts[failed])
+
+
+def failed_windows(
+        checks: Sequence[str],
+        windows: Sequence[Dict[str, Sequence]],
+        by_participant: bool
+) -> List[Windows]:
+    """
+    Начала непройденных окон каждой проверки по участникам. Для ЭЭГ SQL возвращает
+    только такие окна, для движения - агрегаты всех окон периодов базовой линии
+    """
+    failed = []
+    for check, columns in zip(checks, windows):
+        if check == 'motion':
+            failed.append(_motion_windows(columns, by_participant))
+            continue
+        starts = np.asarray(columns['window'], dtype=np.int64)
+        failed.append(_group(_participants(columns, len(starts), by_participant), starts))
+    return failed
+
+
+def window_failures(
+        timestamps: np.ndarray,
+        participants: Optional[np.ndarray],
+        failed: Sequence[Windows]
+) -> np.ndarray:
+    """
+    Число непройденных окон, в которые попал каждый сэмпл
+    """
+    buckets = timestamps - timestamps % quality_config.motion_window_ms
+    count = np.zeros(len(timestamps), dtype=np.int64)
+    for windows in failed:
+        for individual_number, starts in windows.items():
+            hit = np.isin(buckets, starts)
+            if individual_number is not None:
+                hit &= participants == individual_number
+            count += hit
+    return count
+
+
+def _flags_failed(df, table_name: str) -> List[np.ndarray]:
+    import pandas as pd
+
+    failed = []
+    for column, rule in FLAG_RULES.get(table_name, ()):
+        if column not in df:
+            continue
+        values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+        with np.errstate(invalid='ignore'):
+            failed.append(values < threshold(rule) if rule == 'min' else (~np.isnan(values) & (values != 0)))
+    return failed
+
+
+def _aggregate(df, values: List[str], keys: List[str], resolution: int, weighted: bool):
+    # То же усреднение по интервалам, что и в SQL, но после отбраковки;
+    # в режиме weight - взвешенное среднее, weight = сумма весов интервала
+    df = df.assign(timestamp=df['timestamp'] - df['timestamp'] % resolution)
+    group_keys = [*keys, 'timestamp', 'expedition_id']
+    grouped = df.groupby(group_keys, sort=False, dropna=False)
+
+    if not weighted:
+        result = grouped[values].mean()
+    else:
+        data = df[values]
+        weights = data.notna().mul(df['weight'], axis=0)
+        sums = data.mul(df['weight'], axis=0).groupby([df[k] for k in group_keys], sort=False, dropna=False).sum(min_count=1)
+        total = weights.groupby([df[k] for k in group_keys], sort=False, dropna=False).sum()
+        result = sums / total.where(total > 0)
+        result['weight'] = df.groupby(group_keys, sort=False, dropna=False)['weight'].sum()
+
+    return result.reset_index().sort_values(['timestamp', 'session'], kind='stable')
+
+
+def apply(
+        table_name: str,
+        rows: List[Dict[str, Any]],
+        values: List[str],
+        failed: Sequence[Windows],
+        filters: MetricFilter,
+        by_participant: bool
+) -> List[Dict[str, Any]]:
+    """
+    Отбраковка исходных сэмплов из архива, затем (если задано) усреднение по интервалам.
+    Для PostgreSQL то же делает один запрос (data_extraction._select).
+    rows содержат individual_number, если by_participant
+    """
+    import pandas as pd
+
+    if not rows:
+        return rows
+
+    mode = get_mode(filters)
+    # Колонки из одних NULL иначе остаются типа object и не усредняются
+    df = pd.DataFrame(rows)
+    df[values] = df[values].apply(pd.to_numeric, errors='coerce')
+
+    participants = df['individual_number'].to_numpy(dtype=object) if by_participant else None
+    failures = window_failures(df['timestamp'].to_numpy(dtype=np.int64), participants, failed)
+    for flag_failed in _flags_failed(df, table_name):
+        failures += flag_failed
+
+    if mode == 'drop':
+        df = df[failures == 0]
+    else:
+        df = df.assign(weight=np.power(quality_config.downweight, failures))
+
+    keys = ['individual_number', 'session'] if by_participant else ['session']
+    if filters.resolution and not df.empty:
+        df = _aggregate(df, values, keys, filters.resolution, mode == 'weight')
+
+    columns = [*keys, 'timestamp', *values, 'expedition_id'] + (['weight'] if mode == 'weight' else [])
+    df = df[columns]
+
+    return df.astype(object).where(df.notna(), None).to_dict('records')
@@ -0,0 +1,348 @@
+import asyncio
+import os
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import Integer, func, select
+
+import profiling
+from config import load_config
+from . import checks, quality
+from .database import Base, async_session_maker
+from .filters import MetricFilter
+
+# Колоночное хранилище метрик в памяти воркера: (таблица, участник, экспедиция) ->
+# массивы NumPy по колонкам, отсортированные по timestamp.
+# Первое обращение загружает всю историю участника, каждое следующее дочитывает только
+# строки с timestamp не меньше последнего (индекс individual_number, expedition_id, timestamp);
+# окно, сеансы, флаги качества и усреднение по интервалам считаются по массивам,
+# непройденные окна движения и ЭЭГ - из кэша периодов (db/checks.py), при попадании
+# в кэш - без запроса к базе.
+# Строки, записанные задним числом (timestamp меньше последнего), появятся после полной
+# перезагрузки записи - не реже раза в STORE_MAX_AGE секунд. Записи, к которым давно
+# не обращались, вытесняются, пока хранилище больше STORE_MAX_MB.
+# Хранятся только таблицы TABLES; запись, которая не поместится в STORE_MAX_MB (оценка
+# по числу строк до загрузки), не загружается, и её выборки STORE_MAX_AGE секунд идут в SQL.
+# NumPy импортируется при первой загрузке, чтобы не загружаться при старте сервиса
+store_config = load_config().store
+
+KEYS = ('session', 'timestamp')
+
+# Таблицы метрик с низкой частотой записи; высокочастотные (mems_metrics,
+# eeg_artifacts_metrics, eeg_*) читаются только из SQL
+TABLES = ('nfb_metrics', 'physiological_metrics', 'cardio_metrics', 'productivity_metrics', 'emotional_metrics')
+
+_entries: 'OrderedDict[Tuple[str, str, int], _Entry]' = OrderedDict()
+# Записи больше бюджета: ключ -> время проверки
+_oversized: Dict[Tuple[str, str, int], float] = {}
+_locks: Dict[Tuple[str, str, int], asyncio.Lock] = {}
+_stats: Counter = Counter()
+
+
+class _Entry:
+    """
+    Колонки одной записи: буферы с запасом, занятая часть - [:size].
+    Дозапись не меняет уже занятую часть, поэтому выданные срезы остаются верными
+    """
+
+    def __init__(self, table_name: str, columns: List[str]):
+        table = Base.metadata.tables[table_name]
+        self.table_name = table_name
+        self.columns = columns
+        self.integer: Set[str] = {name for name in columns if isinstance(table.c[name].type, Integer)}
+        self.buffers: Dict[str, Any] = {}
+        self.size = 0
+        # Строк с последним timestamp: дочитка начинается с него и пропускает их
+        self.at_last = 0
+        self.loaded: Optional[float] = None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffer in self.buffers.values())
+
+    @property
+    def last_ts(self) -> Optional[int]:
+        return int(self.buffers['timestamp'][self.size - 1]) if self.size else None
+
+    def expired(self) -> bool:
+        return self.loaded is not None and time.monotonic() - self.loaded > store_config.max_age
+
+    def view(self) -> Dict[str, Any]:
+        return {name: self.buffers[name][:self.size] for name in self.columns}
+
+    def append(self, chunk: Dict[str, Any]) -> None:
+        import numpy as np
+
+        n = len(chunk['timestamp'])
+        if not n:
+            return
+        if not self.buffers or self.size + n > len(self.buffers['timestamp']):
+            # Рост вдвое: дозапись маленькими порциями не копирует всю историю каждый раз
+            capacity = max(self.size + n, 2 * self.size)
+            for name in self.columns:
+                buffer = np.empty(capacity, dtype=chunk[name].dtype)
+                if self.size:
+                    buffer[:self.size] = self.buffers[name][:self.size]
+                self.buffers[name] = buffer
+        for name in self.columns:
+            self.buffers[name][self.size:self.size + n] = chunk[name]
+        self.size += n
+
+        timestamps = self.buffers['timestamp'][:self.size]
+        self.at_last = self.size - int(np.searchsorted(timestamps, timestamps[-1], side='left'))
+
+
+def _budget() -> int:
+    return store_config.max_mb * 1024 * 1024
+
+
+def enabled(table_name: str, individual_number: Optional[str], expedition_id: Optional[int]) -> bool:
+    if not store_config.enabled or table_name not in TABLES or individual_number is None or expedition_id is None:
+        return False
+    checked = _oversized.get((table_name, individual_number, expedition_id))
+    return checked is None or time.monotonic() - checked > store_config.max_age
+
+
+async def _fits(table_name: str, columns: List[str], individual_number: str, expedition_id: int) -> bool:
+    """
+    Поместится ли запись в бюджет: число строк по индексу (individual_number, expedition_id)
+    и по 8 байт на значение
+    """
+    table = Base.metadata.tables[table_name]
+    query = select(func.count()).select_from(table).where(
+        table.c.individual_number == individual_number,
+        table.c.expedition_id == expedition_id
+    )
+    profiling.record_query(query)
+    async with async_session_maker() as session:
+        rows = (await session.execute(query)).scalar()
+    return rows * len(columns) * 8 <= _budget()
+
+
+def _arrays(rows: Sequence[tuple], columns: List[str]) -> Dict[str, Any]:
+    import numpy as np
+
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    # NULL становится NaN; timestamp - NOT NULL
+    return {
+        name: np.asarray(column, dtype=np.int64 if name == 'timestamp' else float)
+        for name, column in zip(columns, values)
+    }
+
+
+async def _load(entry: _Entry, individual_number: str, expedition_id: int) -> None:
+    table = Base.metadata.tables[entry.table_name]
+    since = entry.last_ts
+    query = select(*(table.c[name] for name in entry.columns)).where(
+        table.c.individual_number == individual_number,
+        table.c.expedition_id == expedition_id
+    )
+    if since is not None:
+        query = query.where(table.c.timestamp >= since)
+    # id - порядок строк с одинаковым timestamp, чтобы пропуск at_last был однозначным
+    query = query.order_by(table.c.timestamp, *([table.c.id] if 'id' in table.c else []))
+
+    profiling.record_query(query)
+    async with async_session_maker() as session:
+        rows = (await session.execute(query)).all()
+
+    if since is None:
+        entry.append(await asyncio.to_thread(_arrays, rows, entry.columns))
+        entry.loaded = time.monotonic()
+        _stats['loads'] += 1
+        _stats['loaded_rows'] += len(rows)
+    else:
+        rows = rows[entry.at_last:]
+        entry.append(_arrays(rows, entry.columns))
+        _stats['deltas'] += 1
+        _stats['delta_rows'] += len(rows)
+
+
+def _evict(keep: Tuple[str, str, int]) -> None:
+    budget = _budget()
+    total = sum(entry.nbytes for entry in _entries.values())
+    for key in list(_entries):
+        if total <= budget:
+            break
+        if key == keep:
+            continue
+        total -= _entries.pop(key).nbytes
+        _stats['evictions'] += 1
+
+
+async def _columns(
+        table_name: str,
+        values: List[str],
+        individual_number: str,
+        expedition_id: int
+) -> Optional[Tuple[Dict[str, Any], Set[str]]]:
+    """
+    Срезы колонок записи после дочитки новых строк; None - запись не помещается в бюджет
+    """
+    key = (table_name, individual_number, expedition_id)
+    # Флаги качества хранятся всегда: режим drop применяется к ним уже в памяти
+    needed = list(dict.fromkeys([*KEYS, *values, *quality.flag_columns(table_name)]))
+
+    # Первые одновременные запросы записи не должны каждый считать строки и загружать
+    # всю историю: создание, загрузка и дочитка записи - под блокировкой её ключа
+    async with _locks.setdefault(key, asyncio.Lock()):
+        if not enabled(table_name, individual_number, expedition_id):
+            return None
+        entry = _entries.get(key)
+        if entry is None or entry.expired() or not set(needed) <= set(entry.columns):
+            columns = needed if entry is None else list(dict.fromkeys([*entry.columns, *needed]))
+            if not await _fits(table_name, columns, individual_number, expedition_id):
+                _entries.pop(key, None)
+                _oversized[key] = time.monotonic()
+                _stats['oversized'] += 1
+                return None
+            _oversized.pop(key, None)
+            entry = _Entry(table_name, columns)
+            _entries[key] = entry
+        _entries.move_to_end(key)
+
+        await _load(entry, individual_number, expedition_id)
+        view = entry.view()
+
+        if entry.nbytes > _budget():
+            # Выросла дочитками: этот результат отдаётся, дальше - SQL
+            _entries.pop(key, None)
+            _oversized[key] = time.monotonic()
+            _stats['oversized'] += 1
+        else:
+            _evict(key)
+    return view, entry.integer
+
+
+def _python(values, integer: bool) -> list:
+    import numpy as np
+
+    result = values.tolist()
+    if integer:
+        return [None if v != v else int(v) for v in result]
+    if values.dtype.kind == 'f' and np.isnan(values).any():
+        return [None if v != v else v for v in result]
+    return result
+
+
+def _bounds(timestamps, filters: MetricFilter) -> Tuple[int, int]:
+    import numpy as np
+
+    lo = int(np.searchsorted(timestamps, filters.from_ts, side='left')) if filters.from_ts is not None else 0
+    hi = int(np.searchsorted(timestamps, filters.to_ts, side='right')) if filters.to_ts is not None else len(timestamps)
+    return lo, hi
+
+
+def _periods(timestamps, filters: MetricFilter) -> List[int]:
+    import numpy as np
+
+    lo, hi = _bounds(timestamps, filters)
+    return np.unique(checks.period_start(timestamps[lo:hi])).tolist()
+
+
+def _window(
+        table_name: str,
+        view: Dict[str, Any],
+        integer: Set[str],
+        values: List[str],
+        expedition_id: int,
+        filters: MetricFilter,
+        failed: Sequence[Dict]
+) -> Dict[str, list]:
+    """
+    Выборка из колонок в том же виде, что и SQL из data_extraction._select
+    (без режима weight - он всегда читается из SQL)
+    """
+    import numpy as np
+
+    lo, hi = _bounds(view['timestamp'], filters)
+    columns = {name: column[lo:hi] for name, column in view.items()}
+
+    mask = quality.numpy_condition(table_name, columns, filters)
+    if filters.sessions:
+        sessions = np.isin(columns['session'], filters.sessions)
+        mask = sessions if mask is None else mask & sessions
+    if any(failed):
+        from .samples import window_failures
+
+        passed = window_failures(columns['timestamp'], None, failed) == 0
+        mask = passed if mask is None else mask & passed
+    if mask is not None:
+        columns = {name: column[mask] for name, column in columns.items()}
+
+    if filters.resolution and len(columns['timestamp']):
+        from .rollups import group_stats
+
+        timestamps = columns['timestamp']
+        buckets, bucket_codes = np.unique(timestamps - timestamps % filters.resolution, return_inverse=True)
+        # NaN (сеанс NULL) - в конце, как NULLS LAST в PostgreSQL
+        sessions, session_codes = np.unique(columns['session'], return_inverse=True)
+        (bucket_keys, session_keys), _, stats = group_stats(
+            [bucket_codes, session_codes], {name: columns[name] for name in values}
+        )
+        columns = {
+            'session': sessions[session_keys],
+            'timestamp': buckets[bucket_keys],
+            **{name: stats[name]['mean'] for name in values},
+        }
+        integer = {'session'}
+
+    result = {name: _python(columns[name], name in integer) for name in [*KEYS, *values]}
+    result['expedition_id'] = [expedition_id] * len(result['timestamp'])
+    return result
+
+
+async def read_columns(
+        table_name: str,
+        values: List[str],
+        individual_number: str,
+        expedition_id: int,
+        filters: MetricFilter,
+        window_checks: Sequence[str] = ()
+) -> Optional[Dict[str, list]]:
+    """
+    None - запись не помещается в STORE_MAX_MB, выборку нужно сделать в SQL.
+    Непройденные окна проверок window_checks берутся из кэша db/checks.py
+    по периодам, в которые попали сэмплы записи
+    """
+    loaded = await _columns(table_name, values, individual_number, expedition_id)
+    if loaded is None:
+        return None
+    view, integer = loaded
+    failed = ()
+    if window_checks:
+        needed = {individual_number: _periods(view['timestamp'], filters)}
+        failed = await checks.failed_windows(window_checks, expedition_id, needed, False)
+    return await asyncio.to_thread(_window, table_name, view, integer, values, expedition_id, filters, failed)
+
+
+async def read_rows(
+        table_name: str,
+        values: List[str],
+        individual_number: str,
+        expedition_id: int,
+        filters: MetricFilter,
+        window_checks: Sequence[str] = ()
+) -> Optional[List[Dict[str, Any]]]:
+    columns = await read_columns(table_name, values, individual_number, expedition_id, filters, window_checks)
+    if columns is None:
+        return None
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    Состояние хранилища воркера: loads - полных загрузок, deltas - дочиток,
+    *_rows - прочитано строк, evictions - вытеснено записей,
+    oversized - записей не загружено (или выгружено) из-за бюджета
+    """
+    return {
+        'pid': os.getpid(),
+        'enabled': store_config.enabled,
+        'entries': len(_entries),
+        'mb': round(sum(entry.nbytes for entry in _entries.values()) / 1024 / 1024, 2),
+        'max_mb': store_config.max_mb,
+        **{name: _stats[name] for name in ('loads', 'loaded_rows', 'deltas', 'delta_rows', 'evictions', 'oversized')},
+    }
@@ -1,17 +1,26 @@
-from gigachat import GigaChat
-
 from .promt import promt
 from config import load_config
 
-Authorization_key = load_config().auth_key
-giga = GigaChat(
-    credentials=Authorization_key,
-    verify_ssl_certs=False,
-)
+# Клиент создаётся при первом запросе в каждом процессе, а не при импорте:
+# соединения клиента не должны переживать fork воркеров, а импорт SDK
+# не должен задерживать старт сервиса
+_giga = None
+
+
+def get_giga():
+    global _giga
+    if _giga is None:
+        from gigachat import GigaChat
+        _giga = GigaChat(
+            credentials=load_config().auth_key,
+            verify_ssl_certs=False,
+        )
+    return _giga
 
-def chat(nlp_metrics_json, physiological_metrics_json, cardio_metrics_json, productivity_metrics_json):
-    return giga.chat(promt(nlp_metrics_json,
-                           physiological_metrics_json,
-                           cardio_metrics_json,
-                           productivity_metrics_json))
 
+def chat(nlp_metrics_json, physiological_metrics_json, cardio_metrics_json, productivity_metrics_json, quality_mode):
+    return get_giga().chat(promt(nlp_metrics_json,
+                                 physiological_metrics_json,
+                                 cardio_metrics_json,
+                                 productivity_metrics_json,
+                                 quality_mode))
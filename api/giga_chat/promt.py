@@ -1,4 +1,12 @@
-def promt(nlp_metrics_json, physiological_metrics_json, cardio_metrics_json, productivity_metrics_json):
+# Как в данных учтены артефакты при режиме отбраковки запроса (off, drop, weight)
+QUALITY_NOTES = {
+    'off': 'Сэмплы с артефактами (движение, плохой контакт датчиков, низкое качество ЭЭГ) не отфильтрованы: часть записей может быть искажена.',
+    'drop': 'Сэмплы с артефактами (движение, плохой контакт датчиков, низкое качество ЭЭГ) отфильтрованы.',
+    'weight': 'Сэмплы с артефактами (движение, плохой контакт датчиков, низкое качество ЭЭГ) оставлены с пониженным весом: поле weight - достоверность записи от 0 до 1, записям с меньшим весом доверяйте меньше.',
+}
+
+
+def promt(nlp_metrics_json, physiological_metrics_json, cardio_metrics_json, productivity_metrics_json, quality_mode):
     return f"""
     Вы - эксперт в области нейронауки и анализа физиологических данных, специализирующийся на мониторинге состояния членов экспедиций в экстремальных условиях. Вашей задачей является анализ предоставленных метрик мозга и тела для одного члена экспедиции. Метрики включают:
 
@@ -8,6 +16,7 @@ NLP-метрики (волны мозга): alpha (альфа-ритмы, свя
 Метрики продуктивности: gravity (возможно, гравитационный фактор или весомость задач?), productivity (продуктивность), fatigue (усталость), concentration (концентрация), relaxation (расслабление).
 
 Данные предоставлены в формате списков словарей, отсортированных по timestamp (времени). Каждые метрики связаны с сессиями (session) и экспедицией (expedition_id).
+{QUALITY_NOTES[quality_mode]}
 Данные для анализа:
 
 NLP-метрики: {nlp_metrics_json}
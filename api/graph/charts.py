@@ -1,486 +1,331 @@
 from fastapi import Response, HTTPException
-import pandas as pd
-import matplotlib.pyplot as plt
+import asyncio
 import io
-from typing import Optional
-import numpy as np
+import json
+import uuid
+import zipfile
+from typing import List, Optional, Tuple
 
+import cache
+import singleflight
 from db.data_extraction import (
+    MetricFilter,
     get_nlp_metrics,
     get_physiological_metrics,
     get_cardio_metrics,
     get_productivity_metrics
 )
+from graph.pool import run_in_render
+
+# Источники данных графиков: одна таблица - одна функция выборки
+SOURCES = {
+    'nfb': get_nlp_metrics,
+    'physiological': get_physiological_metrics,
+    'cardio': get_cardio_metrics,
+    'productivity': get_productivity_metrics,
+}
+
+SOURCE_TABLES = {
+    'nfb': 'nfb_metrics',
+    'physiological': 'physiological_metrics',
+    'cardio': 'cardio_metrics',
+    'productivity': 'productivity_metrics',
+}
+
+# Графики участника: имя -> (источники данных, функция отрисовки в graph/render.py).
+# Функции указаны по имени: matplotlib и pandas импортируются только в процессах отрисовки
+CHARTS = {
+    'alpha-beta-theta': (('nfb',), 'render_alpha_beta_theta'),
+    'fatigue': (('physiological', 'productivity'), 'render_fatigue'),
+    'heart-rate': (('cardio',), 'render_heart_rate'),
+    'psychological-fatigue': (('physiological',), 'render_psychological_fatigue'),
+    'gravity': (('productivity',), 'render_gravity'),
+    'concentration': (('physiological', 'productivity'), 'render_concentration'),
+    'relaxation': (('physiological', 'productivity'), 'render_relaxation'),
+    'nfb': (('nfb',), 'render_nfb'),
+}
+
+BUNDLE_FORMATS = ('zip', 'multipart', 'sprite')
+
+
+def _png_response(content: bytes, filename: str = 'chart.png') -> Response:
+    return Response(
+        content=content,
+        media_type="image/png",
+        headers={"Content-Disposition": f"inline; filename={filename}"}
+    )
 
-plt.style.use('seaborn-v0_8-darkgrid')
-COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b']
 
-async def chart(
+async def _fetch_sources(
+        sources,
         individual_number: str,
-        expedition_id: Optional[int] = None
-) -> Response:
-
-    data = await get_nlp_metrics(individual_number, expedition_id)
-
-    if not data:
-        raise HTTPException(status_code=404, detail="Данные не найдены")
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
+) -> dict:
+    """
+    Выборка данных по каждой таблице ровно один раз
+    """
+    sources = sorted(set(sources))
+    results = await asyncio.gather(
+        *(SOURCES[source](individual_number, expedition_id, filters) for source in sources)
+    )
+    return dict(zip(sources, results))
 
-    df = pd.DataFrame(data)
 
-    session_avg = df.groupby('session')[['alpha', 'beta', 'theta']].mean().reset_index()
+async def render_chart(
+        name: str,
+        data: dict,
+        individual_number: str,
+        expedition_id: Optional[int] = None
+) -> bytes:
+    sources, func = CHARTS[name]
+    return await run_in_render(
+        func, *(data[source] for source in sources), individual_number, expedition_id
+    )
 
-    session_map = {1: 'утро', 2: 'день', 3: 'вечер'}
-    session_avg['Сеанс'] = session_avg['session'].map(session_map)
-    session_avg = session_avg.set_index('Сеанс')
-    session_avg = session_avg.reindex(['утро', 'день', 'вечер'])
 
-    fig, ax = plt.subplots(figsize=(10, 6))
+def has_chart_data(name: str, data: dict) -> bool:
+    sources, _ = CHARTS[name]
+    return any(data[source] for source in sources)
 
-    session_avg.plot(
-        kind='bar',
-        ax=ax,
-        color=['#4682b4', '#32cd32', '#ff69b4'],
-        width=0.75
-    )
 
-    for container in ax.containers:
-        ax.bar_label(container, fmt='%.2f', padding=3, fontsize=9)
+def _chart_key(
+        name: str,
+        individual_number: str,
+        expedition_id: Optional[int],
+        filters: Optional[MetricFilter]
+) -> str:
+    return cache.cache_key(name, individual_number, expedition_id, filters or MetricFilter())
 
-    ax.set_title('Средние значения мозговых волн по времени суток',
-                 fontsize=14, pad=15)
-    ax.set_xlabel('Время суток', fontsize=12)
-    ax.set_ylabel('Средняя амплитуда', fontsize=12)
-    ax.legend(['Alpha', 'Beta', 'Theta'], fontsize=11, loc='upper right')
-    ax.grid(True, axis='y', linestyle='--', alpha=0.7)
 
-    if expedition_id:
-        ax.set_title(f'Экспедиция #{expedition_id} - {ax.get_title()}',
-                     fontsize=14, pad=15)
+async def _chart_png(
+        name: str,
+        individual_number: str,
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None,
+        data: Optional[dict] = None
+) -> bytes:
+    """
+    PNG графика из общего кэша или отрисовка. Одновременные одинаковые запросы,
+    в том числе из пакетов графиков, рисуют график один раз.
+    data - уже выбранные источники (пакет графиков), иначе выбираются здесь
+    """
+    async def produce() -> bytes:
+        sources = data
+        if sources is None:
+            sources = await _fetch_sources(CHARTS[name][0], individual_number, expedition_id, filters)
 
-    plt.tight_layout()
+        if not has_chart_data(name, sources):
+            raise HTTPException(status_code=404, detail="Данные не найдены")
 
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-    buf.seek(0)
-    plt.close(fig)
+        return await render_chart(name, sources, individual_number, expedition_id)
 
-    return Response(
-        content=buf.getvalue(),
-        media_type="image/png",
-        headers={"Content-Disposition": "inline; filename=chart.png"}
-    )
+    key = _chart_key(name, individual_number, expedition_id, filters)
+    return await singleflight.run('chart', key, lambda: cache.cached('charts', key, produce))
 
 
-def _fig_to_response(fig) -> Response:
+async def _build_chart(
+        name: str,
+        individual_number: str,
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
+) -> Response:
+    return _png_response(await _chart_png(name, individual_number, expedition_id, filters))
 
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', dpi=150, bbox_inches='tight',
-                facecolor='white', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
 
-    return Response(
-        content=buf.getvalue(),
-        media_type="image/png",
-        headers={"Content-Disposition": "inline; filename=chart.png"}
-    )
+async def chart(
+        individual_number: str,
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
+) -> Response:
+    return await _build_chart('nfb', individual_number, expedition_id, filters)
 
 
 async def create_alpha_beta_theta_chart(
         individual_number: str,
-        expedition_id: Optional[int] = None
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
 ) -> Response:
     """
     График 1: Alpha, Beta, Theta волны (столбчатая диаграмма по времени суток)
     """
-    data = await get_nlp_metrics(individual_number, expedition_id)
-
-    if not data:
-        raise HTTPException(status_code=404, detail="Данные не найдены")
-
-    df = pd.DataFrame(data)
-
-    # Маппинг номеров сессий на названия времени суток
-    session_map = {1: 'утро', 2: 'день', 3: 'вечер'}
-
-    # Добавляем колонку с текстовыми названиями сессий
-    df['Сеанс'] = df['session'].map(session_map)
-
-    # Группируем по сеансам и считаем средние
-    brain_waves = df.groupby('Сеанс')[['alpha', 'beta', 'theta']].mean()
-
-    # Устанавливаем правильный порядок сеансов
-    brain_waves = brain_waves.reindex(['утро', 'день', 'вечер'])
-
-    # Создаем фигуру
-    fig, ax = plt.subplots(figsize=(10, 6))
-
-    # Строим столбчатую диаграмму
-    brain_waves.plot(
-        kind='bar',
-        ax=ax,
-        color=['#4682b4', '#32cd32', '#ff69b4'],
-        width=0.75
-    )
-
-    # Настройка графика
-    ax.set_title(
-        f'Средние значения мозговых волн по времени суток\nУчастник: {individual_number}',
-        fontsize=14,
-        pad=15
-    )
-    ax.set_xlabel('Время суток', fontsize=12)
-    ax.set_ylabel('Средняя амплитуда волн', fontsize=12)
-    ax.set_xticklabels(['Утро', 'День', 'Вечер'], rotation=0, fontsize=11)
-    ax.legend(['Alpha', 'Beta', 'Theta'], fontsize=11, loc='upper right')
-    ax.grid(True, axis='y', linestyle='--', alpha=0.7)
-
-    # Добавляем значения на столбцы
-    for container in ax.containers:
-        ax.bar_label(container, fmt='%.1f', padding=3, fontsize=9)
-
-    # Добавляем информацию об экспедиции если есть
-    if expedition_id:
-        ax.text(
-            0.02, 0.98,
-            f'Экспедиция: {expedition_id}',
-            transform=ax.transAxes,
-            fontsize=10,
-            verticalalignment='top',
-            bbox=dict(boxstyle='round', facecolor='white', alpha=0.8)
-        )
-
-    plt.tight_layout()
-
-    return _fig_to_response(fig)
+    return await _build_chart('alpha-beta-theta', individual_number, expedition_id, filters)
 
 
 async def create_fatigue_chart(
         individual_number: str,
-        expedition_id: Optional[int] = None
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
 ) -> Response:
     """
     График 2: Fatigue (утомление) по времени суток
     """
-    # Получаем данные из разных таблиц
-    physio_data = await get_physiological_metrics(individual_number, expedition_id)
-    product_data = await get_productivity_metrics(individual_number, expedition_id)
-
-    if not physio_data and not product_data:
-        raise HTTPException(status_code=404, detail="Данные не найдены")
-
-    # Маппинг номеров сессий на названия времени суток
-    session_map = {1: 'утро', 2: 'день', 3: 'вечер'}
-
-    fig, ax = plt.subplots(figsize=(10, 6))
-
-    # Физиологическое утомление
-    if physio_data:
-        df_physio = pd.DataFrame(physio_data)
-        df_physio['Сеанс'] = df_physio['session'].map(session_map)
-
-        # Группируем по сеансам и считаем средние
-        physio_fatigue = df_physio.groupby('Сеанс')['fatigue'].mean()
-        physio_fatigue = physio_fatigue.reindex(['утро', 'день', 'вечер'])
-
-        # Строим график
-        ax.plot(physio_fatigue.index, physio_fatigue.values,
-                marker='o', color='#1e90ff', linewidth=2, markersize=8,
-                label='Физиологическое утомление')
-
-        # Добавляем значения
-        for i, (idx, val) in enumerate(physio_fatigue.items()):
-            if pd.notna(val):
-                ax.text(i, val + 0.02, f'{val:.2f}',
-                        ha='center', va='bottom', fontsize=10)
-
-    # Утомление из продуктивности
-    if product_data:
-        df_product = pd.DataFrame(product_data)
-        df_product['Сеанс'] = df_product['session'].map(session_map)
-
-        # Группируем по сеансам и считаем средние
-        product_fatigue = df_product.groupby('Сеанс')['fatigue'].mean()
-        product_fatigue = product_fatigue.reindex(['утро', 'день', 'вечер'])
-
-        # Строим график
-        ax.plot(product_fatigue.index, product_fatigue.values,
-                marker='s', color='#ff6347', linewidth=2, markersize=8,
-                label='Утомление (продуктивность)')
-
-        # Добавляем значения
-        for i, (idx, val) in enumerate(product_fatigue.items()):
-            if pd.notna(val):
-                ax.text(i, val + 0.02, f'{val:.2f}',
-                        ha='center', va='bottom', fontsize=10, color='#ff6347')
-
-    # Настройка графика
-    ax.set_xlabel('Время суток', fontsize=12)
-    ax.set_ylabel('Средний уровень утомления', fontsize=12)
-    ax.set_ylim(0, 1)
-    ax.legend(fontsize=11, loc='upper left')
-    ax.grid(True, alpha=0.3)
-
-    ax.axhline(y=0.7, color='red', linestyle='--', alpha=0.5, label='Критический уровень (0.7)')
-
-    title = f'Динамика утомления по времени суток\nУчастник: {individual_number}'
-    if expedition_id:
-        title = f'Экспедиция #{expedition_id} - {title}'
-
-    ax.set_title(title, fontsize=14, pad=15)
-    plt.tight_layout()
-
-    return _fig_to_response(fig)
+    return await _build_chart('fatigue', individual_number, expedition_id, filters)
 
 
 async def create_heart_rate_chart(
         individual_number: str,
-        expedition_id: Optional[int] = None
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
 ) -> Response:
     """
     График 3: Heart Rate (частота сердечных сокращений) по времени суток
     """
-    data = await get_cardio_metrics(individual_number, expedition_id)
-
-    if not data:
-        raise HTTPException(status_code=404, detail="Данные не найдены")
-
-    df = pd.DataFrame(data)
-
-    # Маппинг номеров сессий на названия времени суток
-    session_map = {1: 'утро', 2: 'день', 3: 'вечер'}
-
-    # Добавляем колонку с названиями сеансов
-    df['Сеанс'] = df['session'].map(session_map)
-
-    # Группируем по сеансам и считаем средние
-    hr_by_session = df.groupby('Сеанс')['heart_rate'].mean()
-    hr_by_session = hr_by_session.reindex(['утро', 'день', 'вечер'])
-
-    # Строим график
-    fig, ax = plt.subplots(figsize=(10, 6))
-
-    # Основная линия
-    line = ax.plot(hr_by_session.index, hr_by_session.values,
-                   marker='o', color='#1e90ff', linewidth=2, markersize=10,
-                   label='Средняя ЧСС')[0]
-
-    # Добавляем значения
-    for i, (idx, val) in enumerate(hr_by_session.items()):
-        if pd.notna(val):
-            ax.text(i, val + 2, f'{val:.0f}',
-                    ha='center', va='bottom', fontsize=11, fontweight='bold')
-
-    # Зоны ЧСС - располагаем легенды в разных местах
-    norm_line = ax.axhline(y=60, color='green', linestyle='--', alpha=0.7, linewidth=1.5,
-                           label='Нижняя граница нормы (60)')
-
-    upper_norm_line = ax.axhline(y=80, color='orange', linestyle='--', alpha=0.7, linewidth=1.5,
-                                 label='Верхняя граница нормы (80)')
-
-    tachy_line = ax.axhline(y=100, color='red', linestyle='--', alpha=0.7, linewidth=1.5,
-                            label='Тахикардия (100)')
-
-    # Настройка осей
-    ax.set_xlabel('Время суток', fontsize=12)
-    ax.set_ylabel('Средняя ЧСС (уд/мин)', fontsize=12)
-    ax.set_xticklabels(['Утро', 'День', 'Вечер'], fontsize=11)
-    ax.grid(True, alpha=0.3)
-
-    # РАСПОЛАГАЕМ ЛЕГЕНДЫ В РАЗНЫХ МЕСТАХ
-    # Легенда для основной линии - вверху слева
-    first_legend = ax.legend(handles=[line], loc='upper left', fontsize=10, framealpha=0.9)
-    ax.add_artist(first_legend)
-
-    # Легенда для норм - внизу слева
-    ax.legend(handles=[norm_line, upper_norm_line, tachy_line],
-              loc='lower left', fontsize=9, framealpha=0.9,
-              title='Зоны ЧСС', title_fontsize=10)
-
-    # Статистика - вверху справа
-    stats_text = (
-        f"Среднее: {hr_by_session.mean():.1f}\n"
-        f"Мин: {df['heart_rate'].min():.1f}\n"
-        f"Макс: {df['heart_rate'].max():.1f}"
-    )
-
-    ax.text(0.98, 0.98, stats_text, transform=ax.transAxes, fontsize=10,
-            verticalalignment='top', horizontalalignment='right',
-            bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
-
-    title = f'Частота сердечных сокращений по времени суток\nУчастник: {individual_number}'
-    if expedition_id:
-        title = f'Экспедиция #{expedition_id} - {title}'
-
-    ax.set_title(title, fontsize=14, pad=15)
-    plt.tight_layout()
-
-    return _fig_to_response(fig)
+    return await _build_chart('heart-rate', individual_number, expedition_id, filters)
 
 
 async def create_psychological_fatigue_chart(
         individual_number: str,
-        expedition_id: Optional[int] = None
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
 ) -> Response:
     """
     График 4: Psychological Metrics Fatigue
     """
-    data = await get_physiological_metrics(individual_number, expedition_id)
-
-    if not data:
-        raise HTTPException(status_code=404, detail="Данные не найдены")
-
-    df = pd.DataFrame(data)
-    df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
-
-    fig, ax = plt.subplots(figsize=(12, 6))
-
-    ax.plot(df['datetime'], df['fatigue'],
-            marker='o', color=COLORS[0], linewidth=2, markersize=6,
-            label='Психологическое утомление')
-    ax.fill_between(df['datetime'], df['fatigue'], alpha=0.3, color=COLORS[0])
-
-    # Добавляем для сравнения другие метрики
-    if 'stress' in df.columns:
-        ax.plot(df['datetime'], df['stress'],
-                marker='s', color=COLORS[1], linewidth=2, markersize=6,
-                label='Стресс', alpha=0.7)
-
-    ax.set_xlabel('Время', fontsize=12)
-    ax.set_ylabel('Уровень', fontsize=12)
-    ax.legend(fontsize=11)
-    ax.grid(True, alpha=0.3)
-
-    title = f'Психологическое утомление\nУчастник: {individual_number}'
-    if expedition_id:
-        title = f'Экспедиция #{expedition_id} - {title}'
-
-    ax.set_title(title, fontsize=14, pad=15)
-    plt.tight_layout()
-
-    return _fig_to_response(fig)
+    return await _build_chart('psychological-fatigue', individual_number, expedition_id, filters)
 
 
 async def create_gravity_chart(
         individual_number: str,
-        expedition_id: Optional[int] = None
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
 ) -> Response:
     """
     График 5: Gravity (гравитация/вес?)
     """
-    data = await get_productivity_metrics(individual_number, expedition_id)
-
-    if not data:
-        raise HTTPException(status_code=404, detail="Данные не найдены")
-
-    df = pd.DataFrame(data)
-    df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
-
-    fig, ax = plt.subplots(figsize=(12, 6))
-
-    ax.plot(df['datetime'], df['gravity'],
-            marker='o', color=COLORS[0], linewidth=2, markersize=6)
-    ax.fill_between(df['datetime'], df['gravity'], alpha=0.3, color=COLORS[0])
-
-    ax.set_xlabel('Время', fontsize=12)
-    ax.set_ylabel('Gravity', fontsize=12)
-    ax.grid(True, alpha=0.3)
-
-    title = f'Gravity метрика\nУчастник: {individual_number}'
-    if expedition_id:
-        title = f'Экспедиция #{expedition_id} - {title}'
-
-    ax.set_title(title, fontsize=14, pad=15)
-    plt.tight_layout()
-
-    return _fig_to_response(fig)
+    return await _build_chart('gravity', individual_number, expedition_id, filters)
 
 
 async def create_concentration_chart(
         individual_number: str,
-        expedition_id: Optional[int] = None
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
 ) -> Response:
     """
     График 6: Concentration (концентрация) из разных источников
     """
-    # Получаем данные из разных таблиц
-    physio_data = await get_physiological_metrics(individual_number, expedition_id)
-    product_data = await get_productivity_metrics(individual_number, expedition_id)
+    return await _build_chart('concentration', individual_number, expedition_id, filters)
 
-    if not physio_data and not product_data:
-        raise HTTPException(status_code=404, detail="Данные не найдены")
 
-    fig, ax = plt.subplots(figsize=(12, 6))
+async def create_relaxation_chart(
+        individual_number: str,
+        expedition_id: Optional[int] = None,
+        filters: Optional[MetricFilter] = None
+) -> Response:
+    """
+    График 7: Relaxation (расслабление) из разных источников
+    """
+    return await _build_chart('relaxation', individual_number, expedition_id, filters)
 
-    if physio_data:
-        df_physio = pd.DataFrame(physio_data)
-        df_physio['datetime'] = pd.to_datetime(df_physio['timestamp'], unit='ms')
-        ax.plot(df_physio['datetime'], df_physio['concentration'],
-                marker='o', color=COLORS[0], linewidth=2, markersize=6,
-                label='Концентрация (физиологическая)')
 
-    if product_data:
-        df_product = pd.DataFrame(product_data)
-        df_product['datetime'] = pd.to_datetime(df_product['timestamp'], unit='ms')
-        ax.plot(df_product['datetime'], df_product['concentration'],
-                marker='s', color=COLORS[1], linewidth=2, markersize=6,
-                label='Концентрация (продуктивность)')
+def _zip_bundle(images: dict, missing: List[str]) -> Response:
+    buf = io.BytesIO()
+    # PNG уже сжат, поэтому складываем без повторного сжатия
+    with zipfile.ZipFile(buf, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, png in images.items():
+            archive.writestr(f'{name}.png', png)
+        archive.writestr('manifest.json', json.dumps(
+            {'charts': list(images), 'missing': missing}, ensure_ascii=False
+        ))
 
-    ax.set_xlabel('Время', fontsize=12)
-    ax.set_ylabel('Уровень концентрации', fontsize=12)
-    ax.legend(fontsize=11)
-    ax.grid(True, alpha=0.3)
+    return Response(
+        content=buf.getvalue(),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=dashboard.zip"}
+    )
 
-    title = f'Динамика концентрации\nУчастник: {individual_number}'
-    if expedition_id:
-        title = f'Экспедиция #{expedition_id} - {title}'
 
-    ax.set_title(title, fontsize=14, pad=15)
-    plt.tight_layout()
+def _multipart_bundle(images: dict, missing: List[str]) -> Response:
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for name, png in images.items():
+        body += (
+            f'--{boundary}\r\n'
+            f'Content-Type: image/png\r\n'
+            f'Content-Disposition: inline; name="{name}"; filename="{name}.png"\r\n'
+            f'Content-Length: {len(png)}\r\n\r\n'
+        ).encode()
+        body += png
+        body += b'\r\n'
+    body += f'--{boundary}--\r\n'.encode()
 
-    return _fig_to_response(fig)
+    return Response(
+        content=bytes(body),
+        media_type=f"multipart/mixed; boundary={boundary}",
+        headers={"X-Missing-Charts": ','.join(missing)}
+    )
 
 
-async def create_relaxation_chart(
+@singleflight.coalesce('bundle')
+async def _bundle_images(
         individual_number: str,
-        expedition_id: Optional[int] = None
-) -> Response:
-    """
-    График 7: Relaxation (расслабление) из разных источников
-    """
-    # Получаем данные из разных таблиц
-    physio_data = await get_physiological_metrics(individual_number, expedition_id)
-    product_data = await get_productivity_metrics(individual_number, expedition_id)
-
-    if not physio_data and not product_data:
-        raise HTTPException(status_code=404, detail="Данные не найдены")
+        expedition_id: Optional[int],
+        names: Tuple[str, ...],
+        filters: Optional[MetricFilter]
+) -> Tuple[dict, List[str]]:
+    keys = {name: _chart_key(name, individual_number, expedition_id, filters) for name in names}
+
+    # Графики, уже нарисованные этим или другим воркером, берутся из общего кэша
+    images = {}
+    if cache.cache_config.ttl > 0:
+        found = await asyncio.gather(
+            *(asyncio.to_thread(cache.get, 'charts', keys[name]) for name in names)
+        )
+        images = {name: png for name, png in zip(names, found) if png is not None}
 
-    fig, ax = plt.subplots(figsize=(12, 6))
+    pending = [name for name in names if name not in images]
+    data = await _fetch_sources(
+        (source for name in pending for source in CHARTS[name][0]),
+        individual_number, expedition_id, filters
+    )
 
-    if physio_data:
-        df_physio = pd.DataFrame(physio_data)
-        df_physio['datetime'] = pd.to_datetime(df_physio['timestamp'], unit='ms')
-        ax.plot(df_physio['datetime'], df_physio['relax'],
-                marker='o', color=COLORS[0], linewidth=2, markersize=6,
-                label='Расслабление (физиологическое)')
+    ready = [name for name in pending if has_chart_data(name, data)]
+    rendered = await asyncio.gather(
+        *(_chart_png(name, individual_number, expedition_id, filters, data) for name in ready)
+    )
+    images.update(zip(ready, rendered))
 
-    if product_data:
-        df_product = pd.DataFrame(product_data)
-        df_product['datetime'] = pd.to_datetime(df_product['timestamp'], unit='ms')
-        ax.plot(df_product['datetime'], df_product['relaxation'],
-                marker='s', color=COLORS[1], linewidth=2, markersize=6,
-                label='Расслабление (продуктивность)')
+    return (
+        {name: images[name] for name in names if name in images},
+        [name for name in names if name not in images]
+    )
 
-    ax.set_xlabel('Время', fontsize=12)
-    ax.set_ylabel('Уровень расслабления', fontsize=12)
-    ax.legend(fontsize=11)
-    ax.grid(True, alpha=0.3)
 
-    title = f'Динамика расслабления\nУчастник: {individual_number}'
-    if expedition_id:
-        title = f'Экспедиция #{expedition_id} - {title}'
+async def create_dashboard_bundle(
+        individual_number: str,
+        expedition_id: Optional[int] = None,
+        names: Optional[List[str]] = None,
+        fmt: str = 'zip',
+        filters: Optional[MetricFilter] = None
+) -> Response:
+    """
+    Все графики участника одним ответом: каждая таблица читается один раз,
+    графики рисуются параллельно в пуле процессов
+    """
+    names = names or list(CHARTS)
+    unknown = [name for name in names if name not in CHARTS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Неизвестные графики: {', '.join(unknown)}")
+    if fmt not in BUNDLE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Неизвестный формат: {fmt}")
+
+    names = tuple(dict.fromkeys(names))
+    images, missing = await _bundle_images(individual_number, expedition_id, names, filters)
+    if not images:
+        raise HTTPException(status_code=404, detail="Данные не найдены")
 
-    ax.set_title(title, fontsize=14, pad=15)
-    plt.tight_layout()
+    ready = list(images)
+    pngs = list(images.values())
 
-    return _fig_to_response(fig)
\ No newline at end of file
+    if fmt == 'multipart':
+        return _multipart_bundle(images, missing)
+    if fmt == 'sprite':
+        sprite = await singleflight.run(
+            'sprite', (individual_number, expedition_id, tuple(ready), filters),
+            lambda: run_in_render('render_sprite', pngs)
+        )
+        response = _png_response(sprite, 'dashboard.png')
+        response.headers['X-Sprite-Order'] = ','.join(ready)
+        response.headers['X-Missing-Charts'] = ','.join(missing)
+        return response
+    return _zip_bundle(images, missing)
@@ -0,0 +1,85 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import profiling
+from config import load_config
+
+# Пул процессов для отрисовки графиков: pyplot хранит глобальное состояние
+# и не потокобезопасен, поэтому каждый график рисуется в отдельном процессе
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _warmup() -> None:
+    import graph.render  # noqa: F401
+
+
+def _ping() -> int:
+    # Задержка, чтобы каждое задание прогрева досталось отдельному процессу
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=load_config().render_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_warmup
+        )
+    return _pool
+
+
+async def run_in_render_pool(func, *args):
+    """
+    Выполнение функции отрисовки в пуле процессов
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_render_pool(), func, *args)
+
+
+def _call_render(name: str, *args):
+    from graph import render
+    return getattr(render, name)(*args)
+
+
+def _call_render_profiled(name: str, *args):
+    result, stacks = profiling.profile_call(_call_render, name, *args)
+    return result, stacks, os.getpid()
+
+
+async def run_in_render(name: str, *args):
+    """
+    Вызов функции graph/render.py по имени в пуле процессов: основной процесс
+    не импортирует matplotlib и pandas. В профилируемом запросе стеки процесса
+    отрисовки добавляются в его профиль
+    """
+    capture = profiling.current()
+    if capture is None:
+        return await run_in_render_pool(_call_render, name, *args)
+
+    result, stacks, pid = await run_in_render_pool(_call_render_profiled, name, *args)
+    capture.merge(stacks, f'render-{pid}')
+    return result
+
+
+async def warmup_render_pool() -> int:
+    """
+    Запуск всех процессов пула до приёма запросов: первый график
+    не ждёт старта интерпретатора и импорта matplotlib
+    """
+    pids = await asyncio.gather(
+        *(run_in_render_pool(_ping) for _ in range(load_config().render_workers))
+    )
+    return len(set(pids))
+
+
+def shutdown_render_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,477 @@
+import io
+from typing import Any, Dict, List, Optional
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.image as mpimg
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+plt.style.use('seaborn-v0_8-darkgrid')
+COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b']
+
+# Маппинг номеров сессий на названия времени суток
+SESSION_MAP = {1: 'утро', 2: 'день', 3: 'вечер'}
+SESSION_ORDER = ['утро', 'день', 'вечер']
+
+Rows = List[Dict[str, Any]]
+
+
+def _frame(data: Rows) -> pd.DataFrame:
+    # Все колонки таблиц метрик числовые; пустые (NULL) колонки приводим к NaN,
+    # иначе pandas оставляет их типа object и matplotlib не может их отрисовать
+    return pd.DataFrame(data).apply(pd.to_numeric, errors='coerce')
+
+
+def _session_mean(df: pd.DataFrame, key: str, columns: List[str]) -> pd.DataFrame:
+    """
+    Средние по сеансам; если у сэмплов есть вес качества (weight) - взвешенные
+    """
+    if 'weight' not in df:
+        return df.groupby(key)[columns].mean()
+
+    values = df[columns]
+    weights = values.notna().mul(df['weight'], axis=0)
+    sums = values.mul(df['weight'], axis=0).groupby(df[key]).sum(min_count=1)
+    total = weights.groupby(df[key]).sum()
+    return sums / total.where(total > 0)
+
+
+def _fig_to_png(fig, **kwargs) -> bytes:
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=150, bbox_inches='tight', **kwargs)
+    plt.close(fig)
+
+    return buf.getvalue()
+
+
+def _fig_to_white_png(fig) -> bytes:
+    return _fig_to_png(fig, facecolor='white', edgecolor='none')
+
+
+def render_nfb(
+        data: Rows,
+        individual_number: str,
+        expedition_id: Optional[int] = None
+) -> bytes:
+    """
+    Мозговые волны по сеансам (для обратной совместимости)
+    """
+    df = _frame(data)
+
+    session_avg = _session_mean(df, 'session', ['alpha', 'beta', 'theta']).reset_index()
+
+    session_avg['Сеанс'] = session_avg['session'].map(SESSION_MAP)
+    session_avg = session_avg.set_index('Сеанс')
+    session_avg = session_avg.reindex(SESSION_ORDER)
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    session_avg.plot(
+        kind='bar',
+        ax=ax,
+        color=['#4682b4', '#32cd32', '#ff69b4'],
+        width=0.75
+    )
+
+    for container in ax.containers:
+        ax.bar_label(container, fmt='%.2f', padding=3, fontsize=9)
+
+    ax.set_title('Средние значения мозговых волн по времени суток',
+                 fontsize=14, pad=15)
+    ax.set_xlabel('Время суток', fontsize=12)
+    ax.set_ylabel('Средняя амплитуда', fontsize=12)
+    ax.legend(['Alpha', 'Beta', 'Theta'], fontsize=11, loc='upper right')
+    ax.grid(True, axis='y', linestyle='--', alpha=0.7)
+
+    if expedition_id:
+        ax.set_title(f'Экспедиция #{expedition_id} - {ax.get_title()}',
+                     fontsize=14, pad=15)
+
+    plt.tight_layout()
+
+    return _fig_to_png(fig)
+
+
+def render_alpha_beta_theta(
+        data: Rows,
+        individual_number: str,
+        expedition_id: Optional[int] = None
+) -> bytes:
+    """
+    График 1: Alpha, Beta, Theta волны (столбчатая диаграмма по времени суток)
+    """
+    df = _frame(data)
+
+    # Добавляем колонку с текстовыми названиями сессий
+    df['Сеанс'] = df['session'].map(SESSION_MAP)
+
+    # Группируем по сеансам и считаем средние
+    brain_waves = _session_mean(df, 'Сеанс', ['alpha', 'beta', 'theta'])
+
+    # Устанавливаем правильный порядок сеансов
+    brain_waves = brain_waves.reindex(SESSION_ORDER)
+
+    # Создаем фигуру
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    # Строим столбчатую диаграмму
+    brain_waves.plot(
+        kind='bar',
+        ax=ax,
+        color=['#4682b4', '#32cd32', '#ff69b4'],
+        width=0.75
+    )
+
+    # Настройка графика
+    ax.set_title(
+        f'Средние значения мозговых волн по времени суток\nУчастник: {individual_number}',
+        fontsize=14,
+        pad=15
+    )
+    ax.set_xlabel('Время суток', fontsize=12)
+    ax.set_ylabel('Средняя амплитуда волн', fontsize=12)
+    ax.set_xticklabels(['Утро', 'День', 'Вечер'], rotation=0, fontsize=11)
+    ax.legend(['Alpha', 'Beta', 'Theta'], fontsize=11, loc='upper right')
+    ax.grid(True, axis='y', linestyle='--', alpha=0.7)
+
+    # Добавляем значения на столбцы
+    for container in ax.containers:
+        ax.bar_label(container, fmt='%.1f', padding=3, fontsize=9)
+
+    # Добавляем информацию об экспедиции если есть
+    if expedition_id:
+        ax.text(
+            0.02, 0.98,
+            f'Экспедиция: {expedition_id}',
+            transform=ax.transAxes,
+            fontsize=10,
+            verticalalignment='top',
+            bbox=dict(boxstyle='round', facecolor='white', alpha=0.8)
+        )
+
+    plt.tight_layout()
+
+    return _fig_to_white_png(fig)
+
+
+def render_fatigue(
+        physio_data: Rows,
+        product_data: Rows,
+        individual_number: str,
+        expedition_id: Optional[int] = None
+) -> bytes:
+    """
+    График 2: Fatigue (утомление) по времени суток
+    """
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    # Физиологическое утомление
+    if physio_data:
+        df_physio = _frame(physio_data)
+        df_physio['Сеанс'] = df_physio['session'].map(SESSION_MAP)
+
+        # Группируем по сеансам и считаем средние
+        physio_fatigue = _session_mean(df_physio, 'Сеанс', ['fatigue'])['fatigue']
+        physio_fatigue = physio_fatigue.reindex(SESSION_ORDER)
+
+        # Строим график
+        ax.plot(physio_fatigue.index, physio_fatigue.values,
+                marker='o', color='#1e90ff', linewidth=2, markersize=8,
+                label='Физиологическое утомление')
+
+        # Добавляем значения
+        for i, (idx, val) in enumerate(physio_fatigue.items()):
+            if pd.notna(val):
+                ax.text(i, val + 0.02, f'{val:.2f}',
+                        ha='center', va='bottom', fontsize=10)
+
+    # Утомление из продуктивности
+    if product_data:
+        df_product = _frame(product_data)
+        df_product['Сеанс'] = df_product['session'].map(SESSION_MAP)
+
+        # Группируем по сеансам и считаем средние
+        product_fatigue = _session_mean(df_product, 'Сеанс', ['fatigue'])['fatigue']
+        product_fatigue = product_fatigue.reindex(SESSION_ORDER)
+
+        # Строим график
+        ax.plot(product_fatigue.index, product_fatigue.values,
+                marker='s', color='#ff6347', linewidth=2, markersize=8,
+                label='Утомление (продуктивность)')
+
+        # Добавляем значения
+        for i, (idx, val) in enumerate(product_fatigue.items()):
+            if pd.notna(val):
+                ax.text(i, val + 0.02, f'{val:.2f}',
+                        ha='center', va='bottom', fontsize=10, color='#ff6347')
+
+    # Настройка графика
+    ax.set_xlabel('Время суток', fontsize=12)
+    ax.set_ylabel('Средний уровень утомления', fontsize=12)
+    ax.set_ylim(0, 1)
+    ax.legend(fontsize=11, loc='upper left')
+    ax.grid(True, alpha=0.3)
+
+    ax.axhline(y=0.7, color='red', linestyle='--', alpha=0.5, label='Критический уровень (0.7)')
+
+    title = f'Динамика утомления по времени суток\nУчастник: {individual_number}'
+    if expedition_id:
+        title = f'Экспедиция #{expedition_id} - {title}'
+
+    ax.set_title(title, fontsize=14, pad=15)
+    plt.tight_layout()
+
+    return _fig_to_white_png(fig)
+
+
+def render_heart_rate(
+        data: Rows,
+        individual_number: str,
+        expedition_id: Optional[int] = None
+) -> bytes:
+    """
+    График 3: Heart Rate (частота сердечных сокращений) по времени суток
+    """
+    df = _frame(data)
+
+    # Добавляем колонку с названиями сеансов
+    df['Сеанс'] = df['session'].map(SESSION_MAP)
+
+    # Группируем по сеансам и считаем средние
+    hr_by_session = _session_mean(df, 'Сеанс', ['heart_rate'])['heart_rate']
+    hr_by_session = hr_by_session.reindex(SESSION_ORDER)
+
+    # Строим график
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    # Основная линия
+    line = ax.plot(hr_by_session.index, hr_by_session.values,
+                   marker='o', color='#1e90ff', linewidth=2, markersize=10,
+                   label='Средняя ЧСС')[0]
+
+    # Добавляем значения
+    for i, (idx, val) in enumerate(hr_by_session.items()):
+        if pd.notna(val):
+            ax.text(i, val + 2, f'{val:.0f}',
+                    ha='center', va='bottom', fontsize=11, fontweight='bold')
+
+    # Зоны ЧСС - располагаем легенды в разных местах
+    norm_line = ax.axhline(y=60, color='green', linestyle='--', alpha=0.7, linewidth=1.5,
+                           label='Нижняя граница нормы (60)')
+
+    upper_norm_line = ax.axhline(y=80, color='orange', linestyle='--', alpha=0.7, linewidth=1.5,
+                                 label='Верхняя граница нормы (80)')
+
+    tachy_line = ax.axhline(y=100, color='red', linestyle='--', alpha=0.7, linewidth=1.5,
+                            label='Тахикардия (100)')
+
+    # Настройка осей
+    ax.set_xlabel('Время суток', fontsize=12)
+    ax.set_ylabel('Средняя ЧСС (уд/мин)', fontsize=12)
+    ax.set_xticklabels(['Утро', 'День', 'Вечер'], fontsize=11)
+    ax.grid(True, alpha=0.3)
+
+    # РАСПОЛАГАЕМ ЛЕГЕНДЫ В РАЗНЫХ МЕСТАХ
+    # Легенда для основной линии - вверху слева
+    first_legend = ax.legend(handles=[line], loc='upper left', fontsize=10, framealpha=0.9)
+    ax.add_artist(first_legend)
+
+    # Легенда для норм - внизу слева
+    ax.legend(handles=[norm_line, upper_norm_line, tachy_line],
+              loc='lower left', fontsize=9, framealpha=0.9,
+              title='Зоны ЧСС', title_fontsize=10)
+
+    # Статистика - вверху справа
+    stats_text = (
+        f"Среднее: {hr_by_session.mean():.1f}\n"
+        f"Мин: {df['heart_rate'].min():.1f}\n"
+        f"Макс: {df['heart_rate'].max():.1f}"
+    )
+
+    ax.text(0.98, 0.98, stats_text, transform=ax.transAxes, fontsize=10,
+            verticalalignment='top', horizontalalignment='right',
+            bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
+
+    title = f'Частота сердечных сокращений по времени суток\nУчастник: {individual_number}'
+    if expedition_id:
+        title = f'Экспедиция #{expedition_id} - {title}'
+
+    ax.set_title(title, fontsize=14, pad=15)
+    plt.tight_layout()
+
+    return _fig_to_white_png(fig)
+
+
+def render_psychological_fatigue(
+        data: Rows,
+        individual_number: str,
+        expedition_id: Optional[int] = None
+) -> bytes:
+    """
+    График 4: Psychological Metrics Fatigue
+    """
+    df = _frame(data)
+    df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+
+    ax.plot(df['datetime'], df['fatigue'],
+            marker='o', color=COLORS[0], linewidth=2, markersize=6,
+            label='Психологическое утомление')
+    ax.fill_between(df['datetime'], df['fatigue'], alpha=0.3, color=COLORS[0])
+
+    # Добавляем для сравнения другие метрики
+    if 'stress' in df.columns:
+        ax.plot(df['datetime'], df['stress'],
+                marker='s', color=COLORS[1], linewidth=2, markersize=6,
+                label='Стресс', alpha=0.7)
+
+    ax.set_xlabel('Время', fontsize=12)
+    ax.set_ylabel('Уровень', fontsize=12)
+    ax.legend(fontsize=11)
+    ax.grid(True, alpha=0.3)
+
+    title = f'Психологическое утомление\nУчастник: {individual_number}'
+    if expedition_id:
+        title = f'Экспедиция #{expedition_id} - {title}'
+
+    ax.set_title(title, fontsize=14, pad=15)
+    plt.tight_layout()
+
+    return _fig_to_white_png(fig)
+
+
+def render_gravity(
+        data: Rows,
+        individual_number: str,
+        expedition_id: Optional[int] = None
+) -> bytes:
+    """
+    График 5: Gravity (гравитация/вес?)
+    """
+    df = _frame(data)
+    df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+
+    ax.plot(df['datetime'], df['gravity'],
+            marker='o', color=COLORS[0], linewidth=2, markersize=6)
+    ax.fill_between(df['datetime'], df['gravity'], alpha=0.3, color=COLORS[0])
+
+    ax.set_xlabel('Время', fontsize=12)
+    ax.set_ylabel('Gravity', fontsize=12)
+    ax.grid(True, alpha=0.3)
+
+    title = f'Gravity метрика\nУчастник: {individual_number}'
+    if expedition_id:
+        title = f'Экспедиция #{expedition_id} - {title}'
+
+    ax.set_title(title, fontsize=14, pad=15)
+    plt.tight_layout()
+
+    return _fig_to_white_png(fig)
+
+
+def _render_two_sources(
+        physio_data: Rows,
+        product_data: Rows,
+        physio_column: str,
+        product_column: str,
+        labels: tuple,
+        ylabel: str,
+        title: str
+) -> bytes:
+    fig, ax = plt.subplots(figsize=(12, 6))
+
+    if physio_data:
+        df_physio = _frame(physio_data)
+        df_physio['datetime'] = pd.to_datetime(df_physio['timestamp'], unit='ms')
+        ax.plot(df_physio['datetime'], df_physio[physio_column],
+                marker='o', color=COLORS[0], linewidth=2, markersize=6,
+                label=labels[0])
+
+    if product_data:
+        df_product = _frame(product_data)
+        df_product['datetime'] = pd.to_datetime(df_product['timestamp'], unit='ms')
+        ax.plot(df_product['datetime'], df_product[product_column],
+                marker='s', color=COLORS[1], linewidth=2, markersize=6,
+                label=labels[1])
+
+    ax.set_xlabel('Время', fontsize=12)
+    ax.set_ylabel(ylabel, fontsize=12)
+    ax.legend(fontsize=11)
+    ax.grid(True, alpha=0.3)
+
+    ax.set_title(title, fontsize=14, pad=15)
+    plt.tight_layout()
+
+    return _fig_to_white_png(fig)
+
+
+def render_concentration(
+        physio_data: Rows,
+        product_data: Rows,
+        individual_number: str,
+        expedition_id: Optional[int] = None
+) -> bytes:
+    """
+    График 6: Concentration (концентрация) из разных источников
+    """
+    title = f'Динамика концентрации\nУчастник: {individual_number}'
+    if expedition_id:
+        title = f'Экспедиция #{expedition_id} - {title}'
+
+    return _render_two_sources(
+        physio_data, product_data,
+        'concentration', 'concentration',
+        ('Концентрация (физиологическая)', 'Концентрация (продуктивность)'),
+        'Уровень концентрации',
+        title
+    )
+
+
+def render_relaxation(
+        physio_data: Rows,
+        product_data: Rows,
+        individual_number: str,
+        expedition_id: Optional[int] = None
+) -> bytes:
+    """
+    График 7: Relaxation (расслабление) из разных источников
+    """
+    title = f'Динамика расслабления\nУчастник: {individual_number}'
+    if expedition_id:
+        title = f'Экспедиция #{expedition_id} - {title}'
+
+    return _render_two_sources(
+        physio_data, product_data,
+        'relax', 'relaxation',
+        ('Расслабление (физиологическое)', 'Расслабление (продуктивность)'),
+        'Уровень расслабления',
+        title
+    )
+
+
+def render_sprite(images: List[bytes]) -> bytes:
+    """
+    Склейка нескольких PNG в один вертикальный спрайт
+    """
+    frames = [mpimg.imread(io.BytesIO(png), format='png') for png in images]
+    width = max(frame.shape[1] for frame in frames)
+
+    # Дополняем кадры белыми полями до общей ширины
+    padded = []
+    for frame in frames:
+        if frame.shape[2] == 3:
+            frame = np.dstack([frame, np.ones(frame.shape[:2], dtype=frame.dtype)])
+        canvas = np.ones((frame.shape[0], width, 4), dtype=frame.dtype)
+        canvas[:, :frame.shape[1]] = frame
+        padded.append(canvas)
+
+    buf = io.BytesIO()
+    plt.imsave(buf, np.vstack(padded), format='png')
+
+    return buf.getvalue()
@@ -1,22 +1,120 @@
-from fastapi import FastAPI, Query
+import asyncio
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+from typing import Optional
 
-from db.database import init_models, async_engine
+import admission
+import cache
+import profiling
+import singleflight
+import startup_profile
+from config import load_config
+from db import checks, store
+from db.database import init_models, async_engine, ping
+from db.partitions import create_active_partitions
+from graph.pool import shutdown_render_pool, warmup_render_pool
+from routes.admin import admin
 from routes.metrics import metrics
 from routes.expedition import expedition
 from routes.gigachat_routes import gigachat_router
+from routes.reports import reports
+from reports.jobs import start_report_workers, stop_report_workers
+
+# Пути, которые отвечают до окончания прогрева
+WARMUP_EXEMPT = ("/health", "/ready", "/", "/stats")
+
+warmup_attempts = load_config().warmup_attempts
+
+_warmup: Optional[asyncio.Task] = None
+
+
+async def _warmup_step(name: str, step) -> None:
+    """
+    Шаг прогрева с повторами: база или процессы отрисовки могут подняться не сразу
+    """
+    delay = 1
+    for attempt in range(1, warmup_attempts + 1):
+        try:
+            with startup_profile.step(name):
+                return await step()
+        except Exception as e:
+            if attempt == warmup_attempts:
+                raise
+            print(f"Ошибка прогрева ({name}), попытка {attempt} из {warmup_attempts}, повтор через {delay} с:", e)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 30)
+
+
+async def _create_partitions() -> None:
+    try:
+        await asyncio.to_thread(create_active_partitions)
+    except Exception as e:
+        print("Ошибка при создании секций:", e)
+
+
+async def warmup():
+    """
+    Прогрев воркера: отражение схемы, секции, первое соединение с базой,
+    процессы отрисовки, обработчики отчётов
+    """
+    try:
+        await _warmup_step("отражение схемы", lambda: asyncio.to_thread(init_models))
+        await _warmup_step("секции", _create_partitions)
+        await _warmup_step("соединение с базой", ping)
+        await _warmup_step("пул отрисовки", warmup_render_pool)
+        await _warmup_step("обработчики отчётов", start_report_workers)
+    except Exception as e:
+        print("Ошибка прогрева:", e)
+        raise
+
+
+def _warmup_error() -> Optional[BaseException]:
+    if _warmup.cancelled():
+        return asyncio.CancelledError()
+    return _warmup.exception()
+
 
 @asynccontextmanager
 async def lifespan(app):
-    init_models()
+    # Прогрев идёт в фоне: /health отвечает сразу после старта воркера,
+    # остальные запросы ждут окончания прогрева (см. wait_for_warmup)
+    global _warmup
+    _warmup = asyncio.create_task(warmup())
+    pruner = asyncio.create_task(cache.run_pruner(max(cache.cache_config.ttl, 60)))
     yield
+    # Остановка: uvicorn уже перестал принимать соединения и дождался текущих
+    # запросов (--timeout-graceful-shutdown); незавершённые отчёты подхватят другие воркеры
+    pruner.cancel()
+    _warmup.cancel()
+    await asyncio.gather(_warmup, return_exceptions=True)
+    await stop_report_workers()
+    await asyncio.to_thread(shutdown_render_pool)
     await async_engine.dispose()
 
 app = FastAPI(lifespan=lifespan)
 
+
+@app.middleware("http")
+async def wait_for_warmup(request: Request, call_next):
+    if request.url.path not in WARMUP_EXEMPT:
+        if not _warmup.done():
+            await asyncio.wait({_warmup})
+        if _warmup_error() is not None:
+            return JSONResponse(status_code=503, content={"detail": "Сервис не готов"})
+    return await call_next(request)
+
+
+# Профиль - без ожидания в очереди контроля нагрузки, но с ожиданием прогрева
+app.add_middleware(profiling.ProfilingMiddleware)
+# Добавлен последним - внешний слой: отказ по лимитам до ожидания прогрева и маршрутизации
+app.add_middleware(admission.AdmissionMiddleware)
+
 app.include_router(metrics, prefix="/api/metrics")
 app.include_router(expedition, prefix="/api/expedition")
 app.include_router(gigachat_router, prefix="/api/giga")
+app.include_router(reports, prefix="/api/reports")
+app.include_router(admin, prefix="/api/admin")
 
 
 @app.get("/")
@@ -25,7 +123,9 @@ async def root():
         "message": "Arctic Analytics Service",
         "endpoints": {
             "Базовые": {
-                "/health": "Проверка здоровья сервиса"
+                "/health": "Проверка здоровья сервиса",
+                "/ready": "Готовность воркера (прогрев завершён)",
+                "/stats": "Счётчики объединённых запросов, контроля нагрузки и хранилища метрик воркера"
             },
             "Графики по участнику": {
                 "/api/metrics/alpha-beta-theta/{ind_num}/{expedition_id}": "Alpha, Beta, Theta волны",
@@ -34,14 +134,56 @@ async def root():
                 "/api/metrics/psychological-fatigue/{ind_num}/{expedition_id}": "Психологическое утомление",
                 "/api/metrics/gravity/{ind_num}/{expedition_id}": "Gravity метрика",
                 "/api/metrics/concentration/{ind_num}/{expedition_id}": "Концентрация",
-                "/api/metrics/relaxation/{ind_num}/{expedition_id}": "Расслабление"
+                "/api/metrics/relaxation/{ind_num}/{expedition_id}": "Расслабление",
+                "/api/metrics/bundle/{ind_num}/{expedition_id}": "Все графики одним ответом (zip, multipart, sprite)"
+            },
+            "Эмоциональные метрики": {
+                "/api/metrics/emotional/{ind_num}/{expedition_id}": "Метрики участника по колонкам",
+                "/api/metrics/emotional/{ind_num}/{expedition_id}/sessions": "Сводка участника по сеансам",
+                "/api/metrics/emotional/{ind_num}/{expedition_id}/daily": "Сводка участника по суткам",
+                "/api/expedition/{expedition_id}/emotional/sessions": "Сводка экспедиции по сеансам",
+                "/api/expedition/{expedition_id}/emotional/daily": "Сводка экспедиции по суткам"
             },
             "Агрегированные": {
-                "/api/expedition/{expedition_id}/stress": "Стресс по экспедиции"
+                "/api/expedition/{expedition_id}/stress": "Стресс по экспедиции",
+                "POST /api/expedition/{expedition_id}/archive": "Перенос завершённой экспедиции в Parquet"
+            },
+            "Отчёты": {
+                "POST /api/reports/": "Поставить в очередь отчёт по экспедиции",
+                "/api/reports/{job_id}": "Прогресс задания",
+                "/api/reports/{job_id}/download": "Скачать архив отчёта"
+            },
+            "Администрирование": {
+                "/api/admin/profiles": "Профили медленных запросов (PROFILING=1)",
+                "/api/admin/profiles/{profile_id}": "SQL и EXPLAIN ANALYZE запроса",
+                "/api/admin/profiles/{profile_id}/flamegraph.svg": "Флеймграф запроса",
+                "/api/admin/profiles/{profile_id}/stacks.txt": "Collapsed stacks"
             }
         }
     }
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    # Прогрев не удался после всех попыток - воркер не поднимется сам, его нужно перезапустить
+    if _warmup.done() and _warmup_error() is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": str(_warmup_error())})
+    return {"status": "healthy"}
+
+@app.get("/stats")
+async def stats():
+    """Счётчики объединения одинаковых запросов, контроля нагрузки, хранилища метрик
+    и кэша проверок качества в этом воркере"""
+    return {
+        "singleflight": singleflight.snapshot(),
+        "admission": admission.snapshot(),
+        "store": store.snapshot(),
+        "quality": checks.snapshot()
+    }
+
+@app.get("/ready")
+async def ready_check():
+    if not _warmup.done():
+        return JSONResponse(status_code=503, content={"status": "warming up"})
+    if _warmup_error() is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": str(_warmup_error())})
+    return {"status": "ready"}
\ No newline at end of file
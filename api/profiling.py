@@ -0,0 +1,432 @@
+import asyncio
+import hmac
+import html
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, deque
+from contextvars import ContextVar
+from itertools import count
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from config import load_config
+
+# Профилирование запросов из реального трафика (PROFILING=1):
+#   - пока запрос выполняется, поток-сэмплер каждые PROFILE_INTERVAL_MS снимает стеки
+#     потока цикла событий и занятых потоков to_thread; отрисовка в пуле процессов
+#     профилируется своим сэмплером внутри процесса (см. graph/pool.py);
+#   - SQL-запросы get_*_metrics, выполненные в запросе, запоминаются (record_query);
+#   - если запрос дольше PROFILE_SLOW_MS (или пришёл с X-Profile: 1 и X-Admin-Token), после
+#     ответа выполняется EXPLAIN ANALYZE его SQL и снимок сохраняется в PROFILE_DIR:
+#     meta.json, stacks.txt (collapsed stacks для flamegraph.pl / speedscope), flamegraph.svg.
+#     EXPLAIN ANALYZE повторно выполняет запросы, поэтому медленных снимков не больше
+#     PROFILE_MAX_CAPTURES в минуту на воркер и не больше MAX_PENDING_SAVES сохраняются
+#     одновременно; остальные медленные запросы при перегрузке не снимаются.
+# Снимки читаются через /api/admin/profiles. Поток цикла событий общий для всех запросов
+# воркера: concurrent в meta.json - сколько ещё профилируемых запросов шло одновременно
+profile_config = load_config().profiling
+
+LOOP_THREAD = 'event-loop'
+
+IDLE_FRAME = '<ожидание_ввода-вывода>'
+
+# Кадры, на которых стоят простаивающие потоки: ожидание в модулях синхронизации
+# и свободный поток to_thread (ждёт задание в C-реализации очереди)
+_IDLE_FILES = ('threading.py', 'queue.py', 'selectors.py')
+_IDLE_FRAMES = (('thread.py', '_worker'),)
+
+# X-Profile: 1 сохраняет снимок независимо от длительности - только вместе
+# с верным X-Admin-Token; без ADMIN_TOKEN заголовок не действует
+FORCE_HEADER = b'x-profile'
+ADMIN_HEADER = b'x-admin-token'
+admin_token = load_config().admin_token
+
+# Служебные пути не профилируются
+EXEMPT_PREFIXES = ('/health', '/ready', '/stats', '/api/admin/', '/docs', '/openapi.json')
+
+_current: ContextVar[Optional['Capture']] = ContextVar('profile_capture', default=None)
+
+_active: Set['Capture'] = set()
+_lock = threading.Lock()
+_wake = threading.Event()
+_sampler: Optional[threading.Thread] = None
+_ids = count()
+_pending: Set[asyncio.Task] = set()
+# Время (time.monotonic()) медленных снимков за последнюю минуту
+_recent: Deque[float] = deque()
+
+MAX_PENDING_SAVES = 2
+
+
+def _label(name: str) -> str:
+    # В collapsed stacks пробел отделяет число снимков, ';' - кадры
+    return name.replace(' ', '_').replace(';', '_')
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return _label(f'{os.path.basename(code.co_filename)}:{code.co_qualname}')
+
+
+def _fold(frame) -> List[str]:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_name(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _is_idle(frame) -> bool:
+    filename = os.path.basename(frame.f_code.co_filename)
+    return filename in _IDLE_FILES or (filename, frame.f_code.co_name) in _IDLE_FRAMES
+
+
+def sample_threads(loop_thread: Optional[int], skip: int) -> Counter:
+    """
+    Один снимок стеков: {"поток;кадр;...;кадр": 1}. Простаивающие потоки пропускаются,
+    простой цикла событий сворачивается в один кадр
+    """
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks: Counter = Counter()
+    for ident, frame in sys._current_frames().items():
+        if ident == skip:
+            continue
+        if ident == loop_thread:
+            stack = [LOOP_THREAD, IDLE_FRAME] if _is_idle(frame) else [LOOP_THREAD, *_fold(frame)]
+        elif _is_idle(frame):
+            continue
+        else:
+            stack = [_label(names.get(ident, str(ident))), *_fold(frame)]
+        stacks[';'.join(stack)] += 1
+    return stacks
+
+
+class Capture:
+    """
+    Профиль одного запроса
+    """
+
+    def __init__(self, method: str, path: str, query: str, force: bool):
+        self.id = f'{int(time.time() * 1000)}-{os.getpid()}-{next(_ids)}'
+        self.method = method
+        self.path = path
+        self.query = query
+        self.force = force
+        self.loop_thread = threading.get_ident()
+        self.started = time.time()
+        self.duration = 0.0
+        self.status: Optional[int] = None
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.concurrent = 0
+        self.statements: Dict[str, Any] = {}
+
+    def add(self, stacks: Counter, concurrent: int) -> None:
+        self.stacks.update(stacks)
+        self.samples += 1
+        self.concurrent = max(self.concurrent, concurrent)
+
+    def merge(self, stacks: Dict[str, int], root: str) -> None:
+        for stack, n in stacks.items():
+            self.stacks[f'{root};{stack}'] += n
+
+    @property
+    def slow(self) -> bool:
+        return self.force or self.duration * 1000 >= profile_config.slow_ms
+
+
+def _run_sampler() -> None:
+    own = threading.get_ident()
+    interval = profile_config.interval_ms / 1000
+    while True:
+        _wake.wait()
+        time.sleep(interval)
+        with _lock:
+            captures = list(_active)
+            if not captures:
+                _wake.clear()
+                continue
+        stacks = sample_threads(captures[0].loop_thread, own)
+        for capture in captures:
+            capture.add(stacks, len(captures) - 1)
+
+
+def profile_call(func, *args):
+    """
+    func(*args) под сэмплером текущего потока: (результат, collapsed stacks).
+    Для процессов отрисовки, где нет общего сэмплера воркера
+    """
+    target = threading.get_ident()
+    interval = profile_config.interval_ms / 1000
+    stacks: Counter = Counter()
+    done = threading.Event()
+
+    def run() -> None:
+        while not done.wait(interval):
+            frame = sys._current_frames().get(target)
+            if frame is not None:
+                stacks[';'.join(_fold(frame))] += 1
+
+    sampler = threading.Thread(target=run, name='profiler', daemon=True)
+    sampler.start()
+    try:
+        result = func(*args)
+    finally:
+        done.set()
+        sampler.join()
+    return result, dict(stacks)
+
+
+def _start(capture: Capture) -> None:
+    global _sampler
+    with _lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_run_sampler, name='profiler', daemon=True)
+            _sampler.start()
+        _active.add(capture)
+        _wake.set()
+
+
+def _stop(capture: Capture) -> None:
+    with _lock:
+        _active.discard(capture)
+
+
+def current() -> Optional[Capture]:
+    return _current.get()
+
+
+def record_query(statement) -> None:
+    """
+    Запомнить SQL-запрос для EXPLAIN ANALYZE, если текущий запрос профилируется
+    """
+    capture = _current.get()
+    if capture is None or len(capture.statements) >= profile_config.max_queries:
+        return
+    try:
+        from db.database import async_engine
+        sql = str(statement.compile(dialect=async_engine.dialect, compile_kwargs={'literal_binds': True}))
+    except Exception as e:
+        sql = f'-- не удалось подставить параметры: {e}\n{statement}'
+    capture.statements.setdefault(sql, None)
+
+
+async def _explain(capture: Capture) -> List[Dict[str, Any]]:
+    from db.database import async_engine
+
+    plans = []
+    for sql in capture.statements:
+        entry: Dict[str, Any] = {'sql': sql}
+        try:
+            # EXPLAIN ANALYZE выполняет запрос; транзакция откатывается при закрытии соединения
+            async with async_engine.connect() as conn:
+                result = await conn.exec_driver_sql(f'EXPLAIN (ANALYZE, BUFFERS) {sql}')
+                entry['plan'] = '\n'.join(row[0] for row in result)
+        except Exception as e:
+            entry['error'] = str(e).splitlines()[0]
+        plans.append(entry)
+    return plans
+
+
+def flamegraph_svg(stacks: Dict[str, int], title: str, width: int = 1200) -> str:
+    """
+    SVG-флеймграф из collapsed stacks: ширина кадра - доля снимков, корень внизу
+    """
+    row, margin = 17, 10
+    root: Dict[str, Any] = {'count': 0, 'children': {}}
+    for stack, n in stacks.items():
+        node = root
+        node['count'] += n
+        for frame in stack.split(';'):
+            node = node['children'].setdefault(frame, {'count': 0, 'children': {}})
+            node['count'] += n
+
+    total = root['count'] or 1
+    scale = (width - 2 * margin) / total
+    frames = []
+
+    def walk(node: Dict[str, Any], x: float, depth: int) -> None:
+        for name, child in sorted(node['children'].items()):
+            w = child['count'] * scale
+            if w >= 0.5:
+                frames.append((x, depth, w, name, child['count']))
+                walk(child, x, depth + 1)
+            x += w
+
+    walk(root, margin, 0)
+    depth = max((frame[1] for frame in frames), default=0) + 1
+    height = depth * row + 3 * margin + row
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">',
+        '<rect width="100%" height="100%" fill="#f8f8f8"/>',
+        f'<text x="{margin}" y="{margin + row - 4}" font-size="13">{html.escape(title)}</text>',
+    ]
+    for x, d, w, name, n in frames:
+        y = height - margin - (d + 1) * row
+        # Цвет зависит от имени кадра, чтобы одна функция была одного цвета во всех снимках
+        h = zlib.crc32(name.encode())
+        fill = f'rgb({205 + h % 50},{80 + (h >> 8) % 120},{(h >> 16) % 60})'
+        label = html.escape(name if len(name) * 7 < w else name[:max(0, int(w / 7) - 2)] + '..')
+        parts.append(
+            f'<g><title>{html.escape(name)} ({n} снимков, {n / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="{fill}"/>'
+            + (f'<text x="{x + 2:.1f}" y="{y + row - 5}">{label}</text>' if w > 21 else '')
+            + '</g>'
+        )
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def _capture_dir(capture_id: str) -> str:
+    return os.path.join(profile_config.profile_dir, capture_id)
+
+
+def _write(capture: Capture, plans: List[Dict[str, Any]]) -> None:
+    meta = {
+        'id': capture.id,
+        'pid': os.getpid(),
+        'method': capture.method,
+        'path': capture.path,
+        'query': capture.query,
+        'status': capture.status,
+        'started': capture.started,
+        'duration_ms': round(capture.duration * 1000, 1),
+        'forced': capture.force,
+        'interval_ms': profile_config.interval_ms,
+        'samples': capture.samples,
+        'concurrent': capture.concurrent,
+        'queries': plans,
+    }
+    stacks = ''.join(f'{stack} {n}\n' for stack, n in sorted(capture.stacks.items()))
+    title = f'{capture.method} {capture.path} - {meta["duration_ms"]} мс, {capture.samples} снимков'
+
+    # Снимок собирается во временном каталоге и переименовывается целиком:
+    # /api/admin/profiles в другом воркере не видит его наполовину записанным
+    os.makedirs(profile_config.profile_dir, exist_ok=True)
+    tmp = os.path.join(profile_config.profile_dir, f'.{capture.id}.{uuid.uuid4().hex}.tmp')
+    os.makedirs(tmp)
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(tmp, 'stacks.txt'), 'w', encoding='utf-8') as f:
+        f.write(stacks)
+    with open(os.path.join(tmp, 'flamegraph.svg'), 'w', encoding='utf-8') as f:
+        f.write(flamegraph_svg(capture.stacks, title))
+    os.replace(tmp, _capture_dir(capture.id))
+
+    prune()
+
+
+def prune() -> None:
+    """
+    Только PROFILE_KEEP последних снимков (идентификатор начинается со времени в мс)
+    """
+    captures = list_captures()
+    for capture_id in captures[profile_config.keep:]:
+        shutil.rmtree(_capture_dir(capture_id), ignore_errors=True)
+
+
+def list_captures() -> List[str]:
+    """
+    Идентификаторы снимков, новые первыми
+    """
+    if not os.path.isdir(profile_config.profile_dir):
+        return []
+    keys = {}
+    for name in os.listdir(profile_config.profile_dir):
+        # Посторонние каталоги и временные .tmp пропускаются
+        try:
+            keys[name] = [int(part) for part in name.split('-')]
+        except ValueError:
+            continue
+    return sorted(keys, key=keys.get, reverse=True)
+
+
+def capture_file(capture_id: str, name: str) -> Optional[str]:
+    path = os.path.join(_capture_dir(capture_id), name)
+    return path if capture_id in list_captures() and os.path.exists(path) else None
+
+
+def load_meta(capture_id: str) -> Optional[Dict[str, Any]]:
+    path = capture_file(capture_id, 'meta.json')
+    if path is None:
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+async def _save(capture: Capture) -> None:
+    try:
+        plans = await _explain(capture)
+        await asyncio.to_thread(_write, capture, plans)
+    except Exception as e:
+        print("Ошибка сохранения профиля:", e)
+
+
+def _admit(capture: Capture) -> bool:
+    """
+    Сохранять ли снимок: очередь сохранений не полна и (кроме X-Profile) не исчерпан
+    лимит снимков за минуту
+    """
+    if len(_pending) >= MAX_PENDING_SAVES:
+        return False
+    if capture.force:
+        return True
+    now = time.monotonic()
+    while _recent and now - _recent[0] > 60:
+        _recent.popleft()
+    if len(_recent) >= profile_config.max_captures:
+        return False
+    _recent.append(now)
+    return True
+
+
+def _forced(scope) -> bool:
+    headers = dict(scope.get('headers', ()))
+    if headers.get(FORCE_HEADER) != b'1' or not admin_token:
+        return False
+    return hmac.compare_digest(headers.get(ADMIN_HEADER, b''), admin_token.encode())
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware: профиль каждого запроса, сохранение медленных
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http' or not profile_config.enabled
+                or scope['path'] == '/' or scope['path'].startswith(EXEMPT_PREFIXES)):
+            return await self.app(scope, receive, send)
+
+        force = _forced(scope)
+        capture = Capture(scope['method'], scope['path'], scope.get('query_string', b'').decode('latin-1'), force)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                capture.status = message['status']
+            await send(message)
+
+        token = _current.set(capture)
+        start = time.perf_counter()
+        _start(capture)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _stop(capture)
+            _current.reset(token)
+            capture.duration = time.perf_counter() - start
+            if capture.slow and _admit(capture):
+                # EXPLAIN ANALYZE и запись - после ответа, не задерживая клиента
+                task = asyncio.create_task(_save(capture))
+                _pending.add(task)
+                task.add_done_callback(_pending.discard)
@@ -0,0 +1,114 @@
+import hashlib
+import html
+import os
+import re
+import zipfile
+from typing import Dict, List, Optional
+
+# Подписи графиков в отчёте
+CHART_TITLES = {
+    'alpha-beta-theta': 'Alpha, Beta, Theta волны',
+    'fatigue': 'Утомление',
+    'heart-rate': 'Частота сердечных сокращений',
+    'psychological-fatigue': 'Психологическое утомление',
+    'gravity': 'Gravity метрика',
+    'concentration': 'Концентрация',
+    'relaxation': 'Расслабление',
+    'nfb': 'Мозговые волны по сеансам',
+}
+
+_PAGE = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+img {{ max-width: 100%; margin-bottom: 1em; }}
+.advice {{ white-space: pre-wrap; background: #f5f5f5; padding: 1em; }}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def participant_dir(individual_number: str) -> str:
+    """
+    Имя каталога участника в отчёте: individual_number приходит из базы, поэтому
+    разделители путей, '..' и прочие символы вне [A-Za-z0-9._-] заменяются,
+    а к изменённому имени добавляется хеш исходного, чтобы имена не совпали
+    """
+    name = re.sub(r'[^A-Za-z0-9._-]', '_', individual_number)
+    if name != individual_number or name.startswith('.') or not name:
+        digest = hashlib.sha256(individual_number.encode('utf-8')).hexdigest()[:8]
+        name = f"{name.lstrip('.') or 'participant'}-{digest}"
+    return name
+
+
+def _write(path: str, content: str) -> None:
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def write_participant_page(
+        directory: str,
+        individual_number: str,
+        expedition_id: int,
+        images: Dict[str, bytes],
+        advice: Optional[str]
+) -> None:
+    """
+    Страница участника: графики в отдельных PNG и рекомендации GigaChat
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    parts = [f'<h1>Участник {html.escape(individual_number)}</h1>',
+             f'<p>Экспедиция #{expedition_id}</p>']
+
+    if not images:
+        parts.append('<p>Данные не найдены</p>')
+
+    for name, png in images.items():
+        with open(os.path.join(directory, f'{name}.png'), 'wb') as f:
+            f.write(png)
+        parts.append(f'<h2>{html.escape(CHART_TITLES.get(name, name))}</h2>')
+        parts.append(f'<img src="{name}.png" alt="{html.escape(name)}">')
+
+    if advice:
+        parts.append('<h2>Анализ GigaChat</h2>')
+        parts.append(f'<div class="advice">{html.escape(advice)}</div>')
+
+    _write(os.path.join(directory, 'index.html'),
+           _PAGE.format(title=html.escape(individual_number), body='\n'.join(parts)))
+
+
+def write_index(directory: str, expedition_id: int, participants: List[str]) -> None:
+    items = '\n'.join(
+        f'<li><a href="participants/{participant_dir(p)}/index.html">{html.escape(p)}</a></li>'
+        for p in participants
+    )
+    body = f'<h1>Отчёт по экспедиции #{expedition_id}</h1>\n<ul>\n{items}\n</ul>'
+    _write(os.path.join(directory, 'index.html'),
+           _PAGE.format(title=f'Экспедиция #{expedition_id}', body=body))
+
+
+def build_archive(directory: str, archive_path: str) -> None:
+    """
+    Упаковка отчёта (index.html и страницы участников) в ZIP
+    """
+    tmp = f'{archive_path}.tmp'
+    with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.write(os.path.join(directory, 'index.html'), 'index.html')
+        participants_dir = os.path.join(directory, 'participants')
+        for root, _, files in os.walk(participants_dir):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                # PNG уже сжат
+                compress = zipfile.ZIP_STORED if name.endswith('.png') else zipfile.ZIP_DEFLATED
+                archive.write(path, os.path.relpath(path, directory), compress_type=compress)
+    os.replace(tmp, archive_path)
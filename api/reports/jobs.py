@@ -0,0 +1,284 @@
+import asyncio
+import fcntl
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+from config import load_config
+from db.data_extraction import MetricFilter, get_expedition_metrics, get_expedition_participants
+from db.quality import get_mode
+from giga_chat.giga import chat
+from graph.charts import CHARTS, SOURCE_TABLES, has_chart_data, render_chart
+from reports.builder import build_archive, participant_dir, write_index, write_participant_page
+
+# Фоновые задания на выгрузку отчёта по экспедиции.
+# Состояние каждого задания хранится в <reports_dir>/<job_id>/job.json,
+# поэтому после падения сервиса задания продолжаются с того участника,
+# на котором остановились.
+# При нескольких воркерах uvicorn задание выполняет тот процесс, который захватил
+# flock на <job_id>/.lock; остальные периодически пересматривают каталог и подхватывают
+# задания, чей процесс завершился (ОС снимает блокировку вместе с процессом)
+reports_config = load_config().reports
+
+_queue: Optional[asyncio.Queue] = None
+_queued: Set[str] = set()
+_workers: List[asyncio.Task] = []
+_advice_semaphore: Optional[asyncio.Semaphore] = None
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+RESCAN_INTERVAL = 30
+
+
+def _job_dir(job_id: str) -> str:
+    return os.path.join(reports_config.reports_dir, job_id)
+
+
+def _manifest_path(job_id: str) -> str:
+    return os.path.join(_job_dir(job_id), 'job.json')
+
+
+def _lock_job(job_id: str) -> Optional[int]:
+    """
+    Захват задания процессом; None - задание уже выполняется
+    """
+    fd = os.open(os.path.join(_job_dir(job_id), '.lock'), os.O_CREAT | os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _unlock_job(fd: int) -> None:
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def archive_path(job_id: str) -> str:
+    return os.path.join(_job_dir(job_id), 'report.zip')
+
+
+def load_job(job_id: str) -> Optional[Dict[str, Any]]:
+    # job_id приходит из URL, поэтому принимаем только uuid
+    try:
+        uuid.UUID(hex=job_id)
+    except ValueError:
+        return None
+
+    try:
+        with open(_manifest_path(job_id), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_job(job: Dict[str, Any]) -> None:
+    job['updated_at'] = time.time()
+    path = _manifest_path(job['id'])
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def job_progress(job: Dict[str, Any]) -> Dict[str, Any]:
+    total = len(job['participants'])
+    completed = len(job['completed'])
+    return {
+        'job_id': job['id'],
+        'expedition_id': job['expedition_id'],
+        'status': job['status'],
+        'total': total,
+        'completed': completed,
+        'progress': completed / total if total else (1.0 if job['status'] == 'done' else 0.0),
+        'error': job.get('error'),
+    }
+
+
+async def submit_job(expedition_id: int) -> Dict[str, Any]:
+    job_id = uuid.uuid4().hex
+    os.makedirs(_job_dir(job_id), exist_ok=True)
+
+    now = time.time()
+    job = {
+        'id': job_id,
+        'expedition_id': expedition_id,
+        'status': 'queued',
+        'participants': [],
+        'completed': [],
+        'error': None,
+        'created_at': now,
+    }
+    _save_job(job)
+    await _enqueue(job_id)
+
+    return job
+
+
+async def retry_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    job['status'] = 'queued'
+    job['error'] = None
+    _save_job(job)
+    await _enqueue(job['id'])
+
+    return job
+
+
+def _get_queue() -> asyncio.Queue:
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue()
+    return _queue
+
+
+async def _enqueue(job_id: str) -> None:
+    if job_id not in _queued:
+        _queued.add(job_id)
+        await _get_queue().put(job_id)
+
+
+async def _enqueue_active() -> None:
+    """
+    Постановка в очередь незавершённых заданий из каталога отчётов
+    """
+    for job_id in sorted(os.listdir(reports_config.reports_dir)):
+        job = load_job(job_id)
+        if job is not None and job['status'] in ACTIVE_STATUSES:
+            await _enqueue(job_id)
+
+
+async def _advice(individual_number: str, data: Dict[str, list]) -> str:
+    # Клиент GigaChat синхронный: выполняем в потоке, ограничивая число одновременных запросов
+    async with _advice_semaphore:
+        response = await asyncio.to_thread(
+            chat, data['nfb'], data['physiological'], data['cardio'], data['productivity'],
+            get_mode(MetricFilter())
+        )
+    return response.choices[0].message.content
+
+
+async def _process_participant(
+        job: Dict[str, Any],
+        individual_number: str,
+        bulk: Dict[str, Dict[str, list]]
+) -> None:
+    expedition_id = job['expedition_id']
+    data = {source: bulk[source].get(individual_number, []) for source in SOURCE_TABLES}
+
+    ready = [name for name in CHARTS if has_chart_data(name, data)]
+    renders = [render_chart(name, data, individual_number, expedition_id) for name in ready]
+    if ready:
+        renders.append(_advice(individual_number, data))
+
+    results = await asyncio.gather(*renders)
+    images = dict(zip(ready, results))
+    advice = results[-1] if ready else None
+
+    write_participant_page(
+        os.path.join(_job_dir(job['id']), 'participants', participant_dir(individual_number)),
+        individual_number, expedition_id, images, advice
+    )
+
+    job['completed'].append(individual_number)
+    _save_job(job)
+
+
+async def _run_job(job: Dict[str, Any]) -> None:
+    expedition_id = job['expedition_id']
+
+    job['status'] = 'running'
+    _save_job(job)
+
+    # Все таблицы экспедиции читаются один раз, а не по запросу на участника
+    tables = list(SOURCE_TABLES.items())
+    fetched = await asyncio.gather(
+        *(get_expedition_metrics(table, expedition_id) for _, table in tables)
+    )
+    bulk = {source: rows for (source, _), rows in zip(tables, fetched)}
+
+    if not job['participants']:
+        participants = set(await get_expedition_participants(expedition_id))
+        for rows in bulk.values():
+            participants.update(rows)
+        job['participants'] = sorted(participants)
+        _save_job(job)
+
+    pending = [p for p in job['participants'] if p not in job['completed']]
+    # При ошибке одного участника TaskGroup отменяет и дожидается остальных до того,
+    # как обработчик запишет статус failed: иначе они сохранили бы задание со старым статусом
+    try:
+        async with asyncio.TaskGroup() as group:
+            for participant in pending:
+                group.create_task(_process_participant(job, participant, bulk))
+    except ExceptionGroup as e:
+        raise e.exceptions[0]
+
+    job_dir = _job_dir(job['id'])
+    write_index(job_dir, expedition_id, job['participants'])
+    await asyncio.to_thread(build_archive, job_dir, archive_path(job['id']))
+
+    job['status'] = 'done'
+    _save_job(job)
+
+
+async def _worker() -> None:
+    queue = _get_queue()
+    while True:
+        job_id = await queue.get()
+        _queued.discard(job_id)
+        lock = None
+        try:
+            lock = _lock_job(job_id)
+            # Состояние читается после захвата: другой процесс мог уже завершить задание
+            job = load_job(job_id) if lock is not None else None
+            if job is not None and job['status'] in ACTIVE_STATUSES:
+                await _run_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job = load_job(job_id)
+            if job is not None:
+                job['status'] = 'failed'
+                job['error'] = str(e)
+                _save_job(job)
+            print(f"Ошибка задания отчёта {job_id}:", e)
+        finally:
+            if lock is not None:
+                _unlock_job(lock)
+            queue.task_done()
+
+
+async def _rescan() -> None:
+    while True:
+        await asyncio.sleep(RESCAN_INTERVAL)
+        try:
+            await _enqueue_active()
+        except Exception as e:
+            print("Ошибка поиска заданий отчётов:", e)
+
+
+async def start_report_workers() -> None:
+    """
+    Запуск обработчиков и возобновление незавершённых заданий
+    """
+    global _advice_semaphore
+    _advice_semaphore = asyncio.Semaphore(reports_config.advice_concurrency)
+    os.makedirs(reports_config.reports_dir, exist_ok=True)
+
+    await _enqueue_active()
+
+    for _ in range(reports_config.workers):
+        _workers.append(asyncio.create_task(_worker()))
+    _workers.append(asyncio.create_task(_rescan()))
+
+
+async def stop_report_workers() -> None:
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queued.clear()
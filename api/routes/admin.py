@@ -0,0 +1,62 @@
+import asyncio
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+
+import profiling
+from config import load_config
+
+admin_token = load_config().admin_token
+
+
+def check_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    Запросы должны передавать ADMIN_TOKEN в X-Admin-Token;
+    без заданного ADMIN_TOKEN служебные эндпоинты недоступны
+    """
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_admin_token or '', admin_token):
+        raise HTTPException(status_code=403, detail="Нет доступа")
+
+
+admin = APIRouter(dependencies=[Depends(check_token)])
+
+
+def _capture_file(capture_id: str, name: str) -> str:
+    path = profiling.capture_file(capture_id, name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return path
+
+
+@admin.get("/profiles")
+async def list_profiles(limit: int = 50):
+    """Снимки медленных запросов, новые первыми (без планов запросов)"""
+    metas = []
+    for capture_id in (await asyncio.to_thread(profiling.list_captures))[:limit]:
+        meta = await asyncio.to_thread(profiling.load_meta, capture_id)
+        if meta is not None:
+            meta['queries'] = len(meta['queries'])
+            metas.append(meta)
+    return {"enabled": profiling.profile_config.enabled, "profiles": metas}
+
+@admin.get("/profiles/{capture_id}")
+async def get_profile(capture_id: str):
+    """Снимок запроса: время, число снимков стека, SQL и EXPLAIN ANALYZE"""
+    meta = await asyncio.to_thread(profiling.load_meta, capture_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return meta
+
+@admin.get("/profiles/{capture_id}/flamegraph.svg")
+async def get_profile_flamegraph(capture_id: str):
+    """Флеймграф запроса"""
+    return FileResponse(_capture_file(capture_id, 'flamegraph.svg'), media_type="image/svg+xml")
+
+@admin.get("/profiles/{capture_id}/stacks.txt")
+async def get_profile_stacks(capture_id: str):
+    """Collapsed stacks для flamegraph.pl или speedscope"""
+    return FileResponse(_capture_file(capture_id, 'stacks.txt'), media_type="text/plain")
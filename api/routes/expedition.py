@@ -1,4 +1,11 @@
-from fastapi import APIRouter
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException
+
+from db.archive import ArchiveError, archive_expedition, get_manifest
+from db.emotional import get_expedition_emotional_rollup
+from db.filters import MetricFilter
+from routes.admin import check_token
+from routes.filters import metric_filter
 
 expedition = APIRouter()
 
@@ -7,4 +14,41 @@ async def get_expedition_stress_chart(
     expedition_id: int
 ):
     from graph.charts import create_aggregated_stress_chart
-    return await create_aggregated_stress_chart(expedition_id)
\ No newline at end of file
+    return await create_aggregated_stress_chart(expedition_id)
+
+@expedition.get("/{expedition_id}/emotional/sessions")
+async def get_expedition_emotional_sessions(
+    expedition_id: int,
+    filters: MetricFilter = Depends(metric_filter)
+):
+    """Эмоциональные метрики экспедиции по сеансам: по участникам и в целом"""
+    return await get_expedition_emotional_rollup(expedition_id, 'session', filters)
+
+@expedition.get("/{expedition_id}/emotional/daily")
+async def get_expedition_emotional_daily(
+    expedition_id: int,
+    filters: MetricFilter = Depends(metric_filter)
+):
+    """Эмоциональные метрики экспедиции по суткам: по участникам и в целом"""
+    return await get_expedition_emotional_rollup(expedition_id, 'day', filters)
+
+@expedition.post("/{expedition_id}/archive", dependencies=[Depends(check_token)])
+async def archive_expedition_data(
+    expedition_id: int,
+    delete: bool = False
+):
+    """Перенос метрик завершённой экспедиции в Parquet (delete=true удаляет строки из PostgreSQL)"""
+    try:
+        return await asyncio.to_thread(archive_expedition, expedition_id, delete)
+    except ArchiveError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@expedition.get("/{expedition_id}/archive")
+async def get_expedition_archive(
+    expedition_id: int
+):
+    """Состояние архива экспедиции"""
+    manifest = get_manifest(expedition_id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Экспедиция не в архиве")
+    return manifest
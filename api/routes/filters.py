@@ -0,0 +1,35 @@
+from datetime import datetime
+from fastapi import HTTPException, Query
+from typing import List, Optional
+
+from db.filters import QUALITY_MODES, MetricFilter, parse_resolution, to_millis
+
+
+def metric_filter(
+    from_: Optional[datetime] = Query(None, alias="from", description="Начало окна (ISO 8601 или unix-время)"),
+    to: Optional[datetime] = Query(None, description="Конец окна (ISO 8601 или unix-время)"),
+    session: Optional[List[int]] = Query(None, description="Сеансы: 1 - утро, 2 - день, 3 - вечер"),
+    resolution: Optional[str] = Query(None, description="Шаг агрегации: 30s, 15m, 1h, 1d"),
+    quality: Optional[str] = Query(None, description="Сэмплы с артефактами: off, drop или weight")
+) -> MetricFilter:
+    """Параметры окна выборки, общие для всех эндпоинтов метрик"""
+    from_ts = to_millis(from_) if from_ is not None else None
+    to_ts = to_millis(to) if to is not None else None
+    if from_ts is not None and to_ts is not None and from_ts > to_ts:
+        raise HTTPException(status_code=422, detail="Начало окна позже конца")
+
+    try:
+        step = parse_resolution(resolution) if resolution else None
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if quality is not None and quality not in QUALITY_MODES:
+        raise HTTPException(status_code=422, detail=f"Некорректный режим качества: {quality}")
+
+    return MetricFilter(
+        from_ts=from_ts,
+        to_ts=to_ts,
+        sessions=tuple(sorted(set(session))) if session else None,
+        resolution=step,
+        quality=quality
+    )
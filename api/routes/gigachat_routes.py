@@ -1,20 +1,36 @@
-from fastapi import APIRouter
+import asyncio
 
+from fastapi import APIRouter, Depends
+
+import cache
+import singleflight
 from giga_chat.giga import chat
 from db.data_extraction import (
+    MetricFilter,
     get_nlp_metrics,
     get_physiological_metrics,
     get_cardio_metrics,
     get_productivity_metrics
 )
+from db.quality import get_mode
+from routes.filters import metric_filter
 gigachat_router = APIRouter()
 
 @gigachat_router.get("/advices/{ind_num}/{expedition_id}", description="Получить аналитику от GigaChat")
 async def giga(ind_num: str,
-               expedition_id: int):
-    nlp_metrics = await get_nlp_metrics(ind_num, expedition_id)
-    physiological_metrics = await get_physiological_metrics(ind_num, expedition_id)
-    cardio_metrics = await get_cardio_metrics(ind_num, expedition_id)
-    productivity_metrics = await get_productivity_metrics(ind_num, expedition_id)
-    response = chat(nlp_metrics, physiological_metrics, cardio_metrics, productivity_metrics)
-    return {"response": response.choices[0].message.content}
\ No newline at end of file
+               expedition_id: int,
+               filters: MetricFilter = Depends(metric_filter)):
+    async def produce() -> bytes:
+        nlp_metrics = await get_nlp_metrics(ind_num, expedition_id, filters)
+        physiological_metrics = await get_physiological_metrics(ind_num, expedition_id, filters)
+        cardio_metrics = await get_cardio_metrics(ind_num, expedition_id, filters)
+        productivity_metrics = await get_productivity_metrics(ind_num, expedition_id, filters)
+        # Клиент синхронный: запрос к GigaChat не должен блокировать цикл событий воркера
+        response = await asyncio.to_thread(
+            chat, nlp_metrics, physiological_metrics, cardio_metrics, productivity_metrics, get_mode(filters)
+        )
+        return response.choices[0].message.content.encode('utf-8')
+
+    key = cache.cache_key('advices', ind_num, expedition_id, filters)
+    content = await singleflight.run('advices', key, lambda: cache.cached('advices', key, produce))
+    return {"response": content.decode('utf-8')}
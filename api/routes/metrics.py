@@ -1,8 +1,13 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
 
 
+from db.data_extraction import get_emotional_metrics
+from db.emotional import get_emotional_rollup
+from db.filters import MetricFilter
 from graph.charts import (
     chart,
+    create_dashboard_bundle,
     create_alpha_beta_theta_chart,
     create_fatigue_chart,
     create_heart_rate_chart,
@@ -11,6 +16,7 @@ from graph.charts import (
     create_concentration_chart,
     create_relaxation_chart
 )
+from routes.filters import metric_filter
 
 metrics = APIRouter()
 
@@ -18,64 +24,115 @@ metrics = APIRouter()
 @metrics.get("/alpha-beta-theta/{ind_num}/{expedition_id}")
 async def get_alpha_beta_theta_chart(
     ind_num: str,
-    expedition_id: int
+    expedition_id: int,
+    filters: MetricFilter = Depends(metric_filter)
 ):
     """График мозговой активности: Alpha, Beta, Theta волны"""
-    return await create_alpha_beta_theta_chart(ind_num, expedition_id)
+    return await create_alpha_beta_theta_chart(ind_num, expedition_id, filters)
 
 @metrics.get("/fatigue/{ind_num}/{expedition_id}")
 async def get_fatigue_chart(
     ind_num: str,
-    expedition_id: int
+    expedition_id: int,
+    filters: MetricFilter = Depends(metric_filter)
 ):
     """График утомления (Fatigue)"""
-    return await create_fatigue_chart(ind_num, expedition_id)
+    return await create_fatigue_chart(ind_num, expedition_id, filters)
 
 @metrics.get("/heart-rate/{ind_num}/{expedition_id}")
 async def get_heart_rate_chart(
     ind_num: str,
-    expedition_id: int
+    expedition_id: int,
+    filters: MetricFilter = Depends(metric_filter)
 ):
     """График частоты сердечных сокращений"""
-    return await create_heart_rate_chart(ind_num, expedition_id)
+    return await create_heart_rate_chart(ind_num, expedition_id, filters)
 
 @metrics.get("/psychological-fatigue/{ind_num}/{expedition_id}")
 async def get_psychological_fatigue_chart(
     ind_num: str,
-    expedition_id: int
+    expedition_id: int,
+    filters: MetricFilter = Depends(metric_filter)
 ):
     """График психологического утомления"""
-    return await create_psychological_fatigue_chart(ind_num, expedition_id)
+    return await create_psychological_fatigue_chart(ind_num, expedition_id, filters)
 
 @metrics.get("/gravity/{ind_num}/{expedition_id}")
 async def get_gravity_chart(
     ind_num: str,
-    expedition_id: int
+    expedition_id: int,
+    filters: MetricFilter = Depends(metric_filter)
 ):
     """График Gravity метрики"""
-    return await create_gravity_chart(ind_num, expedition_id)
+    return await create_gravity_chart(ind_num, expedition_id, filters)
 
 @metrics.get("/concentration/{ind_num}/{expedition_id}")
 async def get_concentration_chart(
     ind_num: str,
-    expedition_id: int
+    expedition_id: int,
+    filters: MetricFilter = Depends(metric_filter)
 ):
     """График концентрации"""
-    return await create_concentration_chart(ind_num, expedition_id)
+    return await create_concentration_chart(ind_num, expedition_id, filters)
 
 @metrics.get("/relaxation/{ind_num}/{expedition_id}")
 async def get_relaxation_chart(
     ind_num: str,
-    expedition_id: int
+    expedition_id: int,
+    filters: MetricFilter = Depends(metric_filter)
 ):
     """График расслабления"""
-    return await create_relaxation_chart(ind_num, expedition_id)
+    return await create_relaxation_chart(ind_num, expedition_id, filters)
 
 # Для обратной совместимости
 @metrics.get("/nfb/{ind_num}/{expedition_id}")
 async def get_nlp_chart(
     ind_num: str,
-    expedition_id: int
+    expedition_id: int,
+    filters: MetricFilter = Depends(metric_filter)
 ):
     """График мозговой активности (для обратной совместимости)"""
-    return await chart(ind_num, expedition_id)
\ No newline at end of file
+    return await chart(ind_num, expedition_id, filters)
+
+@metrics.get("/bundle/{ind_num}/{expedition_id}")
+async def get_dashboard_bundle(
+    ind_num: str,
+    expedition_id: int,
+    charts: Optional[str] = Query(None, description="Графики через запятую (по умолчанию все)"),
+    fmt: str = Query("zip", alias="format", description="zip, multipart или sprite"),
+    filters: MetricFilter = Depends(metric_filter)
+):
+    """Все графики участника одним ответом"""
+    names = [name.strip() for name in charts.split(",") if name.strip()] if charts else None
+    return await create_dashboard_bundle(ind_num, expedition_id, names, fmt, filters)
+
+# Эмоциональные метрики (JSON)
+@metrics.get("/emotional/{ind_num}/{expedition_id}")
+async def get_emotional(
+    ind_num: str,
+    expedition_id: int,
+    filters: MetricFilter = Depends(metric_filter)
+):
+    """Эмоциональные метрики участника по колонкам"""
+    columns = await get_emotional_metrics(ind_num, expedition_id, filters)
+    if not len(columns['timestamp']):
+        raise HTTPException(status_code=404, detail="Данные не найдены")
+    return columns
+
+@metrics.get("/emotional/{ind_num}/{expedition_id}/sessions")
+async def get_emotional_sessions(
+    ind_num: str,
+    expedition_id: int,
+    filters: MetricFilter = Depends(metric_filter)
+):
+    """Сводка эмоциональных метрик по сеансам"""
+    return await get_emotional_rollup(ind_num, expedition_id, 'session', filters)
+
+@metrics.get("/emotional/{ind_num}/{expedition_id}/daily")
+async def get_emotional_daily(
+    ind_num: str,
+    expedition_id: int,
+    filters: MetricFilter = Depends(metric_filter)
+):
+    """Сводка эмоциональных метрик по суткам (UTC)"""
+    return await get_emotional_rollup(ind_num, expedition_id, 'day', filters)
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+
+from reports.jobs import archive_path, job_progress, load_job, retry_job, submit_job
+
+reports = APIRouter()
+
+
+class ReportRequest(BaseModel):
+    expedition_id: int
+
+
+def _get_job(job_id: str) -> dict:
+    job = load_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return job
+
+
+@reports.post("/", status_code=202)
+async def create_report(request: ReportRequest):
+    """Поставить в очередь выгрузку отчёта по экспедиции"""
+    job = await submit_job(request.expedition_id)
+    return job_progress(job)
+
+@reports.get("/{job_id}")
+async def get_report_status(job_id: str):
+    """Прогресс задания"""
+    return job_progress(_get_job(job_id))
+
+@reports.post("/{job_id}/retry", status_code=202)
+async def retry_report(job_id: str):
+    """Повторить упавшее задание (готовые участники не пересчитываются)"""
+    job = _get_job(job_id)
+    if job['status'] != 'failed':
+        raise HTTPException(status_code=409, detail="Задание не завершилось ошибкой")
+    return job_progress(await retry_job(job))
+
+@reports.get("/{job_id}/download")
+async def download_report(job_id: str):
+    """Архив отчёта (HTML + PNG)"""
+    job = _get_job(job_id)
+    if job['status'] != 'done':
+        raise HTTPException(status_code=409, detail="Отчёт ещё не готов")
+    return FileResponse(
+        archive_path(job_id),
+        media_type="application/zip",
+        filename=f"expedition-{job['expedition_id']}-report.zip"
+    )
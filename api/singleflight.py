@@ -0,0 +1,81 @@
+import asyncio
+import functools
+import inspect
+import os
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+# Объединение одновременных одинаковых запросов внутри воркера: пока выполняется
+# вызов с ключом (эндпоинт, участник, экспедиция, параметры), остальные вызовы с тем же
+# ключом ждут его результата, а не повторяют выборку или отрисовку.
+# Результат общий для всех ожидающих - вызывающий код не должен его изменять.
+# Между воркерами одинаковые запросы объединяет уже общий кэш (cache.py)
+_inflight: Dict[Hashable, asyncio.Task] = {}
+
+_calls: Counter = Counter()
+_coalesced: Counter = Counter()
+
+
+def _done(key: Hashable, task: asyncio.Task) -> None:
+    _inflight.pop(key, None)
+    # Ошибка считается полученной, даже если все ожидавшие уже отменены
+    if not task.cancelled():
+        task.exception()
+
+
+async def run(namespace: str, key: Hashable, producer: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Результат producer() для ключа; при уже выполняющемся вызове - его результат.
+    producer выполняется отдельной задачей: отмена первого запроса (клиент закрыл
+    соединение) не отменяет его для остальных
+    """
+    key = (namespace, key)
+    _calls[namespace] += 1
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(producer())
+        _inflight[key] = task
+        task.add_done_callback(functools.partial(_done, key))
+    else:
+        _coalesced[namespace] += 1
+
+    return await asyncio.shield(task)
+
+
+def coalesce(namespace: str):
+    """
+    Декоратор для async-функций: ключ - нормализованные аргументы вызова
+    (позиционные и именованные, со значениями по умолчанию), они должны быть хешируемыми
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple(bound.arguments.items())
+            return await run(namespace, key, lambda: func(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    Счётчики воркера: calls - всего вызовов, coalesced - дождавшихся чужого результата
+    """
+    return {
+        'pid': os.getpid(),
+        'in_flight': len(_inflight),
+        'namespaces': {
+            namespace: {
+                'calls': _calls[namespace],
+                'executed': _calls[namespace] - _coalesced[namespace],
+                'coalesced': _coalesced[namespace],
+            }
+            for namespace in sorted(_calls)
+        },
+    }
@@ -0,0 +1,138 @@
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from config import load_config
+
+# Профиль холодного старта:
+#   STARTUP_PROFILE=1 uvicorn main:app  - время шагов прогрева воркера в лог
+#   python startup_profile.py           - стоимость импортов main (python -X importtime)
+#                                         и время от запуска uvicorn до первого ответа /health
+enabled = load_config().startup_profile
+
+# Тяжёлые библиотеки, которые не должны загружаться при импорте main
+DEFERRED = ('pandas', 'matplotlib', 'gigachat', 'pyarrow', 'numpy')
+
+
+@contextmanager
+def step(name: str):
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        print(f"[startup] {name}: {(time.perf_counter() - start) * 1000:.0f} мс", flush=True)
+
+
+def _import_times() -> List[Tuple[int, int, int, str]]:
+    """
+    (self, cumulative, глубина, модуль) для каждого импорта при `import main`, мкс
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+
+def _main_imports(rows: List[Tuple[int, int, int, str]]) -> List[Tuple[int, str]]:
+    # -X importtime печатает модуль после всех его импортов:
+    # прямые импорты main - строки глубины 1 перед строкой main
+    end = next(i for i, row in enumerate(rows) if row[3] == 'main' and row[2] == 0)
+    start = max((i for i in range(end) if rows[i][2] == 0), default=-1) + 1
+    return [(cumulative, name) for _, cumulative, depth, name in rows[start:end] if depth == 1]
+
+
+def _packages(rows: List[Tuple[int, int, int, str]]) -> Dict[str, int]:
+    packages: Dict[str, int] = {}
+    for _, cumulative, _, name in rows:
+        package = name.split('.')[0]
+        packages[package] = max(packages.get(package, 0), cumulative)
+    return packages
+
+
+def _time_to_health(port: int, timeout: float) -> Tuple[float, Optional[float]]:
+    """
+    Секунды от запуска uvicorn до первого ответа /health и до готовности /ready
+    (None, если прогрев завершился ошибкой)
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1',
+         '--port', str(port), '--log-level', 'warning'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    healthy = None
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+                conn.request('GET', '/health' if healthy is None else '/ready')
+                response = conn.getresponse()
+                body = json.loads(response.read() or b'{}')
+                if response.status == 200:
+                    if healthy is not None:
+                        return healthy, time.perf_counter() - started
+                    healthy = time.perf_counter() - started
+                elif body.get('status') == 'failed':
+                    return healthy, None
+            except OSError:
+                pass
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+    raise RuntimeError(f"Сервис не стал готов за {timeout} с")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Профиль холодного старта сервиса")
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--port', type=int, default=8101)
+    parser.add_argument('--no-server', action='store_true', help="только стоимость импортов")
+    args = parser.parse_args()
+
+    rows = _import_times()
+    total = next(cumulative for _, cumulative, depth, name in rows if name == 'main' and depth == 0)
+    print(f"import main: {total / 1000:.0f} мс\n")
+
+    print("Прямые импорты main:")
+    for cumulative, name in sorted(_main_imports(rows), reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:>8.1f} мс  {name}")
+
+    packages = _packages(rows)
+    print("\nПакеты (наибольшее cumulative, вложенные пакеты учитываются и в родителе):")
+    for package, cumulative in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {cumulative / 1000:>8.1f} мс  {package}")
+
+    loaded = [package for package in DEFERRED if package in packages]
+    print(f"\nОтложенные библиотеки, загруженные при импорте: {', '.join(loaded) or 'нет'}")
+
+    if not args.no_server:
+        healthy, ready = _time_to_health(args.port, 120)
+        print(f"\nДо первого ответа /health: {healthy * 1000:.0f} мс")
+        print(f"До готовности /ready: {ready * 1000:.0f} мс" if ready is not None
+              else "Прогрев завершился ошибкой, см. лог выше")
+
+
+if __name__ == '__main__':
+    main()
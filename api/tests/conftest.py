@@ -0,0 +1,16 @@
+import os
+import sys
+
+# Тесты не обращаются к PostgreSQL: load_config требует параметры подключения,
+# движки db.database соединений до первого запроса не открывают
+for name, value in {
+    'POSTGRES_USER': 'test',
+    'POSTGRES_PASSWORD': 'test',
+    'POSTGRES_HOST': 'localhost',
+    'POSTGRES_PORT': '5432',
+    'POSTGRES_DB': 'test',
+    'AUTHORIZATION_KEY': 'test',
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import pytest
+
+import admission
+from admission import CLASSES, Gate, Shed, TokenBuckets, classify
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, 'monotonic', clock)
+    return clock
+
+
+def _gate(budget: float = 1.0, **limits) -> Gate:
+    return Gate({name: limits.get(name, 1) for name in CLASSES}, max_active=1, budget=budget)
+
+
+def test_bucket_allows_burst_then_reports_wait(clock):
+    buckets = TokenBuckets(rate=2, burst=4)
+    assert buckets.take('a', 2) == 0
+    assert buckets.take('a', 2) == 0
+    assert buckets.take('a', 2) == pytest.approx(1.0)
+    # Другой клиент - своя корзина
+    assert buckets.take('b', 2) == 0
+
+
+def test_bucket_refills_at_rate_up_to_burst(clock):
+    buckets = TokenBuckets(rate=2, burst=4)
+    buckets.take('a', 4)
+    clock.now += 0.5
+    assert buckets.take('a', 2) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert buckets.take('a', 2) == 0
+    clock.now += 100
+    assert buckets.take('a', 4) == 0
+    assert buckets.take('a', 1) > 0
+
+
+def test_classify_routes():
+    assert classify('GET', '/health') is None
+    assert classify('GET', '/api/metrics/emotional/IND-1/1') == 'data'
+    assert classify('GET', '/api/metrics/heart-rate/IND-1/1') == 'render'
+    assert classify('GET', '/api/metrics/bundle/IND-1/1') == 'bundle'
+    assert classify('GET', '/api/expedition/1/archive') == 'data'
+    assert classify('POST', '/api/expedition/1/archive') == 'slow'
+    assert CLASSES['bundle'] > CLASSES['render']
+
+
+@pytest.mark.parametrize('hops, expected', [(1, '10.0.0.2'), (2, '10.0.0.1'), (3, '6.6.6.6'), (4, '192.0.2.1')])
+def test_client_is_taken_from_the_right_of_forwarded_for(monkeypatch, hops, expected):
+    monkeypatch.setattr(admission.admission_config, 'client_header', 'X-Forwarded-For')
+    monkeypatch.setattr(admission.admission_config, 'client_hops', hops)
+    scope = {
+        'headers': [(b'x-forwarded-for', b'6.6.6.6, 10.0.0.1'), (b'x-forwarded-for', b'10.0.0.2')],
+        'client': ('192.0.2.1', 50000),
+    }
+    assert admission._client(scope) == expected
+
+
+def test_freed_slot_goes_to_higher_priority_class():
+    async def main():
+        gate = _gate()
+        await gate.acquire('render')
+        order = []
+
+        async def wait(name):
+            await gate.acquire(name)
+            order.append(name)
+
+        render = asyncio.ensure_future(wait('render'))
+        await asyncio.sleep(0)
+        data = asyncio.ensure_future(wait('data'))
+        await asyncio.sleep(0)
+
+        gate.release('render')
+        await asyncio.sleep(0.01)
+        assert order == ['data']
+        gate.release('data')
+        await asyncio.gather(render, data)
+        assert order == ['data', 'render']
+        assert gate.stats['data']['queued'] == 1
+
+    asyncio.run(main())
+
+
+def test_request_is_shed_after_queue_budget():
+    async def main():
+        gate = _gate(budget=0.02)
+        await gate.acquire('render')
+        with pytest.raises(Shed) as error:
+            await gate.acquire('render')
+        assert error.value.status == 503
+        assert not gate.queues['render']
+        assert gate.snapshot()['render']['shed'] == 1
+
+    asyncio.run(main())
+
+
+def test_request_is_shed_at_once_when_queue_head_is_over_budget():
+    async def main():
+        gate = _gate(budget=0.5)
+        await gate.acquire('render')
+        stale = asyncio.get_running_loop().create_future()
+        gate.queues['render'].append((time.monotonic() - 1, stale))
+
+        started = time.monotonic()
+        with pytest.raises(Shed):
+            await gate.acquire('render')
+        assert time.monotonic() - started < 0.1
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_leaves_queue_and_keeps_counts():
+    async def main():
+        gate = _gate()
+        await gate.acquire('render')
+        waiter = asyncio.ensure_future(gate.acquire('render'))
+        await asyncio.sleep(0)
+        assert len(gate.queues['render']) == 1
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert not gate.queues['render']
+
+        gate.release('render')
+        assert gate.active['render'] == 0
+        await gate.acquire('render')
+        assert gate.active['render'] == 1
+
+    asyncio.run(main())
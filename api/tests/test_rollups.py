@@ -0,0 +1,70 @@
+import math
+import statistics
+
+import numpy as np
+import pytest
+
+from db.rollups import group_stats, rollup
+
+
+def _reference(keys, values):
+    groups = {}
+    for key, value in zip(zip(*keys), values):
+        groups.setdefault(key, []).append(value)
+    result = {}
+    for key, group in sorted(groups.items()):
+        valid = [value for value in group if not math.isnan(value)]
+        result[key] = {
+            'size': len(group),
+            'count': len(valid),
+            'mean': statistics.fmean(valid) if valid else math.nan,
+            'std': statistics.stdev(valid) if len(valid) > 1 else math.nan,
+            'min': min(valid) if valid else math.nan,
+            'max': max(valid) if valid else math.nan,
+        }
+    return result
+
+
+def test_group_stats_matches_reference():
+    rng = np.random.default_rng(7)
+    first = rng.integers(0, 3, 200)
+    second = rng.integers(0, 5, 200)
+    values = rng.normal(70, 10, 200)
+    values[rng.random(200) < 0.2] = np.nan
+
+    (first_keys, second_keys), sizes, stats = group_stats([first, second], {'x': values})
+    expected = _reference([first.tolist(), second.tolist()], values.tolist())
+
+    assert list(zip(first_keys.tolist(), second_keys.tolist())) == list(expected)
+    for i, reference in enumerate(expected.values()):
+        assert sizes[i] == reference['size']
+        assert stats['x']['count'][i] == reference['count']
+        for name in ('mean', 'std', 'min', 'max'):
+            assert stats['x'][name][i] == pytest.approx(reference[name], nan_ok=True)
+
+
+def test_group_stats_single_and_empty_groups():
+    keys = np.array([2, 1, 1, 3, 3])
+    values = np.array([5.0, np.nan, np.nan, 4.0, 6.0])
+
+    (groups,), sizes, stats = group_stats([keys], {'x': values})
+    assert groups.tolist() == [1, 2, 3]
+    assert sizes.tolist() == [2, 1, 2]
+    assert stats['x']['count'].tolist() == [0, 1, 2]
+    assert np.isnan(stats['x']['mean'][0]) and np.isnan(stats['x']['min'][0])
+    # Для одного значения std не определено
+    assert np.isnan(stats['x']['std'][1])
+    assert stats['x']['std'][2] == pytest.approx(math.sqrt(2))
+
+
+def test_rollup_puts_missing_session_last():
+    columns = {
+        'timestamp': [1, 2, 3, 4],
+        'session': [2, None, 1, 2],
+        'heart_rate': [60, 70, None, 80],
+    }
+    result = rollup(columns, ['heart_rate'], 'session')
+    assert [row['session'] for row in result] == [1, 2, None]
+    assert [row['samples'] for row in result] == [1, 2, 1]
+    assert result[0]['heart_rate'] == {'count': 0, 'mean': None, 'std': None, 'min': None, 'max': None}
+    assert result[1]['heart_rate']['mean'] == pytest.approx(70)
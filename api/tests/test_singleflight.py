@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+import singleflight
+from singleflight import coalesce
+
+
+def _counting(namespace: str, delay: float = 0.01):
+    calls = []
+
+    @coalesce(namespace)
+    async def fetch(individual_number, expedition_id=None, *, scale=1):
+        calls.append((individual_number, expedition_id, scale))
+        await asyncio.sleep(delay)
+        return [individual_number, expedition_id, scale]
+
+    return fetch, calls
+
+
+def test_concurrent_identical_calls_run_once():
+    fetch, calls = _counting('test-identical')
+
+    async def main():
+        return await asyncio.gather(*(fetch('IND-1', 1) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert calls == [('IND-1', 1, 1)]
+    assert all(result is results[0] for result in results)
+    stats = singleflight.snapshot()['namespaces']['test-identical']
+    assert stats == {'calls': 5, 'executed': 1, 'coalesced': 4}
+
+
+def test_key_normalizes_positional_keyword_and_default_arguments():
+    fetch, calls = _counting('test-normalize')
+
+    async def main():
+        await asyncio.gather(
+            fetch('IND-1', None),
+            fetch('IND-1'),
+            fetch(individual_number='IND-1', expedition_id=None, scale=1),
+        )
+
+    asyncio.run(main())
+    assert len(calls) == 1
+
+
+def test_different_arguments_are_not_coalesced():
+    fetch, calls = _counting('test-different')
+
+    async def main():
+        return await asyncio.gather(fetch('IND-1', 1), fetch('IND-1', 2), fetch('IND-2', 1))
+
+    results = asyncio.run(main())
+    assert sorted(calls) == [('IND-1', 1, 1), ('IND-1', 2, 1), ('IND-2', 1, 1)]
+    assert [result[:2] for result in results] == [['IND-1', 1], ['IND-1', 2], ['IND-2', 1]]
+
+
+def test_sequential_calls_are_executed_again():
+    fetch, calls = _counting('test-sequential')
+
+    async def main():
+        await fetch('IND-1', 1)
+        await fetch('IND-1', 1)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+    assert singleflight.snapshot()['in_flight'] == 0
+
+
+def test_exception_reaches_every_waiter():
+    calls = []
+
+    @coalesce('test-error')
+    async def fail(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        raise LookupError(key)
+
+    async def main():
+        return await asyncio.gather(fail('a'), fail('a'), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert calls == ['a']
+    assert all(isinstance(result, LookupError) for result in results)
+
+
+def test_cancelling_first_caller_does_not_cancel_the_others():
+    fetch, calls = _counting('test-cancel', delay=0.05)
+
+    async def main():
+        first = asyncio.ensure_future(fetch('IND-1', 1))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(fetch('IND-1', 1))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == ['IND-1', 1, 1]
+    assert len(calls) == 1
@@ -0,0 +1,133 @@
+import os
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.pool import StaticPool
+
+from db import data_extraction, database, quality, store
+from db.filters import MetricFilter
+
+# Выборка из колонок в памяти (store._window) должна совпадать с SQL из
+# data_extraction._select. SQL выполняется в SQLite в памяти по основной схеме
+SCHEMA = os.path.join(os.path.dirname(__file__), '..', '..', 'init-db', '01-schema.sql')
+
+TABLE = 'cardio_metrics'
+VALUES = ['heart_rate', 'stress_index', 'kaplan_index']
+START = 1_741_800_000_000
+
+
+def _rows():
+    rows = []
+    for i in range(60):
+        rows.append({
+            'individual_number': 'IND-1',
+            'expedition_id': 1,
+            'timestamp': START + i * 7_000,
+            'session': (None, 1, 2, 3)[i % 4],
+            'heart_rate': None if i % 9 == 0 else 60.0 + i % 13,
+            'stress_index': 20.0 + (i * 7) % 11,
+            'kaplan_index': None,
+            'has_artifacts': 1 if i % 10 == 3 else 0,
+            'motion_artifacts': None if i % 6 == 0 else 0,
+            'skin_contact': 30 if i % 8 == 5 else 90,
+        })
+    # Другой участник и экспедиция не попадают в выборку
+    rows.append({**rows[1], 'individual_number': 'IND-2'})
+    rows.append({**rows[2], 'expedition_id': 2})
+    return rows
+
+
+@pytest.fixture(scope='module')
+def engine():
+    engine = create_engine('sqlite://', poolclass=StaticPool)
+    with open(SCHEMA, encoding='utf-8') as f:
+        schema = f.read().replace('BIGSERIAL PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT').replace('BIGSERIAL', 'BIGINT')
+    connection = engine.raw_connection()
+    connection.executescript(schema)
+    connection.close()
+
+    if not database.Base.metadata.tables:
+        database.Base.prepare(autoload_with=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(database.Base.metadata.tables[TABLE]), _rows())
+    return engine
+
+
+@pytest.fixture(autouse=True)
+def sqlite_windows(monkeypatch):
+    # В SQLite нет = ANY(массив): для проверки условия - тот же отбор через IN
+    monkeypatch.setattr(quality, '_in_windows', lambda bucket, starts: bucket.in_([int(start) for start in starts]))
+
+
+def _sql(engine, filters, failed=()):
+    query = data_extraction._select(TABLE, VALUES, 'IND-1', 1, filters, failed)
+    with engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(query)]
+
+
+def _store(engine, filters, failed=()):
+    table = database.Base.metadata.tables[TABLE]
+    columns = list(dict.fromkeys([*store.KEYS, *VALUES, *quality.flag_columns(TABLE)]))
+    query = select(*(table.c[name] for name in columns)).where(
+        table.c.individual_number == 'IND-1', table.c.expedition_id == 1
+    ).order_by(table.c.timestamp, table.c.id)
+    with engine.connect() as conn:
+        rows = conn.execute(query).all()
+
+    entry = store._Entry(TABLE, columns)
+    entry.append(store._arrays(rows, columns))
+    result = store._window(TABLE, entry.view(), entry.integer, VALUES, 1, filters, failed)
+    return list(zip(*(result[name] for name in [*store.KEYS, *VALUES, 'expedition_id'])))
+
+
+def _same(actual, expected):
+    assert len(actual) == len(expected)
+    for a, b in zip(actual, expected):
+        assert a == pytest.approx(b)
+
+
+def _by_bucket(rows):
+    # SQLite ставит NULL первым, PostgreSQL и хранилище - последним (NULLS LAST)
+    return sorted(rows, key=lambda row: (row[1], row[0] is None, row[0] or 0))
+
+
+@pytest.mark.parametrize('filters', [
+    MetricFilter(quality='off'),
+    MetricFilter(quality='drop'),
+    MetricFilter(quality='drop', from_ts=START + 70_000, to_ts=START + 280_000),
+    MetricFilter(quality='off', sessions=(1, 3)),
+    MetricFilter(quality='drop', sessions=(2,), from_ts=START + 14_000),
+])
+def test_rows_match_sql(engine, filters):
+    _same(_store(engine, filters), _sql(engine, filters))
+
+
+@pytest.mark.parametrize('filters', [
+    MetricFilter(quality='off', resolution=60_000),
+    MetricFilter(quality='drop', resolution=60_000),
+    MetricFilter(quality='drop', resolution=3_600_000, sessions=(1, 2)),
+    MetricFilter(quality='off', resolution=30_000, from_ts=START + 100_000),
+])
+def test_buckets_match_sql(engine, filters):
+    actual = _store(engine, filters)
+    _same(actual, _by_bucket(_sql(engine, filters)))
+    # Строки без сеанса - отдельная группа в конце интервала (фильтр сеансов их исключает)
+    assert any(row[0] is None for row in actual) == (not filters.sessions)
+
+
+def test_flags_drop_rows(engine):
+    flagged = {i for i in range(60) if i % 10 == 3 or i % 8 == 5}
+    rows = _store(engine, MetricFilter(quality='drop'))
+    assert [row[1] for row in rows] == [START + i * 7_000 for i in range(60) if i not in flagged]
+
+
+def test_failed_windows_match_sql(engine):
+    window = quality.quality_config.motion_window_ms
+    bucket = START + 70_000 - (START + 70_000) % window
+    failed = [{None: np.array([bucket, bucket + 3 * window])}]
+    for filters in (MetricFilter(quality='drop'), MetricFilter(quality='drop', resolution=60_000)):
+        actual = _store(engine, filters, failed)
+        _same(actual, _by_bucket(_sql(engine, filters, failed)))
+    rows = _store(engine, MetricFilter(quality='drop'), failed)
+    assert not any(bucket <= row[1] < bucket + window for row in rows)
@@ -151,4 +151,13 @@ CREATE TABLE productivity_metrics (
     reverse_fatigue DOUBLE PRECISION,
     relaxation DOUBLE PRECISION,
     concentration DOUBLE PRECISION
-);
\ No newline at end of file
+);
+
+-- Выборки идут по участнику и экспедиции в окне timestamp
+CREATE INDEX idx_cardio_metrics_participant_ts ON cardio_metrics (individual_number, expedition_id, timestamp);
+CREATE INDEX idx_nfb_metrics_participant_ts ON nfb_metrics (individual_number, expedition_id, timestamp);
+CREATE INDEX idx_physiological_metrics_participant_ts ON physiological_metrics (individual_number, expedition_id, timestamp);
+CREATE INDEX idx_productivity_metrics_participant_ts ON productivity_metrics (individual_number, expedition_id, timestamp);
+CREATE INDEX idx_emotional_metrics_participant_ts ON emotional_metrics (individual_number, expedition_id, timestamp);
+CREATE INDEX idx_mems_metrics_participant_ts ON mems_metrics (individual_number, expedition_id, timestamp);
+CREATE INDEX idx_eeg_artifacts_metrics_participant_ts ON eeg_artifacts_metrics (individual_number, expedition_id, timestamp);
@@ -67,10 +67,10 @@ VALUES
 -- emotional_metrics
 INSERT INTO emotional_metrics (expedition_id, individual_number, timestamp, session, attention, relaxation, cognitive_load)
 VALUES
-    (1, 'IND-000002', 1741802000000, 1741802000000, 0.82, 0.65, 0.71),
-    (1, 'IND-000002', 1741805600000, 1741805600000, 0.91, 0.48, 0.85),
-    (1, 'IND-000002', 1741804000000, 1741804000000, 0.62, 0.85, 0.91),
-    (1, 'IND-000002', 1741809300000,  1741809300000, 0.67, 0.79, 0.62);
+    (1, 'IND-000002', 1741802000000, 1, 0.82, 0.65, 0.71),
+    (1, 'IND-000002', 1741805600000, 2, 0.91, 0.48, 0.85),
+    (1, 'IND-000002', 1741804000000, 2, 0.62, 0.85, 0.91),
+    (1, 'IND-000002', 1741809300000, 3, 0.67, 0.79, 0.62);
 
 -- mems_metrics (акселерометр + гироскоп)
 INSERT INTO mems_metrics (expedition_id, individual_number, timestamp, session,
@@ -0,0 +1,54 @@
+-- Вариант схемы с декларативным секционированием высокочастотных таблиц
+-- (eeg_raw_metrics, eeg_proceed_metrics, mems_metrics):
+--   уровень 1 - LIST (expedition_id), секция <таблица>_e<id>;
+--   уровень 2 - RANGE (timestamp, мс), секции по суткам <таблица>_e<id>_d<ГГГГММДД>.
+-- Секции создаются и отсоединяются через python -m db.partitions.
+-- Строки экспедиций без секции попадают в <таблица>_default.
+--
+-- Таблицы и индексы - из основной схемы (docker-compose.partitioned.yml монтирует её
+-- в /init-db), здесь только замена трёх таблиц секционированными с теми же колонками:
+-- первичный ключ включает ключи секционирования, expedition_id - без последовательности,
+-- последовательность id переходит к новой таблице.
+
+\i /init-db/01-schema.sql
+
+ALTER TABLE eeg_proceed_metrics RENAME TO eeg_proceed_metrics_plain;
+ALTER TABLE eeg_proceed_metrics_plain RENAME CONSTRAINT eeg_proceed_metrics_pkey TO eeg_proceed_metrics_plain_pkey;
+CREATE TABLE eeg_proceed_metrics (
+    LIKE eeg_proceed_metrics_plain INCLUDING DEFAULTS,
+    PRIMARY KEY (id, expedition_id, timestamp)
+) PARTITION BY LIST (expedition_id);
+ALTER TABLE eeg_proceed_metrics ALTER COLUMN expedition_id DROP DEFAULT;
+ALTER SEQUENCE eeg_proceed_metrics_id_seq OWNED BY eeg_proceed_metrics.id;
+DROP TABLE eeg_proceed_metrics_plain;
+
+CREATE TABLE eeg_proceed_metrics_default PARTITION OF eeg_proceed_metrics DEFAULT;
+
+ALTER TABLE eeg_raw_metrics RENAME TO eeg_raw_metrics_plain;
+ALTER TABLE eeg_raw_metrics_plain RENAME CONSTRAINT eeg_raw_metrics_pkey TO eeg_raw_metrics_plain_pkey;
+CREATE TABLE eeg_raw_metrics (
+    LIKE eeg_raw_metrics_plain INCLUDING DEFAULTS,
+    PRIMARY KEY (id, expedition_id, timestamp)
+) PARTITION BY LIST (expedition_id);
+ALTER TABLE eeg_raw_metrics ALTER COLUMN expedition_id DROP DEFAULT;
+ALTER SEQUENCE eeg_raw_metrics_id_seq OWNED BY eeg_raw_metrics.id;
+DROP TABLE eeg_raw_metrics_plain;
+
+CREATE TABLE eeg_raw_metrics_default PARTITION OF eeg_raw_metrics DEFAULT;
+
+-- Индекс основной схемы удаляется вместе с прежней таблицей
+ALTER TABLE mems_metrics RENAME TO mems_metrics_plain;
+ALTER TABLE mems_metrics_plain RENAME CONSTRAINT mems_metrics_pkey TO mems_metrics_plain_pkey;
+CREATE TABLE mems_metrics (
+    LIKE mems_metrics_plain INCLUDING DEFAULTS,
+    PRIMARY KEY (id, expedition_id, timestamp)
+) PARTITION BY LIST (expedition_id);
+ALTER TABLE mems_metrics ALTER COLUMN expedition_id DROP DEFAULT;
+ALTER SEQUENCE mems_metrics_id_seq OWNED BY mems_metrics.id;
+DROP TABLE mems_metrics_plain;
+
+CREATE TABLE mems_metrics_default PARTITION OF mems_metrics DEFAULT;
+
+CREATE INDEX idx_eeg_raw_metrics_participant_ts ON eeg_raw_metrics (individual_number, expedition_id, timestamp);
+CREATE INDEX idx_eeg_proceed_metrics_participant_ts ON eeg_proceed_metrics (individual_number, expedition_id, timestamp);
+CREATE INDEX idx_mems_metrics_participant_ts ON mems_metrics (individual_number, expedition_id, timestamp);